@@ -1,9 +1,14 @@
 from PatitoListener import PatitoListener
 from PatitoParser import PatitoParser
 from VirtualMemory import VirtualMemory
+from bytecode import valor_constante, INICIALIZACION_VERIFICADA
+from optimizador import evaluar_operacion, simplificar_identidad, texto_constante, optimizar_flujo
+from emisor import EmisorPrograma
+from opcodes import SUFIJOS_TIPO
+from inicializacion import AnalisisInicializacion
 
 class PatitoCustomListener(PatitoListener):
-    def __init__(self):
+    def __init__(self, optimizar=False, salida=None):
         # Inicializar el directorio de funciones y tablas de variables
         self.directorio_funciones = {}
         self.tabla_variables_global = {}
@@ -11,11 +16,21 @@ class PatitoCustomListener(PatitoListener):
         self.funcion_actual = 'global'
         self.errores = []
 
+        # Análisis de asignación definida; sus advertencias no impiden compilar. 'banderas' se
+        # guarda en el programa compilado (ver bytecode.py)
+        self.inicializacion = AnalisisInicializacion()
+        self.advertencias = self.inicializacion.advertencias
+        self.banderas = 0
+
         # Crear instancia de VirtualMemory
         self.virtual_memory = VirtualMemory()
 
-        # Tabla de constantes
+        # Tabla de constantes y valor de cada dirección constante
         self.constant_table = {}
+        self.valores_constantes = {}
+
+        # Plegado de constantes y simplificación algebraica al generar operaciones
+        self.optimizar = optimizar
 
         # Pila para manejar scopes
         self.pila_scopes = ['global']
@@ -31,8 +46,17 @@ class PatitoCustomListener(PatitoListener):
         # Inicializar contador de temporales
         self.contador_temporales = 0
 
-        # Lista para almacenar los cuádruplos
-        self.cuadruplos = [('GOTO', None, None, None)]  # GOTO inicial
+        # Lista para almacenar los cuádruplos y la línea del código fuente de cada uno (0 si no
+        # corresponde a ninguna). Con un archivo de 'salida' se escriben conforme se generan
+        # (ver emisor.py); no se puede optimizar el flujo porque no se conserva el programa completo
+        if salida is not None:
+            self.cuadruplos = EmisorPrograma(salida, self.directorio_funciones)
+            self.lineas_cuadruplos = self.cuadruplos.lineas
+        else:
+            self.cuadruplos = []
+            self.lineas_cuadruplos = []
+        self.cuadruplos.append(('GOTO', None, None, None))  # GOTO inicial
+        self.linea_actual = 0
 
         # Pila para manejar saltos
         self.pila_saltos = []
@@ -42,6 +66,20 @@ class PatitoCustomListener(PatitoListener):
         self.lista_param_impresion = []
         self.pila_parametros = []
 
+    # Registrar la línea de los cuádruplos generados. Los cuádruplos generados al entrar a
+    # una regla toman la línea de esa regla; los generados al salir, la línea donde inicia.
+    def enterEveryRule(self, ctx):
+        # Los cuádruplos pendientes son de la regla anterior (el GOTO inicial, de 'programa')
+        self.registrar_lineas(self.linea_actual or ctx.start.line)
+        self.linea_actual = ctx.start.line
+
+    def exitEveryRule(self, ctx):
+        self.registrar_lineas(ctx.start.line)
+
+    def registrar_lineas(self, linea):
+        while len(self.lineas_cuadruplos) < len(self.cuadruplos):
+            self.lineas_cuadruplos.append(linea)
+
     # Entrar a la regla de programa
     def enterPrograma(self, ctx: PatitoParser.ProgramaContext):
         # Iniciar el directorio de funciones con el scope global
@@ -49,16 +87,13 @@ class PatitoCustomListener(PatitoListener):
             'tipo_retorno': 'nula',
             'parametros': [],
             'tabla_variables': self.tabla_variables_global,
-            'cuadruplos_inicio': None  # Se asignará durante la generación de código
+            'cuadruplos_inicio': None,  # Se asignará durante la generación de código
+            'tamano_marco': None  # Se asignará al terminar el programa
         }
 
     def exitPrograma(self, ctx: PatitoParser.ProgramaContext):
-        # Identificar el índice de MAIN_START para actualizar el GOTO inicial
-        indice_inicio_programa = None
-        for idx, cuad in enumerate(self.cuadruplos):
-            if cuad[0] == 'MAIN_START':
-                indice_inicio_programa = idx
-                break
+        # El GOTO inicial salta al MAIN_START registrado al entrar a 'inicio'
+        indice_inicio_programa = self.directorio_funciones['global']['cuadruplos_inicio']
         if indice_inicio_programa is not None:
             self.cuadruplos[0] = ('GOTO', None, None, indice_inicio_programa)
         else:
@@ -67,9 +102,23 @@ class PatitoCustomListener(PatitoListener):
         # Agregar el cuádruplo END al final del programa
         cuadruplo = ('END', None, None, None)
         self.cuadruplos.append(cuadruplo)
+        self.registrar_lineas(ctx.stop.line)
+
+        # Registrar el tamaño del marco del programa principal (sus temporales)
+        self.directorio_funciones['global']['tamano_marco'] = self.virtual_memory.get_frame_size()
+
+        # Si toda lectura de variable está inicializada, la máquina virtual no lo revisa al ejecutar
+        if self.inicializacion.verificado():
+            self.banderas |= INICIALIZACION_VERIFICADA
+
+        # Optimizar saltos y eliminar código inalcanzable sobre el programa completo
+        if self.optimizar and not self.errores:
+            self.cuadruplos, self.lineas_cuadruplos = optimizar_flujo(
+                self.cuadruplos, self.directorio_funciones, self.valores_constantes, self.lineas_cuadruplos)
 
     def enterInicio(self, ctx: PatitoParser.InicioContext):
         # Marcar el inicio del programa principal
+        self.directorio_funciones['global']['cuadruplos_inicio'] = len(self.cuadruplos)
         self.cuadruplos.append(('MAIN_START', None, None, None))
 
     # Entrar a la declaración de variables
@@ -118,13 +167,21 @@ class PatitoCustomListener(PatitoListener):
                 'tipo_retorno': tipo_retorno,
                 'parametros': parametros,
                 'tabla_variables': self.tabla_variables_actual,
-                'cuadruplos_inicio': len(self.cuadruplos)
+                'cuadruplos_inicio': len(self.cuadruplos),
+                'tamano_marco': None  # Se asignará al salir de la función
             }
             self.pila_scopes.append(nombre_funcion)
             self.funcion_actual = nombre_funcion
+        # Los parámetros llegan inicializados por PARAM
+        self.inicializacion.entrar_funcion(nombre_funcion, [
+            variable['direccion'] for variable in self.tabla_variables_actual.values()])
 
     def exitFuncs(self, ctx: PatitoParser.FuncsContext):
-        self.pila_scopes.pop()
+        self.inicializacion.salir_funcion()
+        nombre_funcion = self.pila_scopes.pop()
+        # Registrar cuántas direcciones locales y temporales necesita el marco de la función
+        if nombre_funcion in self.directorio_funciones:
+            self.directorio_funciones[nombre_funcion]['tamano_marco'] = self.virtual_memory.get_frame_size()
         self.funcion_actual = self.pila_scopes[-1]
         self.tabla_variables_actual = (
             self.tabla_variables_global if self.funcion_actual == 'global' else
@@ -161,43 +218,50 @@ class PatitoCustomListener(PatitoListener):
                 self.errores.append(
                     f"Error: Número incorrecto de parámetros en la llamada a la función '{nombre_funcion}'.")
                 return
-            # Generar cuádruplo ERA
-            cuadruplo = ('ERA', nombre_funcion, None, None)
-            self.cuadruplos.append(cuadruplo)
-            # Generar cuádruplos PARAM
+            # Verificar los argumentos; un entero pasado a un parámetro flotante se convierte antes
+            # del ERA para que ERA, PARAM y GOSUB queden seguidos
+            argumentos = []
             for i in range(num_params):
                 arg_value, arg_type = self.pila_parametros[i]
-                param_name = parametros[i]['nombre']
                 param_type = parametros[i]['tipo']
                 if arg_type != param_type and not (arg_type == 'entero' and param_type == 'flotante'):
                     self.errores.append(
                         f"Error: Tipo de parámetro incorrecto en la llamada a la función '{nombre_funcion}'. Esperado '{param_type}', recibido '{arg_type}'.")
                     return
+                argumentos.append(self.convertir(arg_value, arg_type, param_type))
+            # Generar cuádruplo ERA
+            cuadruplo = ('ERA', nombre_funcion, None, None)
+            self.cuadruplos.append(cuadruplo)
+            # Generar cuádruplos PARAM
+            for i, arg_value in enumerate(argumentos):
                 # Obtener la dirección de la variable del parámetro en la función
-                param_address = funcion_info['tabla_variables'][param_name]['direccion']
+                param_address = funcion_info['tabla_variables'][parametros[i]['nombre']]['direccion']
                 # Generar cuádruplo PARAM
                 cuadruplo = ('PARAM', arg_value, None, param_address)
                 self.cuadruplos.append(cuadruplo)
+                self.liberar_temporal(arg_value)
             # Generar cuádruplo GOSUB apuntando al inicio de la función
             cuadruplo = ('GOSUB', nombre_funcion, None, funcion_info['cuadruplos_inicio'])
             self.cuadruplos.append(cuadruplo)
+            self.inicializacion.llamar(nombre_funcion, ctx.start.line)
             # Limpiar la pila de parámetros
             self.pila_parametros = []
         else:
             self.errores.append(f"Error: Función '{nombre_funcion}' no definida.")
 
     def exitE_l(self, ctx: PatitoParser.E_lContext):
-        expresiones = ctx.expresion()
-        if expresiones:
-            parametros_temporales = []
-            for _ in expresiones:
-                resultado = self.pila_operandos.pop()
-                tipo = self.pila_tipos.pop()
-                parametros_temporales.insert(0, (resultado, tipo))
-            self.pila_parametros.extend(parametros_temporales)
+        cantidad = len(ctx.expresion())
+        if cantidad:
+            # Los argumentos están en orden en el tope de las pilas
+            self.pila_parametros.extend(zip(self.pila_operandos[-cantidad:], self.pila_tipos[-cantidad:]))
+            del self.pila_operandos[-cantidad:]
+            del self.pila_tipos[-cantidad:]
 
     # Entrar a una variable usada (por ejemplo, en expresiones)
     def enterFactor(self, ctx: PatitoParser.FactorContext):
+        if ctx.expresion():
+            # Fondo falso: los operadores pendientes fuera del paréntesis no se reducen dentro
+            self.pila_operadores.append('(')
         if ctx.ID():
             nombre_var = ctx.ID().getText()
             scope_actual = self.pila_scopes[-1]
@@ -220,19 +284,25 @@ class PatitoCustomListener(PatitoListener):
             nombre_var = ctx.ID().getText()
             tipo, address = self.obtener_tipo_direccion_variable(nombre_var)
             if tipo:
+                self.inicializacion.leer(address, nombre_var, ctx.start.line)
                 self.pila_operandos.append(address)
                 self.pila_tipos.append(tipo)
             else:
                 self.errores.append(f"Error: Variable '{nombre_var}' no declarada.")
         elif ctx.expresion():
-            # Ya se manejó la expresión interna
-            pass
+            # Ya se manejó la expresión interna; se quita el fondo falso
+            self.pila_operadores.pop()
 
     def enterOp(self, ctx: PatitoParser.OpContext):
+        # Asociatividad izquierda: la suma o resta pendiente se genera antes de la siguiente
+        while self.pila_operadores and self.pila_operadores[-1] in ['+', '-']:
+            self.generar_operacion_pendiente()
         operador = ctx.getText()
         self.pila_operadores.append(operador)
 
     def enterOf(self, ctx: PatitoParser.OfContext):
+        while self.pila_operadores and self.pila_operadores[-1] in ['*', '/']:
+            self.generar_operacion_pendiente()
         operador = ctx.getText()
         self.pila_operadores.append(operador)
 
@@ -242,62 +312,31 @@ class PatitoCustomListener(PatitoListener):
 
     def exitTermino(self, ctx: PatitoParser.TerminoContext):
         while self.pila_operadores and self.pila_operadores[-1] in ['*', '/']:
-            operador = self.pila_operadores.pop()
-            derecha = self.pila_operandos.pop()
-            tipo_derecha = self.pila_tipos.pop()
-            izquierda = self.pila_operandos.pop()
-            tipo_izquierda = self.pila_tipos.pop()
-            resultado_tipo = self.cubo_semantico[tipo_izquierda][operador][tipo_derecha]
-            if resultado_tipo:
-                # Asignar dirección virtual al temporal
-                temporal_address = self.virtual_memory.get_address('temporal', resultado_tipo)
-                self.pila_operandos.append(temporal_address)
-                self.pila_tipos.append(resultado_tipo)
-                cuadruplo = (operador, izquierda, derecha, temporal_address)
-                self.cuadruplos.append(cuadruplo)
-            else:
-                self.errores.append(
-                    f"Error semántico: Operación inválida entre '{tipo_izquierda}' y '{tipo_derecha}' con operador '{operador}'.")
+            self.generar_operacion_pendiente()
 
     def exitExp(self, ctx: PatitoParser.ExpContext):
         while self.pila_operadores and self.pila_operadores[-1] in ['+', '-']:
-            operador = self.pila_operadores.pop()
-            derecha = self.pila_operandos.pop()
-            tipo_derecha = self.pila_tipos.pop()
-            izquierda = self.pila_operandos.pop()
-            tipo_izquierda = self.pila_tipos.pop()
-            resultado_tipo = self.cubo_semantico[tipo_izquierda][operador][tipo_derecha]
-            if resultado_tipo:
-                # Asignar dirección virtual al temporal
-                temporal_address = self.virtual_memory.get_address('temporal', resultado_tipo)
-                self.pila_operandos.append(temporal_address)
-                self.pila_tipos.append(resultado_tipo)
-                cuadruplo = (operador, izquierda, derecha, temporal_address)
-                self.cuadruplos.append(cuadruplo)
-            else:
-                self.errores.append(
-                    f"Error semántico: Operación inválida entre '{tipo_izquierda}' y '{tipo_derecha}' con operador '{operador}'.")
+            self.generar_operacion_pendiente()
+
+    def generar_operacion_pendiente(self):
+        # Genera el cuádruplo del operador en el tope de la pila con sus dos operandos
+        operador = self.pila_operadores.pop()
+        derecha = self.pila_operandos.pop()
+        tipo_derecha = self.pila_tipos.pop()
+        izquierda = self.pila_operandos.pop()
+        tipo_izquierda = self.pila_tipos.pop()
+        resultado_tipo = self.cubo_semantico[tipo_izquierda][operador][tipo_derecha]
+        if resultado_tipo:
+            self.generar_operacion(operador, izquierda, tipo_izquierda, derecha, tipo_derecha, resultado_tipo)
+        else:
+            self.errores.append(
+                f"Error semántico: Operación inválida entre '{tipo_izquierda}' y '{tipo_derecha}' con operador '{operador}'.")
 
     # Métodos para manejar condicionales
     def exitExpresion(self, ctx: PatitoParser.ExpresionContext):
         # Manejar expresiones relacionales
         if ctx.bo():
-            operador = self.pila_operadores.pop()
-            derecha = self.pila_operandos.pop()
-            tipo_derecha = self.pila_tipos.pop()
-            izquierda = self.pila_operandos.pop()
-            tipo_izquierda = self.pila_tipos.pop()
-            resultado_tipo = self.cubo_semantico[tipo_izquierda][operador][tipo_derecha]
-            if resultado_tipo:
-                # Asignar dirección virtual al temporal
-                temporal_address = self.virtual_memory.get_address('temporal', resultado_tipo)
-                self.pila_operandos.append(temporal_address)
-                self.pila_tipos.append(resultado_tipo)
-                cuadruplo = (operador, izquierda, derecha, temporal_address)
-                self.cuadruplos.append(cuadruplo)
-            else:
-                self.errores.append(
-                    f"Error semántico: Operación inválida entre '{tipo_izquierda}' y '{tipo_derecha}' con operador '{operador}'.")
+            self.generar_operacion_pendiente()
 
         # Verificar si la expresión es parte de una condición o ciclo
         if self.es_expresion_de_condicion(ctx):
@@ -309,6 +348,7 @@ class PatitoCustomListener(PatitoListener):
                 cuadruplo = ('GOTOF', resultado, None, None)
                 self.cuadruplos.append(cuadruplo)
                 self.pila_saltos.append(len(self.cuadruplos) - 1)
+                self.liberar_temporal(resultado)
         elif self.es_expresion_de_ciclo(ctx):
             resultado = self.pila_operandos.pop()
             tipo_resultado = self.pila_tipos.pop()
@@ -318,6 +358,7 @@ class PatitoCustomListener(PatitoListener):
                 cuadruplo = ('GOTOF', resultado, None, None)
                 self.cuadruplos.append(cuadruplo)
                 self.pila_saltos.append(len(self.cuadruplos) - 1)
+                self.liberar_temporal(resultado)
 
         # Debugging statements
         # print(f"Current pila_operandos: {self.pila_operandos}")
@@ -337,6 +378,8 @@ class PatitoCustomListener(PatitoListener):
             if resultado_tipo:
                 cuadruplo = ('=', valor, None, address_variable)
                 self.cuadruplos.append(cuadruplo)
+                self.liberar_temporal(valor)
+                self.inicializacion.asignar(address_variable)
             else:
                 self.errores.append(
                     f"Error semántico: No se puede asignar un valor de tipo '{tipo_valor}' a la variable '{variable}' de tipo '{tipo_variable}'.")
@@ -345,9 +388,10 @@ class PatitoCustomListener(PatitoListener):
 
     # Métodos para manejar condicionales
     def enterCondicion(self, ctx: PatitoParser.CondicionContext):
-        print("Entering a condition")
+        self.inicializacion.entrar_condicion()
 
     def exitCondicion(self, ctx: PatitoParser.CondicionContext):
+        self.inicializacion.salir_condicion()
         if self.pila_saltos:
             end = self.pila_saltos.pop()
             self.cuadruplos[end] = (self.cuadruplos[end][0], self.cuadruplos[end][1], None, len(self.cuadruplos))
@@ -366,6 +410,7 @@ class PatitoCustomListener(PatitoListener):
 
         # Agregar el índice del GOTO a la pila de saltos para completarlo al final del 'sino'
         self.pila_saltos.append(goto_index)
+        self.inicializacion.entrar_sino()
 
     def exitE_c(self, ctx: PatitoParser.E_cContext):
         # No es necesario hacer nada aquí
@@ -374,10 +419,12 @@ class PatitoCustomListener(PatitoListener):
     # Métodos para manejar ciclos
     def enterCiclo(self, ctx: PatitoParser.CicloContext):
         self.pila_saltos.append(len(self.cuadruplos))
+        self.inicializacion.entrar_ciclo()
 
     def exitCiclo(self, ctx: PatitoParser.CicloContext):
         falso = self.pila_saltos.pop()
         retorno = self.pila_saltos.pop()
+        self.inicializacion.salir_ciclo()
         cuadruplo = ('GOTO', None, None, retorno)
         self.cuadruplos.append(cuadruplo)
         self.cuadruplos[falso] = (self.cuadruplos[falso][0], self.cuadruplos[falso][1], None, len(self.cuadruplos))
@@ -387,10 +434,11 @@ class PatitoCustomListener(PatitoListener):
         self.lista_param_impresion = []
 
     def exitImprime(self, ctx: PatitoParser.ImprimeContext):
-        # Generar cuádruplos PRINT en orden
-        for parametro in self.lista_param_impresion:
+        # Generar cuádruplos PRINT en orden; los parámetros anidados salen primero, del último al primero
+        for parametro in reversed(self.lista_param_impresion):
             cuadruplo = ('PRINT', parametro, None, None)
             self.cuadruplos.append(cuadruplo)
+            self.liberar_temporal(parametro)
         # Limpiar la lista
         self.lista_param_impresion = []
 
@@ -398,12 +446,12 @@ class PatitoCustomListener(PatitoListener):
         if ctx.expresion():
             resultado = self.pila_operandos.pop()
             tipo = self.pila_tipos.pop()
-            self.lista_param_impresion.insert(0, resultado)  # Insertar al inicio para mantener el orden
+            self.lista_param_impresion.append(resultado)
         elif ctx.LETRERO():
             valor = ctx.LETRERO().getText()
             tipo = 'cadena'
             address = self.get_constant_address(valor, tipo)
-            self.lista_param_impresion.insert(0, address)
+            self.lista_param_impresion.append(address)
 
     def obtener_tipo_variable(self, nombre_var):
         if nombre_var in self.tabla_variables_actual:
@@ -414,19 +462,10 @@ class PatitoCustomListener(PatitoListener):
             return None
 
     def obtener_tipo_direccion_variable(self, nombre_var):
-        if nombre_var in self.tabla_variables_actual:
-            var_info = self.tabla_variables_actual[nombre_var]
-            print(
-                f"Variable '{nombre_var}' encontrada en ámbito actual: Tipo={var_info['tipo']}, Dirección={var_info['direccion']}")
-            return var_info['tipo'], var_info['direccion']
-        elif nombre_var in self.tabla_variables_global:
-            var_info = self.tabla_variables_global[nombre_var]
-            print(
-                f"Variable '{nombre_var}' encontrada en ámbito global: Tipo={var_info['tipo']}, Dirección={var_info['direccion']}")
-            return var_info['tipo'], var_info['direccion']
-        else:
-            print(f"Variable '{nombre_var}' no declarada.")
+        var_info = self.tabla_variables_actual.get(nombre_var) or self.tabla_variables_global.get(nombre_var)
+        if var_info is None:
             return None, None
+        return var_info['tipo'], var_info['direccion']
 
     def inicializar_cubo_semantico(self):
         tipos = ['entero', 'flotante']
@@ -456,26 +495,78 @@ class PatitoCustomListener(PatitoListener):
                     cubo[tipo1][operador][tipo2] = resultado
         return cubo
 
+    # La expresión de una condición o de un ciclo es hija directa de la regla; basta revisar el padre
     def es_expresion_de_condicion(self, ctx):
-        parent_ctx = ctx.parentCtx
-        while parent_ctx:
-            if isinstance(parent_ctx, PatitoParser.CondicionContext) and ctx == parent_ctx.expresion():
-                return True
-            parent_ctx = parent_ctx.parentCtx
-        return False
+        return isinstance(ctx.parentCtx, PatitoParser.CondicionContext)
 
     def es_expresion_de_ciclo(self, ctx):
-        parent_ctx = ctx.parentCtx
-        while parent_ctx:
-            if isinstance(parent_ctx, PatitoParser.CicloContext) and ctx == parent_ctx.expresion():
-                return True
-            parent_ctx = parent_ctx.parentCtx
-        return False
+        return isinstance(ctx.parentCtx, PatitoParser.CicloContext)
+
+    def generar_operacion(self, operador, izquierda, tipo_izquierda, derecha, tipo_derecha, resultado_tipo):
+        # Con optimización, una operación plegada no genera cuádruplo ni temporal
+        if self.optimizar:
+            direccion = self.plegar_operacion(operador, izquierda, tipo_izquierda, derecha, tipo_derecha, resultado_tipo)
+            if direccion is not None:
+                for operando in (izquierda, derecha):
+                    if operando != direccion:
+                        self.liberar_temporal(operando)
+                self.pila_operandos.append(direccion)
+                self.pila_tipos.append(resultado_tipo)
+                return
+        # La operación se genera para el tipo de sus operandos; un entero junto a un flotante
+        # se convierte antes a flotante
+        tipo_operacion = 'flotante' if 'flotante' in (tipo_izquierda, tipo_derecha) else 'entero'
+        izquierda = self.convertir(izquierda, tipo_izquierda, tipo_operacion)
+        derecha = self.convertir(derecha, tipo_derecha, tipo_operacion)
+        # Los operandos temporales mueren en esta operación; el resultado puede reutilizarlos
+        self.liberar_temporal(izquierda)
+        self.liberar_temporal(derecha)
+        # Asignar dirección virtual al temporal
+        temporal_address = self.virtual_memory.get_address('temporal', resultado_tipo)
+        self.pila_operandos.append(temporal_address)
+        self.pila_tipos.append(resultado_tipo)
+        cuadruplo = (operador + SUFIJOS_TIPO[tipo_operacion], izquierda, derecha, temporal_address)
+        self.cuadruplos.append(cuadruplo)
+
+    def convertir(self, direccion, tipo, tipo_destino):
+        # Regresa la dirección del valor convertido a 'tipo_destino' (solo de entero a flotante);
+        # las constantes se convierten al compilar y los demás valores con un cuádruplo A_FLOTANTE
+        if tipo == tipo_destino:
+            return direccion
+        if direccion in self.valores_constantes:
+            valor = float(self.valores_constantes[direccion])
+            return self.get_constant_address(texto_constante(valor, tipo_destino), tipo_destino)
+        self.liberar_temporal(direccion)
+        temporal = self.virtual_memory.get_address('temporal', tipo_destino)
+        self.cuadruplos.append(('A_FLOTANTE', direccion, None, temporal))
+        return temporal
+
+    def liberar_temporal(self, direccion):
+        # Cada temporal se lee una sola vez: al consumirlo su dirección queda libre
+        self.virtual_memory.release_temporal(direccion)
+
+    def plegar_operacion(self, operador, izquierda, tipo_izquierda, derecha, tipo_derecha, resultado_tipo):
+        # Regresa la dirección que sustituye al resultado de la operación, o None si no se puede plegar
+        if izquierda in self.valores_constantes and derecha in self.valores_constantes:
+            valor = evaluar_operacion(operador, self.valores_constantes[izquierda],
+                                      self.valores_constantes[derecha], resultado_tipo)
+            if valor is not None:
+                return self.get_constant_address(texto_constante(valor, resultado_tipo), resultado_tipo)
+        simplificacion = simplificar_identidad(operador, izquierda, tipo_izquierda, derecha, tipo_derecha,
+                                               resultado_tipo, self.valores_constantes)
+        if simplificacion is None:
+            return None
+        clase, valor = simplificacion
+        if clase == 'operando':
+            return valor
+        return self.get_constant_address(texto_constante(valor, resultado_tipo), resultado_tipo)
 
     def get_constant_address(self, valor, tipo):
         if valor not in self.constant_table:
             address = self.virtual_memory.get_address('constante', tipo)
             self.constant_table[valor] = {'tipo': tipo, 'direccion': address}
+            if tipo != 'cadena':
+                self.valores_constantes[address] = valor_constante(valor, tipo)
         else:
             address = self.constant_table[valor]['direccion']
         return address
\ No newline at end of file
@@ -1,3 +1,6 @@
+# Tamaño de cada segmento (alcance, tipo); todos los segmentos inician en un múltiplo de este valor
+SEGMENT_SIZE = 1000
+
 class VirtualMemory:
     def __init__(self):
         # Definir los rangos de direcciones para cada segmento y tipo
@@ -27,17 +30,38 @@ class VirtualMemory:
                 'cadena': {'start': 16000, 'end': 16999, 'current': 16000},
             }
         }
+        # Temporales liberados que se pueden reutilizar, por tipo
+        self.free_temporals = {var_type: [] for var_type in self.segments['temporal']}
 
     def get_address(self, segment, var_type):
+        if segment == 'temporal' and self.free_temporals[var_type]:
+            return self.free_temporals[var_type].pop()
         if self.segments[segment][var_type]['current'] > self.segments[segment][var_type]['end']:
             raise Exception(f"Memory overflow in segment {segment} for type {var_type}")
         address = self.segments[segment][var_type]['current']
         self.segments[segment][var_type]['current'] += 1
         return address
 
+    def release_temporal(self, address):
+        # Devuelve un temporal cuyo valor ya no se usa; las demás direcciones se ignoran
+        for var_type, info in self.segments['temporal'].items():
+            if info['start'] <= address < info['current']:
+                if address not in self.free_temporals[var_type]:
+                    self.free_temporals[var_type].append(address)
+                return
+
+    def get_usage(self, segment):
+        # Cantidad de direcciones asignadas en el segmento para cada tipo
+        return {var_type: info['current'] - info['start'] for var_type, info in self.segments[segment].items()}
+
+    def get_frame_size(self):
+        # Tamaño del marco de activación de la función actual (locales y temporales por tipo)
+        return {'local': self.get_usage('local'), 'temporal': self.get_usage('temporal')}
+
     def reset_local_memory(self):
         # Reinicia las direcciones de variables locales y temporales
         for var_type in self.segments['local']:
             self.segments['local'][var_type]['current'] = self.segments['local'][var_type]['start']
         for var_type in self.segments['temporal']:
             self.segments['temporal'][var_type]['current'] = self.segments['temporal'][var_type]['start']
+            self.free_temporals[var_type] = []
@@ -0,0 +1,377 @@
+import os
+import gc
+import sys
+import glob
+import json
+import time
+import argparse
+import platform
+import contextlib
+import tracemalloc
+
+import bytecode
+from compilador import analisis_lexico, analisis_sintactico, analisis_semantico, generar_programa, ErrorCompilacion
+from virtual_machine import preparar_ejecucion, ejecutar, requiere_verificacion, ErrorEjecucion
+from superinstrucciones import ContadorSecuencias
+
+# Suite de benchmarks del compilador y la máquina virtual.
+#
+# Cada benchmark se compila y ejecuta midiendo por separado cada fase:
+#
+#   lexico       tokens del código fuente
+#   sintactico   árbol sintáctico
+#   semantico    recorrido del listener (validación y generación de cuádruplos)
+#   emision      Programa y su formato binario
+#   carga        lectura del formato binario y preparación de la memoria
+#   ejecucion    ejecución de las instrucciones
+#
+# Los resultados se escriben en JSON y se comparan con una base guardada:
+#
+#   python benchmark.py --salida base.json          guarda la base
+#   python benchmark.py --base base.json            marca las regresiones
+#
+# Los programas son los .patito del directorio 'benchmarks' y dos fuentes grandes generadas.
+# Con --escalamiento se compilan programas generados de tamaño creciente (hasta 100 000
+# sentencias) para comprobar que cada fase crece linealmente con el tamaño del programa.
+
+VERSION_RESULTADOS = 1
+DIRECTORIO_BENCHMARKS = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'benchmarks')
+FASES = ('lexico', 'sintactico', 'semantico', 'emision', 'carga', 'ejecucion')
+TAMANO_GRANDE = 2000
+TAMANOS_ESCALAMIENTO = (12500, 25000, 50000, 100000)
+
+# Diferencia mínima (en segundos) para considerar una regresión de tiempo; evita marcar ruido
+# en las fases que tardan menos de un milisegundo
+DIFERENCIA_MINIMA = 0.001
+
+
+def generar_fuente_principal(sentencias):
+    """Programa con un 'inicio' de 'sentencias' asignaciones y condiciones en línea recta."""
+    lineas = ["programa grande_principal;", "vars", "    a, b, c, d: entero;", "    x, y: flotante;", "inicio{",
+              "    a = 1;", "    b = 2;", "    c = 3;", "    d = 0;", "    x = 0.5;", "    y = 0.0;"]
+    for indice in range(sentencias):
+        constante = indice % 50
+        if indice % 5 == 4:
+            lineas.append(f"    si (a > {constante}) {{ d = d + 1; }} sino {{ d = d - 1; }};")
+        elif indice % 5 == 3:
+            lineas.append(f"    y = y + x * {constante}.5;")
+        else:
+            lineas.append(f"    a = (b + {constante}) * c - a / 2;")
+    lineas += ["    escribe(d);", "}fin"]
+    return "\n".join(lineas) + "\n"
+
+
+def generar_fuente_funciones(funciones):
+    """Programa con 'funciones' funciones nula con parámetros y variables locales, llamadas en orden."""
+    lineas = ["programa grande_funciones;", "vars", "    total: entero;"]
+    for indice in range(funciones):
+        lineas += [f"nula f{indice}(p: entero, q: entero) {{",
+                   "    vars",
+                   "        s, t: entero;",
+                   "    {",
+                   f"        s = p + q * {indice % 50};",
+                   "        t = s - p;",
+                   "        total = total + s - t;",
+                   "    }",
+                   "};"]
+    lineas += ["inicio{", "    total = 0;"]
+    lineas += [f"    f{indice}({indice % 50}, total);" for indice in range(funciones)]
+    lineas += ["    escribe(total);", "}fin"]
+    return "\n".join(lineas) + "\n"
+
+
+def generar_fuente_escalamiento(sentencias):
+    """
+    Programa de aproximadamente 'sentencias' sentencias que combina asignaciones, impresiones
+    con muchos argumentos, llamadas con muchos parámetros y condiciones y ciclos anidados.
+    """
+    lineas = ["programa escalamiento;", "vars", "    a, b, c, d: entero;", "    x: flotante;"]
+    for indice in range(10):
+        lineas += [f"nula f{indice}(p: entero, q: entero, r: entero, s: entero, t: entero, u: entero) {{",
+                   "    {",
+                   "        a = p + q - r * s + t - u;",
+                   "    }",
+                   "};"]
+    lineas += ["inicio{", "    a = 1;", "    b = 2;", "    c = 0;", "    d = 0;", "    x = 0.5;"]
+    cantidad = 0
+    while cantidad < sentencias:
+        constante = cantidad % 50
+        lineas += [
+            f"    a = (b + {constante}) * c - a / 2 + d;",
+            f'    escribe("a", "b", "c", "d", "e", "f", "g", "h", a + b * {constante});',
+            f"    f{cantidad % 10}(a, b, c, d, a + {constante}, b * 2);",
+            f"    si (a > b) {{ mientras (c < 0) haz {{ si (d == {constante}) {{ x = x + 1.5; }}; }}; }};",
+            f"    b = b - {constante};",
+        ]
+        cantidad += 7
+    lineas += ["    escribe(a);", "}fin"]
+    return "\n".join(lineas) + "\n"
+
+
+def cargar_benchmarks(nombres=None, tamano=TAMANO_GRANDE):
+    """Regresa un diccionario nombre -> código fuente, filtrado por 'nombres' si se dan."""
+    benchmarks = {}
+    for ruta in sorted(glob.glob(os.path.join(DIRECTORIO_BENCHMARKS, '*.patito'))):
+        with open(ruta, 'r') as archivo:
+            benchmarks[os.path.splitext(os.path.basename(ruta))[0]] = archivo.read()
+    benchmarks['grande_principal'] = generar_fuente_principal(tamano)
+    benchmarks['grande_funciones'] = generar_fuente_funciones(tamano // 10)
+
+    if nombres:
+        desconocidos = [nombre for nombre in nombres if nombre not in benchmarks]
+        if desconocidos:
+            raise Exception(f"Error: Benchmarks desconocidos: {', '.join(desconocidos)}.")
+        benchmarks = {nombre: benchmarks[nombre] for nombre in nombres}
+    return benchmarks
+
+
+def correr_fases(fuente, optimizar=False, superinstrucciones_activas=True, al_terminar_fase=None):
+    """
+    Compila y ejecuta el código fuente una vez. Regresa el tiempo de cada fase; si se da,
+    'al_terminar_fase(fase)' se llama al final de cada una (para medir memoria).
+    La salida del programa y los mensajes del compilador se descartan.
+    """
+    tiempos = {}
+
+    def fase(nombre, funcion, *args, **kwargs):
+        inicio = time.perf_counter()
+        valor = funcion(*args, **kwargs)
+        tiempos[nombre] = time.perf_counter() - inicio
+        if al_terminar_fase is not None:
+            al_terminar_fase(nombre)
+        return valor
+
+    with open(os.devnull, 'w') as nulo, contextlib.redirect_stdout(nulo):
+        token_stream = fase('lexico', analisis_lexico, fuente)
+        tree = fase('sintactico', analisis_sintactico, token_stream)
+        listener = fase('semantico', analisis_semantico, tree, optimizar)
+        datos = fase('emision', lambda: bytecode.serializar(generar_programa(listener)))
+
+        def cargar():
+            programa = bytecode.deserializar(memoryview(datos))
+            return programa, preparar_ejecucion(programa, superinstrucciones_activas=superinstrucciones_activas)
+        programa, (codigo, marcos, memoria) = fase('carga', cargar)
+        fase('ejecucion', ejecutar, codigo, programa.nombres_funciones(), marcos, memoria,
+             verificar=requiere_verificacion(programa))
+    return tiempos
+
+
+def contar_instrucciones(fuente, optimizar=False):
+    """Cantidad de cuádruplos ejecutados por el programa (sin superinstrucciones)."""
+    contador = ContadorSecuencias()
+    with open(os.devnull, 'w') as nulo, contextlib.redirect_stdout(nulo):
+        programa = generar_programa(analisis_semantico(analisis_sintactico(analisis_lexico(fuente)), optimizar))
+        programa.ejecutar(traza=contador)
+    return contador.total
+
+
+def medir_memoria(fuente, optimizar=False, superinstrucciones_activas=True):
+    """
+    Pico de memoria (bytes, según tracemalloc) de la compilación (léxico a emisión) y de la
+    ejecución (carga y ejecución). Se mide en una corrida aparte porque tracemalloc la hace
+    más lenta.
+    """
+    picos = {}
+
+    def al_terminar_fase(nombre):
+        if nombre == 'emision':
+            picos['compilacion'] = tracemalloc.get_traced_memory()[1]
+            tracemalloc.reset_peak()
+        elif nombre == 'ejecucion':
+            picos['ejecucion'] = tracemalloc.get_traced_memory()[1]
+
+    tracemalloc.start()
+    try:
+        correr_fases(fuente, optimizar, superinstrucciones_activas, al_terminar_fase)
+    finally:
+        tracemalloc.stop()
+    return picos
+
+
+def medir(fuente, repeticiones=3, optimizar=False, superinstrucciones_activas=True, memoria=True):
+    """
+    Corre un benchmark 'repeticiones' veces y regresa el mejor tiempo de cada fase, las
+    instrucciones ejecutadas por segundo y, si 'memoria', los picos de memoria.
+    """
+    mejores = {}
+    for _ in range(repeticiones):
+        gc.collect()
+        for nombre, tiempo in correr_fases(fuente, optimizar, superinstrucciones_activas).items():
+            mejores[nombre] = min(tiempo, mejores.get(nombre, tiempo))
+
+    instrucciones = contar_instrucciones(fuente, optimizar)
+    resultado = {
+        'fases': mejores,
+        'compilacion': sum(mejores[fase] for fase in ('lexico', 'sintactico', 'semantico', 'emision')),
+        'instrucciones': instrucciones,
+        'instrucciones_por_segundo': instrucciones / mejores['ejecucion'] if mejores['ejecucion'] else 0.0,
+    }
+    if memoria:
+        resultado['memoria_pico'] = medir_memoria(fuente, optimizar, superinstrucciones_activas)
+    return resultado
+
+
+def correr_suite(benchmarks, repeticiones=3, optimizar=False, superinstrucciones_activas=True, memoria=True,
+                 al_medir=None):
+    resultados = {
+        'version': VERSION_RESULTADOS,
+        'python': platform.python_version(),
+        'plataforma': platform.platform(),
+        'opciones': {'optimizar': optimizar, 'superinstrucciones': superinstrucciones_activas,
+                     'repeticiones': repeticiones},
+        'benchmarks': {},
+    }
+    for nombre, fuente in benchmarks.items():
+        resultados['benchmarks'][nombre] = medir(fuente, repeticiones, optimizar, superinstrucciones_activas, memoria)
+        if al_medir is not None:
+            al_medir(nombre, resultados['benchmarks'][nombre])
+    return resultados
+
+
+def medir_escalamiento(tamanos=TAMANOS_ESCALAMIENTO, optimizar=False, al_medir=None):
+    """
+    Compila y ejecuta programas generados con cada cantidad de sentencias y regresa una
+    lista de {'sentencias', 'fases', 'crecimiento'}. 'crecimiento' es, por fase, cuánto
+    creció el tiempo respecto al tamaño anterior dividido entre cuánto creció el programa:
+    cerca de 1 la fase es lineal y cerca de 2 (al duplicar el tamaño) es cuadrática.
+    """
+    resultados = []
+    for sentencias in tamanos:
+        gc.collect()
+        tiempos = correr_fases(generar_fuente_escalamiento(sentencias), optimizar)
+        resultado = {'sentencias': sentencias, 'fases': tiempos, 'crecimiento': {}}
+        if resultados:
+            anterior = resultados[-1]
+            proporcion = sentencias / anterior['sentencias']
+            for fase, tiempo in tiempos.items():
+                if anterior['fases'][fase] > 0:
+                    resultado['crecimiento'][fase] = tiempo / anterior['fases'][fase] / proporcion
+        resultados.append(resultado)
+        if al_medir is not None:
+            al_medir(resultado)
+    return resultados
+
+
+def imprimir_escalamiento(resultado):
+    tiempos = ''.join(f"{resultado['fases'][fase] * 1e6 / resultado['sentencias']:>12.2f}" for fase in FASES)
+    crecimiento = ' '.join(f"{resultado['crecimiento'][fase]:.2f}" for fase in FASES if fase in resultado['crecimiento'])
+    print(f"{resultado['sentencias']:<18}{tiempos}  {crecimiento}")
+
+
+def comparar(resultados, base, tolerancia=0.10):
+    """
+    Compara los resultados con una base y regresa la lista de regresiones como tuplas
+    (benchmark, medida, valor base, valor actual). Un tiempo o pico de memoria es una
+    regresión si supera la base en más de 'tolerancia' (fracción).
+    """
+    regresiones = []
+    for nombre, actual in resultados['benchmarks'].items():
+        anterior = base.get('benchmarks', {}).get(nombre)
+        if anterior is None:
+            continue
+        for fase, tiempo in actual['fases'].items():
+            tiempo_base = anterior['fases'].get(fase)
+            if (tiempo_base is not None and tiempo > tiempo_base * (1 + tolerancia)
+                    and tiempo - tiempo_base > DIFERENCIA_MINIMA):
+                regresiones.append((nombre, fase, tiempo_base, tiempo))
+        for medida, pico in actual.get('memoria_pico', {}).items():
+            pico_base = anterior.get('memoria_pico', {}).get(medida)
+            if pico_base is not None and pico > pico_base * (1 + tolerancia):
+                regresiones.append((nombre, f'memoria_{medida}', pico_base, pico))
+    return regresiones
+
+
+def imprimir_encabezado():
+    columnas = ''.join(f"{fase:>12}" for fase in FASES)
+    print(f"{'Benchmark':<18}{columnas}{'instr/s':>12}{'memoria (KB)':>16}")
+    print(f"{'':<18}{'(ms)':>12}{'':>{12 * (len(FASES) - 1) + 12}}{'compil./ejec.':>16}")
+
+
+def imprimir_resultado(nombre, resultado):
+    tiempos = ''.join(f"{resultado['fases'][fase] * 1000:>12.2f}" for fase in FASES)
+    memoria = ''
+    if 'memoria_pico' in resultado:
+        picos = resultado['memoria_pico']
+        memoria = f"{picos.get('compilacion', 0) // 1024:>8}/{picos.get('ejecucion', 0) // 1024}"
+    print(f"{nombre:<18}{tiempos}{resultado['instrucciones_por_segundo']:>12.0f}{memoria:>16}")
+
+
+def formatear_medida(medida, valor):
+    return f"{valor // 1024} KB" if medida.startswith('memoria') else f"{valor * 1000:.2f} ms"
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmarks del compilador y la máquina virtual de Patito.')
+    parser.add_argument('nombres', nargs='*',
+                        help="Benchmarks a correr (por defecto todos: los .patito de 'benchmarks' y los generados).")
+    parser.add_argument('-r', '--repeticiones', type=int, default=3,
+                        help='Corridas por benchmark; se reporta el mejor tiempo de cada fase.')
+    parser.add_argument('-O', '--optimiza', action='store_true', help='Compila con las optimizaciones activas.')
+    parser.add_argument('--sin-superinstrucciones', dest='superinstrucciones', action='store_false',
+                        help='Ejecuta sin fusionar las secuencias frecuentes de cuádruplos.')
+    parser.add_argument('--tamano', type=int, default=TAMANO_GRANDE,
+                        help=f'Sentencias de los programas generados (por defecto {TAMANO_GRANDE}).')
+    parser.add_argument('--sin-memoria', dest='memoria', action='store_false',
+                        help='No mide los picos de memoria (evita la corrida adicional con tracemalloc).')
+    parser.add_argument('--escalamiento', nargs='*', type=int, metavar='SENTENCIAS',
+                        help='En vez de la suite, compila programas generados de estos tamaños (por defecto '
+                             f"{', '.join(map(str, TAMANOS_ESCALAMIENTO))} sentencias) y reporta el tiempo "
+                             'por sentencia de cada fase.')
+    parser.add_argument('--salida', metavar='ARCHIVO', help='Escribe los resultados en JSON.')
+    parser.add_argument('--base', metavar='ARCHIVO', help='Resultados JSON con los que se comparan los actuales.')
+    parser.add_argument('--tolerancia', type=float, default=0.10,
+                        help='Fracción sobre la base a partir de la cual se marca una regresión (por defecto 0.10).')
+    args = parser.parse_args()
+
+    try:
+        benchmarks = cargar_benchmarks(args.nombres, args.tamano)
+        base = None
+        if args.base:
+            with open(args.base, 'r') as archivo:
+                base = json.load(archivo)
+    except FileNotFoundError as e:
+        print(f"Error: '{e.filename}' no encontrado.")
+        sys.exit(1)
+    except Exception as e:
+        print(e)
+        sys.exit(1)
+
+    if args.escalamiento is not None:
+        columnas = ''.join(f"{fase:>12}" for fase in FASES)
+        print(f"{'Sentencias':<18}{columnas}  crecimiento")
+        print(f"{'':<18}{'(µs por sentencia)':>24}")
+        escalamiento = medir_escalamiento(args.escalamiento or TAMANOS_ESCALAMIENTO, args.optimiza,
+                                          imprimir_escalamiento)
+        if args.salida:
+            with open(args.salida, 'w') as archivo:
+                json.dump({'version': VERSION_RESULTADOS, 'python': platform.python_version(),
+                           'escalamiento': escalamiento}, archivo, indent=2)
+        return
+
+    imprimir_encabezado()
+    try:
+        resultados = correr_suite(benchmarks, args.repeticiones, args.optimiza, args.superinstrucciones,
+                                  args.memoria, imprimir_resultado)
+    except (ErrorCompilacion, ErrorEjecucion) as e:
+        print(f"Error al correr los benchmarks: {e}")
+        sys.exit(1)
+
+    if args.salida:
+        with open(args.salida, 'w') as archivo:
+            json.dump(resultados, archivo, indent=2)
+        print(f"\nResultados escritos en '{args.salida}'.")
+
+    if base is not None:
+        regresiones = comparar(resultados, base, args.tolerancia)
+        if not regresiones:
+            print(f"\nSin regresiones respecto a '{args.base}'.")
+            return
+        print(f"\nRegresiones respecto a '{args.base}' (tolerancia {args.tolerancia:.0%}):")
+        for nombre, medida, anterior, actual in regresiones:
+            print(f"  {nombre:<18} {medida:<22} {formatear_medida(medida, anterior):>12} -> "
+                  f"{formatear_medida(medida, actual):>12}  (+{(actual / anterior - 1):.0%})")
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,343 @@
+import os
+import mmap
+import struct
+import tempfile
+
+from opcodes import CODIGOS, OPERACIONES_CON_FUNCION, SIN_OPERANDO
+from VirtualMemory import VirtualMemory
+
+# Formato binario de programas compilados de Patito (little endian):
+#
+#   Encabezado       magia, versión, banderas, cantidades y desplazamientos de cada sección
+#   Instrucciones    arreglo de ancho fijo (código, operando1, operando2, resultado) en int32;
+#                    SIN_OPERANDO (-1) representa un operando vacío y en ERA/GOSUB el
+#                    operando1 es el índice de la función en la tabla de funciones
+#   Funciones        (desplazamiento y longitud del nombre, cuádruplo de inicio, tamaño del
+#                    marco por cada segmento local y temporal); la entrada 0 es 'global'
+#   Constantes       (dirección, tipo, valor de 8 bytes); las cadenas guardan desplazamiento
+#                    y longitud dentro de la sección de cadenas
+#   Cadenas          nombres de funciones y constantes de texto en UTF-8
+#   Líneas           línea del código fuente de cada instrucción (uint32, 0 si no se conoce)
+
+MAGIA = b'PTTO'
+VERSION = 3
+
+ENCABEZADO = struct.Struct('<4sHHIIIIIIIII')
+INSTRUCCION = struct.Struct('<iiii')
+CONSTANTE = struct.Struct('<iB3x8s')
+VALOR_ENTERO = struct.Struct('<q')
+VALOR_FLOTANTE = struct.Struct('<d')
+VALOR_CADENA = struct.Struct('<II')
+LINEA = struct.Struct('<I')
+
+# Banderas del encabezado
+# El análisis de asignación definida demostró que toda lectura de variable está inicializada
+# (ver inicializacion.py); la máquina virtual ejecuta sin revisarlo
+INICIALIZACION_VERIFICADA = 0x1
+
+# Permisos de un archivo nuevo según la umask del proceso. os.umask solo se puede leer
+# cambiándola, así que se lee una vez al importar y no en cada escritura, donde afectaría a
+# otros hilos que crean archivos al mismo tiempo
+_MASCARA = os.umask(0)
+os.umask(_MASCARA)
+PERMISOS_ARCHIVO = 0o666 & ~_MASCARA
+
+TIPOS = ['entero', 'flotante', 'booleano', 'cadena']
+CODIGOS_TIPO = {tipo: codigo for codigo, tipo in enumerate(TIPOS)}
+
+
+def estructura_funcion(segmentos_marco):
+    return struct.Struct('<IIi' + 'I' * segmentos_marco)
+
+
+def segmentos_marco():
+    # Orden de los tamaños de marco: segmentos locales y luego temporales, por tipo
+    segmentos = VirtualMemory().segments
+    return [(alcance, tipo) for alcance in ('local', 'temporal') for tipo in segmentos[alcance]]
+
+
+class Programa:
+    """
+    Programa compilado: instrucciones codificadas como enteros, tabla de funciones y
+    pool de constantes tipadas. Es lo que se escribe y se lee del formato binario.
+    """
+    def __init__(self, instrucciones, funciones, constantes, banderas=0, lineas=None):
+        # Lista de tuplas (código, operando1, operando2, resultado)
+        self.instrucciones = instrucciones
+        # Lista de diccionarios {'nombre', 'inicio', 'tamano_marco'}; la entrada 0 es 'global'
+        self.funciones = funciones
+        # Lista de tuplas (dirección, valor, tipo)
+        self.constantes = constantes
+        self.banderas = banderas
+        # Línea del código fuente de cada instrucción (0 si no se conoce)
+        self.lineas = lineas if lineas is not None else [0] * len(instrucciones)
+
+    @classmethod
+    def desde_compilador(cls, cuadruplos, constant_table, directorio_funciones, lineas=None, banderas=0):
+        """
+        Construye el programa a partir de las estructuras que genera PatitoCustomListener.
+        """
+        funciones, indices_funciones = funciones_desde_directorio(directorio_funciones)
+        instrucciones = [codificar_cuadruplo(cuadruplo, indices_funciones) for cuadruplo in cuadruplos]
+        constantes = constantes_desde_tabla(constant_table)
+        return cls(instrucciones, funciones, constantes, banderas, lineas)
+
+    def nombres_funciones(self):
+        return [funcion['nombre'] for funcion in self.funciones]
+
+    def funcion_de_cuadruplos(self, total=None):
+        """
+        Índice de la función a la que pertenece cada instrucción: el código de una función va
+        de su cuádruplo de inicio al inicio de la siguiente; el resto es del programa principal.
+        """
+        total = len(self.instrucciones) if total is None else total
+        inicios = sorted({funcion['inicio'] for funcion in self.funciones if funcion['inicio'] is not None})
+        propietario = [0] * total
+        for indice, funcion in enumerate(self.funciones):
+            if indice == 0 or funcion['inicio'] is None:
+                continue
+            siguientes = [inicio for inicio in inicios if inicio > funcion['inicio']]
+            fin = siguientes[0] if siguientes else total
+            for contador in range(funcion['inicio'], min(fin, total)):
+                propietario[contador] = indice
+        return propietario
+
+    def guardar(self, ruta):
+        escribir(ruta, self)
+
+    def ejecutar(self, verbose=False, traza=None, motor='interprete', ruta_traduccion=None,
+                 superinstrucciones=True, perfil=None, salida=None):
+        """
+        Ejecuta el programa dentro del mismo proceso con el intérprete de la máquina virtual
+        o, con motor='traductor', traducido a Python (ver traductor.py); 'ruta_traduccion'
+        guarda y reutiliza el código generado. superinstrucciones=False ejecuta los cuádruplos
+        sin fusionar en el intérprete y un perfil.Perfil mide cada instrucción ejecutada.
+        'salida' es el canal donde escribe PRINT (ver salida.py; por defecto la salida estándar).
+        Lanza virtual_machine.ErrorEjecucion si ocurre un error de ejecución.
+        """
+        # Importaciones diferidas: virtual_machine y traductor dependen de este módulo
+        if motor == 'traductor':
+            from traductor import ejecutar_traducido
+            ejecutar_traducido(self, ruta_traduccion, salida)
+        else:
+            from virtual_machine import ejecutar_programa
+            ejecutar_programa(self, verbose, traza, superinstrucciones, perfil, salida)
+
+
+def funciones_desde_directorio(directorio_funciones):
+    """
+    Regresa la tabla de funciones del programa y el índice de cada función por nombre, en
+    el orden del directorio de funciones ('global' primero).
+    """
+    orden = segmentos_marco()
+    funciones = []
+    indices_funciones = {}
+    for nombre, info in directorio_funciones.items():
+        tamano_marco = info['tamano_marco']
+        indices_funciones[nombre] = len(funciones)
+        funciones.append({
+            'nombre': nombre,
+            'inicio': info['cuadruplos_inicio'],
+            'tamano_marco': [tamano_marco[alcance][tipo] for alcance, tipo in orden],
+        })
+    return funciones, indices_funciones
+
+
+def constantes_desde_tabla(constant_table):
+    return [(info['direccion'], valor_constante(texto, info['tipo']), info['tipo'])
+            for texto, info in constant_table.items()]
+
+
+def codificar_cuadruplo(cuadruplo, indices_funciones):
+    operador, operando1, operando2, resultado = cuadruplo
+    if operador not in CODIGOS:
+        raise Exception(f"Error: Operador desconocido: '{operador}'.")
+    codigo = CODIGOS[operador]
+    if codigo in OPERACIONES_CON_FUNCION:
+        operando1 = indices_funciones[operando1]
+    return (codigo, codificar_operando(operando1), codificar_operando(operando2), codificar_operando(resultado))
+
+
+def codificar_operando(operando):
+    return SIN_OPERANDO if operando is None else int(operando)
+
+
+def valor_constante(texto, tipo):
+    # Convierte el texto de la constante en la tabla de constantes a su valor
+    if tipo == 'entero':
+        return int(texto)
+    elif tipo == 'flotante':
+        return float(texto)
+    elif tipo == 'booleano':
+        return texto == 'True'
+    elif tipo == 'cadena':
+        return texto.strip('"')
+    raise Exception(f"Error: Tipo desconocido '{tipo}' para la constante.")
+
+
+def escribir(ruta, programa):
+    reemplazar_archivo(ruta, lambda f: f.write(serializar(programa)))
+
+
+def reemplazar_archivo(ruta, escribir_contenido):
+    """
+    Escribe 'ruta' de forma atómica: escribir_contenido(f) llena un archivo temporal del
+    mismo directorio que después reemplaza a 'ruta'. Quien lee el programa (o lo tiene
+    mapeado con cargar()) nunca ve un archivo a medias, y si la escritura falla el archivo
+    anterior queda intacto. Regresa lo que regresa escribir_contenido.
+    """
+    descriptor, temporal = tempfile.mkstemp(dir=os.path.dirname(ruta) or '.', suffix='.tmp')
+    try:
+        with os.fdopen(descriptor, 'wb') as f:
+            resultado = escribir_contenido(f)
+        # mkstemp crea el archivo solo para su dueño; se usan los permisos de un archivo nuevo
+        os.chmod(temporal, PERMISOS_ARCHIVO)
+        os.replace(temporal, ruta)
+    except BaseException:
+        if os.path.exists(temporal):
+            os.remove(temporal)
+        raise
+    return resultado
+
+
+def serializar(programa):
+    seccion_instrucciones = bytearray(INSTRUCCION.size * len(programa.instrucciones))
+    for indice, instruccion in enumerate(programa.instrucciones):
+        INSTRUCCION.pack_into(seccion_instrucciones, indice * INSTRUCCION.size, *instruccion)
+
+    seccion_funciones, seccion_constantes, cadenas = serializar_tablas(programa.funciones, programa.constantes)
+
+    seccion_lineas = bytearray(LINEA.size * len(programa.instrucciones))
+    for indice, linea in enumerate(programa.lineas):
+        LINEA.pack_into(seccion_lineas, indice * LINEA.size, linea)
+
+    encabezado = empaquetar_encabezado(programa.banderas, len(programa.instrucciones), len(programa.funciones),
+                                       len(programa.constantes), len(seccion_funciones),
+                                       len(seccion_constantes), len(cadenas))
+    return b''.join([encabezado, seccion_instrucciones, seccion_funciones, seccion_constantes, cadenas,
+                     seccion_lineas])
+
+
+def serializar_tablas(funciones, constantes):
+    """Regresa las secciones de funciones, constantes y cadenas del formato binario."""
+    funcion = estructura_funcion(len(segmentos_marco()))
+    cadenas = bytearray()
+
+    def agregar_cadena(texto):
+        datos = texto.encode('utf-8')
+        desplazamiento = len(cadenas)
+        cadenas.extend(datos)
+        return desplazamiento, len(datos)
+
+    seccion_funciones = bytearray()
+    for info in funciones:
+        desplazamiento, longitud = agregar_cadena(info['nombre'])
+        inicio = SIN_OPERANDO if info['inicio'] is None else info['inicio']
+        seccion_funciones += funcion.pack(desplazamiento, longitud, inicio, *info['tamano_marco'])
+
+    seccion_constantes = bytearray()
+    for direccion, valor, tipo in constantes:
+        if tipo == 'entero':
+            try:
+                datos = VALOR_ENTERO.pack(valor)
+            except struct.error:
+                raise Exception(f"Error: La constante entera {valor} no cabe en 64 bits.")
+        elif tipo == 'flotante':
+            datos = VALOR_FLOTANTE.pack(valor)
+        elif tipo == 'booleano':
+            datos = VALOR_ENTERO.pack(int(bool(valor)))
+        else:
+            datos = VALOR_CADENA.pack(*agregar_cadena(valor))
+        seccion_constantes += CONSTANTE.pack(direccion, CODIGOS_TIPO[tipo], datos)
+
+    return seccion_funciones, seccion_constantes, cadenas
+
+
+def empaquetar_encabezado(banderas, n_instrucciones, n_funciones, n_constantes, bytes_funciones, bytes_constantes,
+                          bytes_cadenas):
+    # Las secciones van una tras otra en el orden del formato, después del encabezado
+    offset_instrucciones = ENCABEZADO.size
+    offset_funciones = offset_instrucciones + n_instrucciones * INSTRUCCION.size
+    offset_constantes = offset_funciones + bytes_funciones
+    offset_cadenas = offset_constantes + bytes_constantes
+    offset_lineas = offset_cadenas + bytes_cadenas
+    return ENCABEZADO.pack(
+        MAGIA, VERSION, banderas, n_instrucciones, n_funciones, n_constantes, len(segmentos_marco()),
+        offset_instrucciones, offset_funciones, offset_constantes, offset_cadenas, offset_lineas)
+
+
+def cargar(ruta):
+    """
+    Carga un programa binario mapeando el archivo en memoria; las secciones de ancho
+    fijo se desempaquetan directamente del memoryview, sin analizar texto.
+    """
+    with open(ruta, 'rb') as f:
+        try:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as datos:
+                with memoryview(datos) as vista:
+                    return deserializar(vista)
+        except ValueError:
+            # mmap no acepta archivos vacíos
+            raise Exception(f"Error: '{ruta}' no es un programa de Patito válido.")
+
+
+def deserializar(vista):
+    if len(vista) < ENCABEZADO.size:
+        raise Exception("Error: Programa binario incompleto.")
+    (magia, version, banderas, n_instrucciones, n_funciones, n_constantes, n_segmentos,
+     offset_instrucciones, offset_funciones, offset_constantes, offset_cadenas,
+     offset_lineas) = ENCABEZADO.unpack_from(vista)
+    if magia != MAGIA:
+        raise Exception("Error: El archivo no es un programa de Patito.")
+    if version != VERSION:
+        raise Exception(f"Error: Versión de programa {version} no soportada (se esperaba {VERSION}).")
+    if n_segmentos != len(segmentos_marco()):
+        raise Exception("Error: El programa fue compilado con otra distribución de memoria.")
+
+    # Cada sección debe caber en el archivo; uno truncado se reporta antes de leerlo
+    funcion = estructura_funcion(n_segmentos)
+    secciones = [
+        (offset_instrucciones, n_instrucciones * INSTRUCCION.size),
+        (offset_funciones, n_funciones * funcion.size),
+        (offset_constantes, n_constantes * CONSTANTE.size),
+        (offset_cadenas, offset_lineas - offset_cadenas),
+        (offset_lineas, n_instrucciones * LINEA.size),
+    ]
+    if any(tamano < 0 or inicio + tamano > len(vista) for inicio, tamano in secciones):
+        raise Exception("Error: Programa binario incompleto.")
+
+    fin_instrucciones = offset_instrucciones + n_instrucciones * INSTRUCCION.size
+    instrucciones = list(INSTRUCCION.iter_unpack(vista[offset_instrucciones:fin_instrucciones]))
+
+    cadenas = vista[offset_cadenas:offset_lineas]
+
+    def leer_cadena(desplazamiento, longitud):
+        return str(cadenas[desplazamiento:desplazamiento + longitud], 'utf-8')
+
+    funciones = []
+    fin_funciones = offset_funciones + n_funciones * funcion.size
+    for desplazamiento, longitud, inicio, *tamano_marco in funcion.iter_unpack(vista[offset_funciones:fin_funciones]):
+        funciones.append({
+            'nombre': leer_cadena(desplazamiento, longitud),
+            'inicio': None if inicio == SIN_OPERANDO else inicio,
+            'tamano_marco': tamano_marco,
+        })
+
+    constantes = []
+    fin_constantes = offset_constantes + n_constantes * CONSTANTE.size
+    for direccion, codigo_tipo, datos in CONSTANTE.iter_unpack(vista[offset_constantes:fin_constantes]):
+        tipo = TIPOS[codigo_tipo]
+        if tipo == 'entero':
+            valor = VALOR_ENTERO.unpack(datos)[0]
+        elif tipo == 'flotante':
+            valor = VALOR_FLOTANTE.unpack(datos)[0]
+        elif tipo == 'booleano':
+            valor = bool(VALOR_ENTERO.unpack(datos)[0])
+        else:
+            valor = leer_cadena(*VALOR_CADENA.unpack(datos))
+        constantes.append((direccion, valor, tipo))
+
+    fin_lineas = offset_lineas + n_instrucciones * LINEA.size
+    lineas = [linea for (linea,) in LINEA.iter_unpack(vista[offset_lineas:fin_lineas])]
+
+    return Programa(instrucciones, funciones, constantes, banderas, lineas)
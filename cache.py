@@ -0,0 +1,114 @@
+import hashlib
+import os
+import shutil
+
+import bytecode
+
+# Caché de compilación direccionada por contenido: la clave es un hash del código fuente,
+# de las opciones de compilación y de la versión del compilador, y cada entrada es el
+# programa compilado en formato binario ('<clave>.pbc') y, si la compilación tuvo
+# advertencias, un archivo de texto con ellas ('<clave>.advertencias'). Un acierto evita
+# por completo el análisis léxico, sintáctico y semántico.
+
+DIRECTORIO_CACHE = '.patito_cache'
+
+# Archivos que determinan el resultado de la compilación; si cambia cualquiera de ellos
+# cambia la versión del compilador y las entradas anteriores dejan de usarse.
+ARCHIVOS_COMPILADOR = [
+    'Patito.g4',
+    'PatitoCustomListener.py',
+    'VirtualMemory.py',
+    'opcodes.py',
+    'bytecode.py',
+    'emisor.py',
+    'inicializacion.py',
+    'compilador.py',
+    'optimizador.py',
+    'cache.py',
+]
+
+_version_compilador = None
+
+
+def version_compilador():
+    global _version_compilador
+    if _version_compilador is None:
+        directorio = os.path.dirname(os.path.abspath(__file__))
+        h = hashlib.sha256(f"formato:{bytecode.VERSION}".encode())
+        for nombre in ARCHIVOS_COMPILADOR:
+            ruta = os.path.join(directorio, nombre)
+            if os.path.exists(ruta):
+                with open(ruta, 'rb') as f:
+                    h.update(nombre.encode())
+                    h.update(f.read())
+        _version_compilador = h.hexdigest()
+    return _version_compilador
+
+
+class CacheCompilacion:
+    def __init__(self, directorio=DIRECTORIO_CACHE):
+        self.directorio = directorio
+        self.aciertos = 0
+        self.fallos = 0
+
+    def clave(self, fuente, opciones=()):
+        h = hashlib.sha256()
+        h.update(version_compilador().encode())
+        for opcion in opciones:
+            h.update(b'\0' + str(opcion).encode())
+        h.update(b'\0' + fuente.encode('utf-8'))
+        return h.hexdigest()
+
+    def ruta(self, clave):
+        return os.path.join(self.directorio, f"{clave}.pbc")
+
+    def ruta_advertencias(self, clave):
+        return os.path.join(self.directorio, f"{clave}.advertencias")
+
+    def obtener(self, clave):
+        """
+        Regresa el Programa guardado con la clave, o None si no existe o está dañado.
+        """
+        try:
+            programa = bytecode.cargar(self.ruta(clave))
+        except Exception:
+            self.fallos += 1
+            return None
+        self.aciertos += 1
+        return programa
+
+    def obtener_advertencias(self, clave):
+        """Advertencias de la compilación guardada con la clave (una lista vacía si no tuvo)."""
+        try:
+            with open(self.ruta_advertencias(clave), 'r', encoding='utf-8') as f:
+                return f.read().splitlines()
+        except FileNotFoundError:
+            return []
+
+    def guardar(self, clave, programa, advertencias=()):
+        self.guardar_advertencias(clave, advertencias)
+        self.escribir_entrada(self.ruta(clave), lambda f: f.write(bytecode.serializar(programa)))
+
+    def guardar_archivo(self, clave, ruta, advertencias=()):
+        # Copia un programa ya escrito en disco (por ejemplo, por compilador.compilar_a_archivo)
+        self.guardar_advertencias(clave, advertencias)
+        with open(ruta, 'rb') as origen:
+            self.escribir_entrada(self.ruta(clave), lambda f: shutil.copyfileobj(origen, f))
+
+    def guardar_advertencias(self, clave, advertencias):
+        # Se escriben antes que el programa: quien encuentra el programa encuentra sus advertencias
+        if advertencias:
+            texto = "".join(advertencia + "\n" for advertencia in advertencias).encode('utf-8')
+            self.escribir_entrada(self.ruta_advertencias(clave), lambda f: f.write(texto))
+
+    def escribir_entrada(self, destino, escribir):
+        # Escritura atómica: varios procesos pueden compilar el mismo programa a la vez
+        os.makedirs(self.directorio, exist_ok=True)
+        bytecode.reemplazar_archivo(destino, escribir)
+
+    def limpiar(self):
+        if not os.path.isdir(self.directorio):
+            return
+        for nombre in os.listdir(self.directorio):
+            if nombre.endswith(('.pbc', '.advertencias')):
+                os.remove(os.path.join(self.directorio, nombre))
@@ -0,0 +1,180 @@
+import contextlib
+from antlr4 import *
+from antlr4.atn.PredictionMode import PredictionMode
+from antlr4.error.ErrorStrategy import BailErrorStrategy
+from antlr4.error.Errors import ParseCancellationException
+from PatitoLexer import PatitoLexer
+from PatitoParser import PatitoParser
+from PatitoCustomListener import PatitoCustomListener
+from bytecode import Programa, serializar, reemplazar_archivo
+
+# API para compilar y ejecutar programas de Patito dentro del mismo proceso:
+#
+#   programa = compilar(fuente)
+#   programa.ejecutar()
+#
+# No se escriben archivos intermedios; programa.guardar(ruta) escribe el formato binario.
+# compilar(fuente, cache=CacheCompilacion()) reutiliza compilaciones previas (ver cache.py).
+# compilar_a_archivo(fuente, ruta) escribe el programa mientras se genera (ver emisor.py).
+
+
+class ErrorCompilacion(Exception):
+    """Errores sintácticos o semánticos encontrados al compilar."""
+    def __init__(self, errores):
+        super().__init__("\n".join(errores))
+        self.errores = errores
+
+
+def analisis_lexico(fuente):
+    """Regresa el flujo de tokens del código fuente, ya leído completo."""
+    lexer = PatitoLexer(InputStream(fuente))
+    token_stream = CommonTokenStream(lexer)
+    token_stream.fill()
+    return token_stream
+
+
+def analisis_sintactico(token_stream, dos_etapas=True):
+    """
+    Construye el árbol sintáctico; lanza ErrorCompilacion si hay errores de sintaxis.
+
+    Con dos_etapas=True primero se intenta la predicción SLL, mucho más rápida que la LL
+    completa, sin reportar errores y abandonando al primero. Solo si falla (un error de
+    sintaxis o una decisión que SLL no resuelve) se vuelve a analizar con LL completa y
+    los errores se reportan igual que en un análisis de una sola etapa. El DFA de
+    predicción es compartido por todos los PatitoParser del proceso, así que compilar
+    muchos archivos en el mismo proceso lo mantiene caliente.
+    """
+    if dos_etapas:
+        parser = PatitoParser(token_stream)
+        parser._interp.predictionMode = PredictionMode.SLL
+        parser._errHandler = BailErrorStrategy()
+        parser.removeErrorListeners()
+        try:
+            return parser.programa()
+        except ParseCancellationException:
+            token_stream.seek(0)
+
+    parser = PatitoParser(token_stream)
+    tree = parser.programa()
+
+    if parser.getNumberOfSyntaxErrors() > 0:
+        raise ErrorCompilacion(["Error: Se encontraron errores de sintaxis en el archivo."])
+    return tree
+
+
+def analisis_semantico(tree, optimizar=False, salida=None):
+    """
+    Recorre el árbol con el listener, que valida la semántica y genera los cuádruplos.
+    Con un archivo de 'salida' los cuádruplos se escriben en él conforme se generan.
+    """
+    listener = PatitoCustomListener(optimizar, salida)
+    walker = ParseTreeWalker()
+    walker.walk(listener, tree)
+
+    if listener.errores:
+        raise ErrorCompilacion(listener.errores)
+    return listener
+
+
+def analizar(fuente, optimizar=False, estadisticas=None, dos_etapas=True, salida=None):
+    """
+    Corre el análisis léxico, sintáctico y semántico sobre el código fuente y regresa el
+    listener con el directorio de funciones, la tabla de constantes y los cuádruplos.
+    Con optimizar=True se pliegan constantes y se simplifican identidades algebraicas.
+    Con un estadisticas.Estadisticas se mide cada fase y se cuentan tokens, nodos y cuádruplos.
+    dos_etapas=False analiza directamente con predicción LL completa (ver analisis_sintactico).
+    'salida' es el de analisis_semantico().
+    """
+    fase = estadisticas.fase if estadisticas is not None else sin_medir
+    with fase('lexico'):
+        token_stream = analisis_lexico(fuente)
+    with fase('sintactico'):
+        tree = analisis_sintactico(token_stream, dos_etapas)
+    with fase('semantico'):
+        listener = analisis_semantico(tree, optimizar, salida)
+
+    if estadisticas is not None:
+        estadisticas.contar_analisis(token_stream, tree)
+        estadisticas.contar_codigo(listener)
+    return listener
+
+
+def sin_medir(nombre):
+    return contextlib.nullcontext()
+
+
+def generar_programa(listener):
+    """Regresa el Programa con los cuádruplos, constantes y funciones generados por el listener."""
+    return Programa.desde_compilador(listener.cuadruplos, listener.constant_table, listener.directorio_funciones,
+                                     listener.lineas_cuadruplos, listener.banderas)
+
+
+def compilar(fuente, cache=None, optimizar=False, estadisticas=None, dos_etapas=True):
+    """
+    Compila código fuente de Patito y regresa un Programa listo para ejecutarse.
+    Si se da una CacheCompilacion y el código ya se compiló, regresa el programa guardado
+    sin correr el front end. Lanza ErrorCompilacion si hay errores sintácticos o semánticos.
+    'estadisticas' y 'dos_etapas' son los de analizar().
+    """
+    fase = estadisticas.fase if estadisticas is not None else sin_medir
+    if cache is not None:
+        with fase('cache'):
+            clave = cache.clave(fuente, opciones_compilacion(optimizar))
+            programa = cache.obtener(clave)
+        if programa is not None:
+            return programa
+
+    listener = analizar(fuente, optimizar, estadisticas, dos_etapas)
+    with fase('emision'):
+        programa = generar_programa(listener)
+
+    if cache is not None:
+        cache.guardar(clave, programa, listener.advertencias)
+    return programa
+
+
+def compilar_a_archivo(fuente, ruta, optimizar=False, estadisticas=None, dos_etapas=True):
+    """
+    Compila código fuente de Patito y escribe el programa en 'ruta'; regresa el listener.
+    Sin optimizar, las instrucciones se escriben al archivo conforme el listener las genera y
+    no se guardan en memoria. Con optimizar=True el flujo se optimiza sobre el programa
+    completo, así que se compila en memoria y se escribe al final. El archivo se reemplaza
+    solo si la compilación termina sin errores.
+    """
+    fase = estadisticas.fase if estadisticas is not None else sin_medir
+
+    def escribir(salida):
+        if optimizar:
+            listener = analizar(fuente, optimizar, estadisticas, dos_etapas)
+            with fase('emision'):
+                salida.write(serializar(generar_programa(listener)))
+        else:
+            listener = analizar(fuente, optimizar, estadisticas, dos_etapas, salida)
+            with fase('emision'):
+                listener.cuadruplos.cerrar(listener.constant_table, listener.banderas)
+        return listener
+
+    # Temporal con nombre único (mkstemp): dos compilaciones al mismo archivo no comparten temporal
+    return reemplazar_archivo(ruta, escribir)
+
+
+def compilar_archivo(ruta, cache=None, optimizar=False, dos_etapas=True):
+    with open(ruta, 'r') as archivo:
+        return compilar(archivo.read(), cache, optimizar, dos_etapas=dos_etapas)
+
+
+def compilar_archivos(rutas, cache=None, optimizar=False, dos_etapas=True):
+    """
+    Compila varios archivos en este proceso, reutilizando el DFA de predicción del parser
+    entre ellos. Genera (ruta, programa, errores): 'programa' es None si hubo errores.
+    """
+    for ruta in rutas:
+        try:
+            yield ruta, compilar_archivo(ruta, cache, optimizar, dos_etapas), []
+        except ErrorCompilacion as e:
+            yield ruta, None, e.errores
+
+
+def opciones_compilacion(optimizar):
+    # Opciones que cambian el programa generado y por lo tanto forman parte de la clave de caché
+    return ('optimizar',) if optimizar else ()
@@ -0,0 +1,124 @@
+import os
+import shutil
+import tempfile
+from itertools import islice
+
+from bytecode import (ENCABEZADO, INSTRUCCION, LINEA, codificar_cuadruplo, funciones_desde_directorio,
+                      constantes_desde_tabla, serializar_tablas, empaquetar_encabezado)
+from optimizador import es_temporal
+
+# Emisión en flujo del programa compilado (subcomando 'compila' de main_patito.py).
+#
+# El listener agrega los cuádruplos a un EmisorPrograma en vez de a una lista: cada cuádruplo
+# se codifica y se escribe al archivo en cuanto se genera, en el mismo formato binario que
+# bytecode.serializar(). Solo los saltos que aún no tienen destino (GOTO y GOTOF) se guardan
+# en una tabla de pendientes; al completarlos se reescribe su instrucción en el archivo.
+# Las líneas de cada cuádruplo van a un archivo temporal y se copian al final, junto con las
+# tablas de funciones y constantes y el encabezado, que se escribe sobre el reservado al inicio.
+
+# Instrucciones que se acumulan en memoria antes de escribirlas al archivo
+INSTRUCCIONES_POR_BLOQUE = 4096
+
+SALTOS = ('GOTO', 'GOTOF')
+
+
+class LineasEmitidas:
+    """Línea del código fuente de cada cuádruplo emitido, guardada en un archivo temporal."""
+    def __init__(self):
+        self.archivo = tempfile.TemporaryFile()
+        self.total = 0
+
+    def append(self, linea):
+        self.archivo.write(LINEA.pack(linea))
+        self.total += 1
+
+    def __len__(self):
+        return self.total
+
+
+class EmisorPrograma:
+    """
+    Secuencia de cuádruplos que se escribe a 'archivo' (binario y con seek) conforme se genera.
+    Admite las operaciones que el listener usa sobre su lista de cuádruplos: append, len y
+    leer o reemplazar un salto pendiente por su índice.
+    """
+    def __init__(self, archivo, directorio_funciones):
+        self.archivo = archivo
+        self.directorio_funciones = directorio_funciones
+        self.indices_funciones = {}
+        self.origen = archivo.tell()
+        # El encabezado se escribe al cerrar, cuando se conocen las cantidades
+        archivo.write(bytes(ENCABEZADO.size))
+        self.total = 0
+        self.temporales = 0
+        # Instrucciones codificadas que aún no se escriben; la primera es la 'inicio_bloque'
+        self.bloque = bytearray()
+        self.inicio_bloque = 0
+        # Índice -> cuádruplo de los saltos sin destino
+        self.pendientes = {}
+        self.lineas = LineasEmitidas()
+
+    def append(self, cuadruplo):
+        operador, _, _, resultado = cuadruplo
+        if operador in SALTOS and resultado is None:
+            self.pendientes[self.total] = cuadruplo
+        elif isinstance(resultado, int) and es_temporal(resultado):
+            self.temporales += 1
+        self.bloque += INSTRUCCION.pack(*self.codificar(cuadruplo))
+        self.total += 1
+        if self.total - self.inicio_bloque >= INSTRUCCIONES_POR_BLOQUE:
+            self.escribir_bloque()
+
+    def __len__(self):
+        return self.total
+
+    def __getitem__(self, indice):
+        if indice not in self.pendientes:
+            raise Exception(f"Error: El cuádruplo {indice} ya se emitió y no es un salto pendiente.")
+        return self.pendientes[indice]
+
+    def __setitem__(self, indice, cuadruplo):
+        # Completar un salto pendiente: se reescribe su instrucción, en el bloque o en el archivo
+        if self.pendientes.pop(indice, None) is None:
+            raise Exception(f"Error: El cuádruplo {indice} ya se emitió y no es un salto pendiente.")
+        datos = INSTRUCCION.pack(*self.codificar(cuadruplo))
+        if indice >= self.inicio_bloque:
+            posicion = (indice - self.inicio_bloque) * INSTRUCCION.size
+            self.bloque[posicion:posicion + INSTRUCCION.size] = datos
+        else:
+            self.archivo.seek(self.origen + ENCABEZADO.size + indice * INSTRUCCION.size)
+            self.archivo.write(datos)
+            self.archivo.seek(0, os.SEEK_END)
+
+    def codificar(self, cuadruplo):
+        # Las funciones se declaran antes de llamarse; solo hay que agregar las nuevas al índice
+        if cuadruplo[1] not in self.indices_funciones and len(self.indices_funciones) < len(self.directorio_funciones):
+            for nombre in islice(self.directorio_funciones, len(self.indices_funciones), None):
+                self.indices_funciones[nombre] = len(self.indices_funciones)
+        return codificar_cuadruplo(cuadruplo, self.indices_funciones)
+
+    def escribir_bloque(self):
+        self.archivo.write(self.bloque)
+        self.bloque.clear()
+        self.inicio_bloque = self.total
+
+    def cerrar(self, constant_table, banderas=0):
+        """Escribe las tablas de funciones y constantes, las líneas y el encabezado."""
+        self.escribir_bloque()
+        funciones, _ = funciones_desde_directorio(self.directorio_funciones)
+        constantes = constantes_desde_tabla(constant_table)
+        seccion_funciones, seccion_constantes, cadenas = serializar_tablas(funciones, constantes)
+        self.archivo.write(seccion_funciones)
+        self.archivo.write(seccion_constantes)
+        self.archivo.write(cadenas)
+
+        while len(self.lineas) < self.total:
+            self.lineas.append(0)
+        self.lineas.archivo.seek(0)
+        shutil.copyfileobj(self.lineas.archivo, self.archivo)
+        self.lineas.archivo.close()
+
+        self.archivo.seek(self.origen)
+        self.archivo.write(empaquetar_encabezado(banderas, self.total, len(funciones), len(constantes),
+                                                 len(seccion_funciones), len(seccion_constantes), len(cadenas)))
+        self.archivo.seek(0, os.SEEK_END)
@@ -0,0 +1,115 @@
+import sys
+import json
+import time
+import contextlib
+import tracemalloc
+
+from antlr4.tree.Tree import TerminalNode
+
+from optimizador import es_temporal
+
+# Estadísticas de compilación (modo --estadisticas de main_patito.py).
+#
+# Por cada fase (léxico, sintáctico, semántico, emisión, ...) se mide el tiempo de reloj y el
+# pico de memoria con tracemalloc, y al terminar el análisis se cuentan los tokens, los nodos
+# del árbol sintáctico y los cuádruplos, temporales, constantes y funciones generados.
+# tracemalloc hace más lentas todas las fases; los tiempos sirven para compararlas entre sí.
+
+ETIQUETAS = {
+    'tokens': 'Tokens',
+    'nodos_arbol': 'Nodos del árbol',
+    'nodos_regla': 'Nodos de regla',
+    'cuadruplos': 'Cuádruplos',
+    'temporales': 'Temporales generados',
+    'direcciones_temporales': 'Direcciones temporales',
+    'constantes': 'Constantes',
+    'funciones': 'Funciones',
+}
+
+
+class Estadisticas:
+    def __init__(self, memoria=True):
+        self.fases = {}
+        self.conteos = {}
+        if memoria:
+            tracemalloc.start()
+
+    @contextlib.contextmanager
+    def fase(self, nombre):
+        """Mide el tiempo y el pico de memoria del bloque como la fase 'nombre'."""
+        midiendo_memoria = tracemalloc.is_tracing()
+        if midiendo_memoria:
+            tracemalloc.reset_peak()
+        inicio = time.perf_counter()
+        try:
+            yield
+        finally:
+            medida = {'tiempo': time.perf_counter() - inicio}
+            if midiendo_memoria:
+                medida['memoria_pico'] = tracemalloc.get_traced_memory()[1]
+            self.fases[nombre] = medida
+
+    def detener(self):
+        # Las fases siguientes solo miden tiempo (por ejemplo, la ejecución del programa)
+        if tracemalloc.is_tracing():
+            tracemalloc.stop()
+
+    def contar_analisis(self, token_stream, tree):
+        # El último token es EOF
+        self.conteos['tokens'] = len(token_stream.tokens) - 1
+        reglas, terminales = contar_nodos(tree)
+        self.conteos['nodos_arbol'] = reglas + terminales
+        self.conteos['nodos_regla'] = reglas
+
+    def contar_codigo(self, listener):
+        self.conteos['cuadruplos'] = len(listener.cuadruplos)
+        if isinstance(listener.cuadruplos, list):
+            self.conteos['temporales'] = sum(1 for cuadruplo in listener.cuadruplos
+                                             if isinstance(cuadruplo[3], int) and es_temporal(cuadruplo[3]))
+        else:
+            # Con emisión en flujo los cuádruplos ya no están en memoria; el emisor los contó
+            self.conteos['temporales'] = listener.cuadruplos.temporales
+        self.conteos['direcciones_temporales'] = sum(
+            sum(funcion['tamano_marco']['temporal'].values()) for funcion in listener.directorio_funciones.values())
+        self.conteos['constantes'] = len(listener.constant_table)
+        self.conteos['funciones'] = len(listener.directorio_funciones)
+
+    def como_diccionario(self):
+        return {'fases': self.fases, 'conteos': self.conteos,
+                'tiempo_total': sum(medida['tiempo'] for medida in self.fases.values())}
+
+    def informe(self, archivo=sys.stderr):
+        sys.stdout.flush()
+        total = sum(medida['tiempo'] for medida in self.fases.values()) or 1
+        print("==== Estadísticas de compilación ====", file=archivo)
+        print(f"  {'Fase':<12} {'Tiempo (ms)':>12} {'%':>6} {'Memoria pico (KB)':>18}", file=archivo)
+        for nombre, medida in self.fases.items():
+            memoria = medida['memoria_pico'] // 1024 if 'memoria_pico' in medida else '-'
+            print(f"  {nombre:<12} {medida['tiempo'] * 1000:>12.3f} {100 * medida['tiempo'] / total:>6.1f} "
+                  f"{memoria:>18}", file=archivo)
+        print(f"  {'total':<12} {total * 1000:>12.3f}", file=archivo)
+        for nombre, valor in self.conteos.items():
+            print(f"  {ETIQUETAS.get(nombre, nombre) + ':':<24} {valor}", file=archivo)
+
+    def escribir_json(self, ruta):
+        # '-' escribe en la salida estándar
+        if ruta == '-':
+            json.dump(self.como_diccionario(), sys.stdout, indent=2)
+            print()
+        else:
+            with open(ruta, 'w') as archivo:
+                json.dump(self.como_diccionario(), archivo, indent=2)
+
+
+def contar_nodos(tree):
+    """Regresa (reglas, terminales) del árbol sintáctico, sin recursión."""
+    reglas = terminales = 0
+    pendientes = [tree]
+    while pendientes:
+        nodo = pendientes.pop()
+        if isinstance(nodo, TerminalNode):
+            terminales += 1
+        else:
+            reglas += 1
+            pendientes.extend(nodo.getChildren())
+    return reglas, terminales
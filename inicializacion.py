@@ -0,0 +1,111 @@
+from VirtualMemory import VirtualMemory
+
+# Análisis de asignación definida: demuestra en tiempo de compilación que cada variable se
+# asigna antes de leerse.
+#
+# El listener lo alimenta mientras genera el código. Se mantiene el conjunto de direcciones
+# de variables inicializadas en todos los caminos que llegan al punto actual; como Patito
+# solo tiene si/sino y mientras (sin saltos arbitrarios ni retornos anticipados), los caminos
+# del grafo de flujo se siguen sobre la estructura del programa:
+#
+#   - '=' agrega la variable al conjunto.
+#   - Después de un si/sino quedan las variables inicializadas en las dos ramas.
+#   - El cuerpo de un mientras puede no ejecutarse: al salir queda el conjunto de antes.
+#   - Una función empieza con sus parámetros inicializados. Las globales que lee sin haberlas
+#     asignado antes se verifican en cada llamada, y las que asigna en todos sus caminos se
+#     agregan al conjunto de quien la llama.
+#
+# Las lecturas que pueden ocurrir sin inicializar se reportan como advertencias. Si no hay
+# ninguna, el programa se marca (bytecode.INICIALIZACION_VERIFICADA) y la máquina virtual
+# lo ejecuta sin revisar en cada instrucción si sus operandos están inicializados.
+
+RANGOS_GLOBALES = [(rango['start'], rango['end']) for rango in VirtualMemory().segments['global'].values()]
+
+
+def es_global(direccion):
+    return any(inicio <= direccion <= fin for inicio, fin in RANGOS_GLOBALES)
+
+
+class AnalisisInicializacion:
+    def __init__(self):
+        # Direcciones inicializadas en todos los caminos hasta el punto actual
+        self.inicializadas = set()
+        # Conjuntos guardados al entrar a un si, a un ciclo o a una función
+        self.pila = []
+        # Funciones cuyo cuerpo se está analizando (las declaraciones pueden anidarse)
+        self.funciones = []
+        # Por función: globales que lee sin asignarlas antes (dirección -> nombre) y
+        # globales que asigna en todos sus caminos
+        self.requeridas = {}
+        self.asignadas = {}
+        self.advertencias = []
+        # Una llamada a una función que aún se está analizando (salvo la recursión directa)
+        # no se puede verificar
+        self.incompleto = False
+
+    def verificado(self):
+        """True si todas las lecturas de variables están inicializadas en cualquier ejecución."""
+        return not self.advertencias and not self.incompleto
+
+    def leer(self, direccion, nombre, linea):
+        if direccion in self.inicializadas:
+            return
+        if self.funciones and es_global(direccion):
+            # Se verifica en cada llamada a la función
+            self.requeridas[self.funciones[-1]].setdefault(direccion, nombre)
+            return
+        self.advertencias.append(
+            f"Advertencia: La variable '{nombre}' puede leerse sin inicializar (línea {linea}).")
+        # Una advertencia por variable: las lecturas siguientes ya se reportaron
+        self.inicializadas.add(direccion)
+
+    def asignar(self, direccion):
+        self.inicializadas.add(direccion)
+
+    def entrar_condicion(self):
+        self.pila.append(set(self.inicializadas))
+
+    def entrar_sino(self):
+        # La rama 'sino' (aunque esté vacía) parte del conjunto de antes del 'si'
+        antes = self.pila.pop()
+        self.pila.append(self.inicializadas)
+        self.inicializadas = antes
+
+    def salir_condicion(self):
+        self.inicializadas &= self.pila.pop()
+
+    def entrar_ciclo(self):
+        self.pila.append(set(self.inicializadas))
+
+    def salir_ciclo(self):
+        self.inicializadas = self.pila.pop()
+
+    def entrar_funcion(self, nombre, parametros):
+        self.pila.append(self.inicializadas)
+        self.inicializadas = set(parametros)
+        self.funciones.append(nombre)
+        self.requeridas[nombre] = {}
+
+    def salir_funcion(self):
+        nombre = self.funciones.pop()
+        self.asignadas[nombre] = {direccion for direccion in self.inicializadas if es_global(direccion)}
+        self.inicializadas = self.pila.pop()
+
+    def llamar(self, nombre, linea):
+        if nombre in self.funciones:
+            # En la recursión directa las globales que lee la función ya se verificaron en la
+            # llamada que la inició, y siguen inicializadas; en otros casos no se sabe
+            if nombre != self.funciones[-1]:
+                self.incompleto = True
+            return
+        for direccion, variable in self.requeridas.get(nombre, {}).items():
+            if direccion in self.inicializadas:
+                continue
+            if self.funciones:
+                self.requeridas[self.funciones[-1]].setdefault(direccion, variable)
+            else:
+                self.advertencias.append(
+                    f"Advertencia: La función '{nombre}' lee la variable global '{variable}', que puede no "
+                    f"estar inicializada al llamarla (línea {linea}).")
+                self.inicializadas.add(direccion)
+        self.inicializadas |= self.asignadas.get(nombre, set())
@@ -0,0 +1,104 @@
+import io
+import os
+import glob
+import time
+import contextlib
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+
+from compilador import compilar, ErrorCompilacion
+from cache import CacheCompilacion
+
+# Compilación por lotes (subcomando 'lote' de main_patito.py).
+#
+# Los archivos se reparten entre un pool de procesos; cada proceso compila muchos archivos,
+# así que el intérprete, ANTLR y el DFA de predicción del parser se inicializan una sola vez
+# por proceso. Cada archivo escribe su propio programa compilado ('programa.patito' ->
+# 'programa.pbc', junto a la fuente o en un directorio de salida) y los mensajes del
+# compilador se guardan en el resultado en vez de imprimirse.
+
+ResultadoCompilacion = namedtuple('ResultadoCompilacion', ['ruta', 'destino', 'errores', 'segundos'])
+
+# Trabajos por envío al pool: suficientes para repartir la carga sin pagar la comunicación
+# entre procesos por cada archivo
+TRABAJOS_POR_TRABAJADOR = 4
+
+
+def expandir_fuentes(entradas):
+    """
+    Regresa las rutas de los archivos a compilar. Cada entrada puede ser un archivo, un
+    directorio (se buscan los .patito recursivamente) o un patrón glob.
+    """
+    rutas = []
+    for entrada in entradas:
+        if os.path.isdir(entrada):
+            rutas += sorted(glob.glob(os.path.join(entrada, '**', '*.patito'), recursive=True))
+        elif glob.has_magic(entrada):
+            rutas += sorted(glob.glob(entrada, recursive=True))
+        else:
+            rutas.append(entrada)
+    # Sin duplicados, conservando el orden
+    return list(dict.fromkeys(rutas))
+
+
+def rutas_salida(rutas, directorio=None):
+    """
+    Ruta del programa compilado de cada fuente: junto a la fuente o, con 'directorio',
+    dentro de él conservando la estructura relativa al directorio común de las fuentes.
+    """
+    if directorio is None:
+        return [os.path.splitext(ruta)[0] + '.pbc' for ruta in rutas]
+    if not rutas:
+        return []
+    base = os.path.commonpath([os.path.dirname(os.path.abspath(ruta)) for ruta in rutas])
+    return [os.path.join(directorio, os.path.splitext(os.path.relpath(os.path.abspath(ruta), base))[0] + '.pbc')
+            for ruta in rutas]
+
+
+def compilar_trabajo(trabajo):
+    """
+    Compila un archivo y escribe su programa. Corre dentro de los procesos del pool y
+    regresa un ResultadoCompilacion; 'errores' está vacío si la compilación fue exitosa.
+    """
+    ruta, destino, directorio_cache, optimizar, dos_etapas = trabajo
+    inicio = time.perf_counter()
+    # Los errores de sintaxis de ANTLR se escriben en stderr; se capturan con los demás
+    mensajes = io.StringIO()
+    try:
+        with open(ruta, 'r') as archivo:
+            fuente = archivo.read()
+        cache = CacheCompilacion(directorio_cache) if directorio_cache else None
+        with open(os.devnull, 'w') as nulo, contextlib.redirect_stdout(nulo), contextlib.redirect_stderr(mensajes):
+            programa = compilar(fuente, cache, optimizar, dos_etapas=dos_etapas)
+        os.makedirs(os.path.dirname(destino) or '.', exist_ok=True)
+        programa.guardar(destino)
+        errores = []
+    except ErrorCompilacion as e:
+        errores = mensajes.getvalue().splitlines() + e.errores
+    except OSError as e:
+        errores = [f"Error: No se pudo leer o escribir '{e.filename}': {e.strerror}."]
+    except Exception as e:
+        errores = mensajes.getvalue().splitlines() + [f"Error durante la compilación: {e}"]
+    return ResultadoCompilacion(ruta, destino, errores, time.perf_counter() - inicio)
+
+
+def compilar_lote(rutas, directorio_salida=None, trabajadores=None, directorio_cache=None, optimizar=False,
+                  dos_etapas=True):
+    """
+    Compila los archivos con 'trabajadores' procesos (por defecto uno por núcleo) y genera
+    un ResultadoCompilacion por archivo, en el orden de 'rutas'. Con un solo trabajador se
+    compila en este proceso.
+    """
+    trabajadores = trabajadores or os.cpu_count() or 1
+    trabajos = [(ruta, destino, directorio_cache, optimizar, dos_etapas)
+                for ruta, destino in zip(rutas, rutas_salida(rutas, directorio_salida))]
+
+    if trabajadores == 1 or len(trabajos) <= 1:
+        for trabajo in trabajos:
+            yield compilar_trabajo(trabajo)
+        return
+
+    trabajadores = min(trabajadores, len(trabajos))
+    tamano_envio = max(1, len(trabajos) // (trabajadores * TRABAJOS_POR_TRABAJADOR))
+    with ProcessPoolExecutor(max_workers=trabajadores) as pool:
+        yield from pool.map(compilar_trabajo, trabajos, chunksize=tamano_envio)
@@ -1,26 +1,75 @@
 import sys
-from antlr4 import *
-from PatitoLexer import PatitoLexer
-from PatitoParser import PatitoParser
-from PatitoCustomListener import PatitoCustomListener  # Importamos el Listener personalizado
+import time
+import argparse
+import contextlib
+from compilador import (analizar, compilar, compilar_a_archivo, generar_programa, opciones_compilacion,
+                        ErrorCompilacion)
+from cache import CacheCompilacion, DIRECTORIO_CACHE
+from virtual_machine import (ErrorEjecucion, agregar_opciones_traza, abrir_traza, agregar_opciones_perfil, crear_perfil,
+                             escribir_perfil, agregar_opcion_motor, validar_opciones_motor, agregar_opciones_salida,
+                             crear_salida)
+from traductor import ruta_en_directorio
+from estadisticas import Estadisticas
+from lote import expandir_fuentes, compilar_lote
+import traza as trazas
 import traceback
 
-def main():
-    """
-    Función principal para cargar la entrada desde un archivo, tokenizar y analizar sintácticamente el código.
-    """
-    if len(sys.argv) != 2:
-        print("Uso: python main_patito.py <archivo.patito>")
-        sys.exit(1)
+SUBCOMANDOS = ('compila', 'ejecuta', 'lote')
+
+def imprimir_diagnostico(listener):
+    # Imprimir el directorio de funciones
+    print("==== Directorio de Funciones ====\n")
+    for func_name, func_info in listener.directorio_funciones.items():
+        print(f"Función '{func_name}':")
+        print(f"  Tipo de Retorno: {func_info['tipo_retorno']}")
+        if func_info['parametros']:
+            print(f"  Parámetros:")
+            for param in func_info['parametros']:
+                print(f"    - {param['nombre']}: {param['tipo']}")
+        else:
+            print(f"  Parámetros: Ninguno")
+        print(f"  Tabla de Variables:")
+        for var_name, var_info in func_info['tabla_variables'].items():
+            print(f"    - {var_name}: Tipo: {var_info['tipo']}, Dirección: {var_info['direccion']}")
+        print(f"  Cuádruplo de Inicio: {func_info['cuadruplos_inicio']}")
+        print(f"  Tamaño de Marco: {func_info['tamano_marco']}\n")
+
+    # Imprimir las tablas de variables
+    print("==== Tablas de Variables ====\n")
+    print("Global:")
+    for var_name, var_info in listener.tabla_variables_global.items():
+        print(f"  - {var_name}: Tipo: {var_info['tipo']}, Dirección: {var_info['direccion']}")
+    for func_name, func_info in listener.directorio_funciones.items():
+        if func_name != 'global':
+            print(f"\n{func_name}:")
+            for var_name, var_info in func_info['tabla_variables'].items():
+                print(f"  - {var_name}: Tipo: {var_info['tipo']}, Dirección: {var_info['direccion']}")
+
+    # Imprimir la tabla de constantes
+    print("\n==== Tabla de Constantes ====\n")
+    for const_value, const_info in listener.constant_table.items():
+        print(f"  - {const_value}: Tipo: {const_info['tipo']}, Dirección: {const_info['direccion']}")
+
+    # Imprimir los cuádruplos
+    print("\n==== Cuádruplos Generados ====\n")
+    for idx, cuadruplo in enumerate(listener.cuadruplos):
+        operador, operando1, operando2, resultado = cuadruplo
+        print(f"{idx}: ({operador}, {operando1}, {operando2}, {resultado})")
+
+def imprimir_advertencias(advertencias):
+    # Lecturas de variables que pueden no estar inicializadas (ver inicializacion.py); no
+    # impiden la compilación
+    for advertencia in advertencias:
+        print(advertencia)
 
-    archivo_ruta = sys.argv[1]
+def leer_fuente(archivo_ruta):
     if not archivo_ruta.endswith('.patito'):
         print("Error: El archivo debe tener la extensión .patito")
         sys.exit(1)
 
     try:
         with open(archivo_ruta, 'r') as archivo:
-            input_stream = InputStream(archivo.read())
+            return archivo.read()
     except FileNotFoundError:
         print(f"Error: el archivo '{archivo_ruta}' no existe.")
         sys.exit(1)
@@ -28,85 +77,182 @@ def main():
         print(f"Error al leer el archivo '{archivo_ruta}': {e}")
         sys.exit(1)
 
+def compilar_fuente(fuente, funcion=analizar, *args):
+    """
+    Corre el front end sobre el código fuente; imprime los errores y termina si los hay.
+    """
     try:
-        lexer = PatitoLexer(input_stream)
-        token_stream = CommonTokenStream(lexer)
-        parser = PatitoParser(token_stream)
-        tree = parser.programa()
-
-        if parser.getNumberOfSyntaxErrors() > 0:
-            print("Error: Se encontraron errores de sintaxis en el archivo.")
-            sys.exit(1)
-        else:
-            # Crear instancia del Listener personalizado
-            listener = PatitoCustomListener()
-            walker = ParseTreeWalker()
-            walker.walk(listener, tree)
-            # Verificar si hay errores semánticos
-
-            if listener.errores:
-                for error in listener.errores:
-                    print(error)
-                sys.exit(1)
-            else:
-                print("Análisis semántico completado sin errores.\n")
-
-                # Imprimir el directorio de funciones
-                print("==== Directorio de Funciones ====\n")
-                for func_name, func_info in listener.directorio_funciones.items():
-                    print(f"Función '{func_name}':")
-                    print(f"  Tipo de Retorno: {func_info['tipo_retorno']}")
-                    if func_info['parametros']:
-                        print(f"  Parámetros:")
-                        for param in func_info['parametros']:
-                            print(f"    - {param['nombre']}: {param['tipo']}")
-                    else:
-                        print(f"  Parámetros: Ninguno")
-                    print(f"  Tabla de Variables:")
-                    for var_name, var_info in func_info['tabla_variables'].items():
-                        print(f"    - {var_name}: Tipo: {var_info['tipo']}, Dirección: {var_info['direccion']}")
-                    print(f"  Cuádruplo de Inicio: {func_info['cuadruplos_inicio']}\n")
-
-                # Imprimir las tablas de variables
-                print("==== Tablas de Variables ====\n")
-                print("Global:")
-                for var_name, var_info in listener.tabla_variables_global.items():
-                    print(f"  - {var_name}: Tipo: {var_info['tipo']}, Dirección: {var_info['direccion']}")
-                for func_name, func_info in listener.directorio_funciones.items():
-                    if func_name != 'global':
-                        print(f"\n{func_name}:")
-                        for var_name, var_info in func_info['tabla_variables'].items():
-                            print(f"  - {var_name}: Tipo: {var_info['tipo']}, Dirección: {var_info['direccion']}")
-
-                # Imprimir la tabla de constantes
-                print("\n==== Tabla de Constantes ====\n")
-                for const_value, const_info in listener.constant_table.items():
-                    print(f"  - {const_value}: Tipo: {const_info['tipo']}, Dirección: {const_info['direccion']}")
-
-                # Imprimir los cuádruplos
-                print("\n==== Cuádruplos Generados ====\n")
-                for idx, cuadruplo in enumerate(listener.cuadruplos):
-                    operador, operando1, operando2, resultado = cuadruplo
-                    print(f"{idx}: ({operador}, {operando1}, {operando2}, {resultado})")
-
-                # Escribir los cuádruplos en un archivo
-                with open('output.txt', 'w') as f:
-                    for idx, cuadruplo in enumerate(listener.cuadruplos):
-                        operador, operando1, operando2, resultado = cuadruplo
-                        f.write(f"{operador},{operando1},{operando2},{resultado}\n")
-
-                # Escribir la tabla de constantes en un archivo
-                with open('constants.txt', 'w') as f:
-                    for const_value, const_info in listener.constant_table.items():
-                        f.write(f"{const_info['direccion']},{const_value},{const_info['tipo']}\n")
-
-
-
+        return funcion(fuente, *args)
+    except ErrorCompilacion as e:
+        for error in e.errores:
+            print(error)
+        sys.exit(1)
     except Exception as e:
         print(f"Error durante el análisis léxico/sintáctico: {e}")
         traceback.print_exc()
         sys.exit(1)
 
+def abrir_cache(args):
+    return CacheCompilacion(args.cache) if args.cache else None
+
+def crear_estadisticas(args):
+    return Estadisticas() if args.estadisticas or args.estadisticas_json else None
+
+def escribir_estadisticas(args, estadisticas):
+    if estadisticas is None:
+        return
+    estadisticas.detener()
+    if args.estadisticas:
+        estadisticas.informe()
+    if args.estadisticas_json:
+        estadisticas.escribir_json(args.estadisticas_json)
+
+def comando_compila(args):
+    fuente = leer_fuente(args.archivo)
+    cache = abrir_cache(args)
+    estadisticas = crear_estadisticas(args)
+    if cache is not None:
+        clave = cache.clave(fuente, opciones_compilacion(args.optimiza))
+        programa = cache.obtener(clave)
+        if programa is not None:
+            # Las advertencias se guardan con la entrada y se muestran igual que al compilar
+            imprimir_advertencias(cache.obtener_advertencias(clave))
+            if not args.silencioso:
+                print("Programa obtenido de la caché de compilación.")
+            programa.guardar('output.pbc')
+            escribir_estadisticas(args, estadisticas)
+            return
+
+    if args.diagnostico:
+        # El diagnóstico necesita los cuádruplos en memoria
+        listener = compilar_fuente(fuente, analizar, args.optimiza, estadisticas, args.dos_etapas)
+        imprimir_advertencias(listener.advertencias)
+        print("Análisis semántico completado sin errores.\n")
+        imprimir_diagnostico(listener)
+        # Escribir el programa compilado (instrucciones, funciones y constantes) en formato binario
+        with estadisticas.fase('emision') if estadisticas is not None else contextlib.nullcontext():
+            generar_programa(listener).guardar('output.pbc')
+    else:
+        # Las instrucciones se escriben en 'output.pbc' conforme se generan
+        listener = compilar_fuente(fuente, compilar_a_archivo, 'output.pbc', args.optimiza, estadisticas,
+                                   args.dos_etapas)
+        imprimir_advertencias(listener.advertencias)
+        if not args.silencioso:
+            print("Análisis semántico completado sin errores.")
+    if cache is not None:
+        cache.guardar_archivo(clave, 'output.pbc', listener.advertencias)
+    escribir_estadisticas(args, estadisticas)
+
+def comando_ejecuta(args):
+    # Compilar y ejecutar en el mismo proceso, sin archivos intermedios
+    fuente = leer_fuente(args.archivo)
+    estadisticas = crear_estadisticas(args)
+    programa = compilar_fuente(fuente, compilar, abrir_cache(args), args.optimiza, estadisticas, args.dos_etapas)
+    # Las estadísticas son de la compilación; se escriben antes de la salida del programa
+    escribir_estadisticas(args, estadisticas)
+    # Con caché, la traducción del motor 'traductor' también se guarda en el directorio de la caché
+    ruta_traduccion = ruta_en_directorio(args.cache, programa) if args.cache and args.motor == 'traductor' else None
+    perfil = crear_perfil(args)
+    try:
+        with abrir_traza(args) as traza:
+            programa.ejecutar(args.verbose, traza, args.motor, ruta_traduccion, args.superinstrucciones, perfil,
+                              crear_salida(args))
+    except ErrorEjecucion as e:
+        print(e)
+        if e.traza:
+            trazas.imprimir_registros(e.traza, programa.nombres_funciones())
+        sys.exit(1)
+    finally:
+        # Con el código fuente, el informe muestra el texto de las líneas más costosas
+        escribir_perfil(args, perfil, fuente)
+
+def comando_lote(args):
+    rutas = expandir_fuentes(args.entradas)
+    if not rutas:
+        print("Error: No se encontraron archivos .patito para compilar.")
+        sys.exit(1)
+
+    inicio = time.perf_counter()
+    resultados = []
+    for resultado in compilar_lote(rutas, args.salida, args.trabajadores, args.cache, args.optimiza, args.dos_etapas):
+        estado = 'ok' if not resultado.errores else 'ERROR'
+        print(f"  {estado:<6} {resultado.segundos * 1000:>10.1f} ms  {resultado.ruta} -> {resultado.destino}")
+        resultados.append(resultado)
+    total = time.perf_counter() - inicio
+
+    fallidos = [resultado for resultado in resultados if resultado.errores]
+    for resultado in fallidos:
+        print(f"\nErrores en '{resultado.ruta}':")
+        for error in resultado.errores:
+            print(f"  {error}")
+    print(f"\n{len(resultados)} archivos, {len(fallidos)} con errores; {total:.2f} s en total "
+          f"({sum(resultado.segundos for resultado in resultados):.2f} s de compilación).")
+    if fallidos:
+        sys.exit(1)
+
+def main():
+    """
+    Función principal para cargar la entrada desde un archivo, tokenizar y analizar sintácticamente el código.
+
+    Uso:
+        python main_patito.py [compila] <archivo.patito>   compila y escribe 'output.pbc'
+        python main_patito.py ejecuta <archivo.patito>     compila y ejecuta en el mismo proceso
+        python main_patito.py lote <archivos o directorios> compila muchos archivos en paralelo
+    """
+    parser = argparse.ArgumentParser(prog='main_patito.py', description='Compilador de Patito.')
+    subparsers = parser.add_subparsers(dest='comando', required=True)
+
+    compila = subparsers.add_parser('compila', help="Compila el archivo y escribe 'output.pbc'.")
+    compila.add_argument('archivo', help='Archivo .patito a compilar.')
+    compila.add_argument('-d', '--diagnostico', action='store_true',
+                         help='Muestra el directorio de funciones, las tablas de variables y constantes y los '
+                              'cuádruplos generados.')
+    compila.add_argument('-s', '--silencioso', action='store_true',
+                         help='No muestra mensajes si la compilación termina sin errores.')
+    compila.set_defaults(funcion=comando_compila)
+
+    ejecuta = subparsers.add_parser('ejecuta', help='Compila y ejecuta el archivo en el mismo proceso.')
+    ejecuta.add_argument('archivo', help='Archivo .patito a ejecutar.')
+    ejecuta.add_argument('-v', '--verbose', action='store_true', help='Activa el modo detallado de la máquina virtual.')
+    agregar_opciones_traza(ejecuta)
+    agregar_opciones_perfil(ejecuta)
+    agregar_opcion_motor(ejecuta)
+    agregar_opciones_salida(ejecuta)
+    ejecuta.set_defaults(funcion=comando_ejecuta)
+
+    lote = subparsers.add_parser('lote', help='Compila muchos archivos en paralelo; cada uno escribe su propio .pbc.')
+    lote.add_argument('entradas', nargs='+', help='Archivos .patito, directorios (recursivos) o patrones glob.')
+    lote.add_argument('-j', '--trabajadores', type=int, default=None,
+                      help='Procesos de compilación (por defecto uno por núcleo).')
+    lote.add_argument('-o', '--salida', metavar='DIRECTORIO',
+                      help='Directorio de los programas compilados (por defecto junto a cada fuente).')
+    lote.set_defaults(funcion=comando_lote)
+
+    for subparser in (compila, ejecuta, lote):
+        subparser.add_argument('--cache', nargs='?', const=DIRECTORIO_CACHE, default=None, metavar='DIRECTORIO',
+                               help=f"Reutiliza compilaciones previas guardadas en DIRECTORIO (por defecto '{DIRECTORIO_CACHE}').")
+        subparser.add_argument('-O', '--optimiza', action='store_true',
+                               help='Pliega constantes y simplifica identidades algebraicas.')
+        subparser.add_argument('--analisis-ll', dest='dos_etapas', action='store_false',
+                               help='Analiza con predicción LL completa en vez de intentar primero SLL.')
+
+    for subparser in (compila, ejecuta):
+        subparser.add_argument('--estadisticas', '--stats', action='store_true',
+                               help='Muestra el tiempo y el pico de memoria de cada fase de la compilación y la '
+                                    'cantidad de tokens, nodos, cuádruplos, temporales y constantes.')
+        subparser.add_argument('--estadisticas-json', metavar='ARCHIVO',
+                               help="Escribe las estadísticas de compilación en JSON ('-' para la salida estándar).")
+
+    argumentos = sys.argv[1:]
+    # Compatibilidad: 'python main_patito.py <archivo.patito>' equivale a 'compila'
+    if argumentos and argumentos[0] not in SUBCOMANDOS + ('-h', '--help'):
+        argumentos = ['compila'] + argumentos
+
+    args = parser.parse_args(argumentos)
+    if args.comando == 'ejecuta':
+        validar_opciones_motor(ejecuta, args)
+    args.funcion(args)
+
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,216 @@
+# Códigos de operación enteros que usa la máquina virtual de Patito.
+# El compilador sigue generando cuádruplos con el operador como cadena; la
+# máquina virtual los decodifica una sola vez a estos códigos al cargar el programa.
+
+GOTO = 0
+GOTOF = 1
+MAIN_START = 2
+ERA = 3
+PARAM = 4
+GOSUB = 5
+ENDFUNC = 6
+# Operaciones aritméticas y relacionales tipadas: el compilador conoce el tipo de los operandos
+# (ver el cubo semántico) y genera la variante para 'entero' o 'flotante'. Las operaciones entre
+# un entero y un flotante convierten antes el entero con A_FLOTANTE.
+SUMA_ENTERO = 7
+RESTA_ENTERO = 8
+MULT_ENTERO = 9
+DIV_ENTERO = 10
+MAYOR_ENTERO = 11
+MENOR_ENTERO = 12
+MAYOR_IGUAL_ENTERO = 13
+MENOR_IGUAL_ENTERO = 14
+IGUAL_ENTERO = 15
+DIFERENTE_ENTERO = 16
+ASIGNA = 17
+PRINT = 18
+END = 19
+
+# Comparación y salto fusionados: GOTOF<op> salta si la comparación es falsa y
+# GOTOV<op> salta si es verdadera (los genera el optimizador de flujo de control)
+GOTOF_MAYOR_ENTERO = 20
+GOTOF_MENOR_ENTERO = 21
+GOTOF_MAYOR_IGUAL_ENTERO = 22
+GOTOF_MENOR_IGUAL_ENTERO = 23
+GOTOF_IGUAL_ENTERO = 24
+GOTOF_DIFERENTE_ENTERO = 25
+GOTOV_MAYOR_ENTERO = 26
+GOTOV_MENOR_ENTERO = 27
+GOTOV_MAYOR_IGUAL_ENTERO = 28
+GOTOV_MENOR_IGUAL_ENTERO = 29
+GOTOV_IGUAL_ENTERO = 30
+GOTOV_DIFERENTE_ENTERO = 31
+
+SUMA_FLOTANTE = 32
+RESTA_FLOTANTE = 33
+MULT_FLOTANTE = 34
+DIV_FLOTANTE = 35
+MAYOR_FLOTANTE = 36
+MENOR_FLOTANTE = 37
+MAYOR_IGUAL_FLOTANTE = 38
+MENOR_IGUAL_FLOTANTE = 39
+IGUAL_FLOTANTE = 40
+DIFERENTE_FLOTANTE = 41
+
+GOTOF_MAYOR_FLOTANTE = 42
+GOTOF_MENOR_FLOTANTE = 43
+GOTOF_MAYOR_IGUAL_FLOTANTE = 44
+GOTOF_MENOR_IGUAL_FLOTANTE = 45
+GOTOF_IGUAL_FLOTANTE = 46
+GOTOF_DIFERENTE_FLOTANTE = 47
+GOTOV_MAYOR_FLOTANTE = 48
+GOTOV_MENOR_FLOTANTE = 49
+GOTOV_MAYOR_IGUAL_FLOTANTE = 50
+GOTOV_MENOR_IGUAL_FLOTANTE = 51
+GOTOV_IGUAL_FLOTANTE = 52
+GOTOV_DIFERENTE_FLOTANTE = 53
+
+# Conversión explícita de entero a flotante
+A_FLOTANTE = 54
+
+# Superinstrucciones: las genera la máquina virtual al cargar un programa (ver
+# superinstrucciones.py) y no aparecen en el formato binario
+SUMA_ENTERO_ASIGNA = 55
+RESTA_ENTERO_ASIGNA = 56
+MULT_ENTERO_ASIGNA = 57
+DIV_ENTERO_ASIGNA = 58
+SUMA_FLOTANTE_ASIGNA = 59
+RESTA_FLOTANTE_ASIGNA = 60
+MULT_FLOTANTE_ASIGNA = 61
+DIV_FLOTANTE_ASIGNA = 62
+MAYOR_ENTERO_GOTOF = 63
+MENOR_ENTERO_GOTOF = 64
+MAYOR_IGUAL_ENTERO_GOTOF = 65
+MENOR_IGUAL_ENTERO_GOTOF = 66
+IGUAL_ENTERO_GOTOF = 67
+DIFERENTE_ENTERO_GOTOF = 68
+MAYOR_FLOTANTE_GOTOF = 69
+MENOR_FLOTANTE_GOTOF = 70
+MAYOR_IGUAL_FLOTANTE_GOTOF = 71
+MENOR_IGUAL_FLOTANTE_GOTOF = 72
+IGUAL_FLOTANTE_GOTOF = 73
+DIFERENTE_FLOTANTE_GOTOF = 74
+LLAMADA = 75
+ASIGNA_DOBLE = 76
+IMPRIME_VARIOS = 77
+
+# Valor que representa un operando vacío (None en el cuádruplo)
+SIN_OPERANDO = -1
+
+# Tipos de las operaciones tipadas y sufijo que llevan en el operador del cuádruplo
+# ('+e' suma enteros, 'GOTOF<f' compara flotantes y salta si la comparación es falsa)
+TIPOS_OPERACION = ('entero', 'flotante')
+SUFIJOS_TIPO = {'entero': 'e', 'flotante': 'f'}
+
+ARITMETICOS = ('+', '-', '*', '/')
+RELACIONALES = ('>', '<', '>=', '<=', '==', '!=')
+
+# Operador base -> código de operación por tipo (en el orden de TIPOS_OPERACION)
+OPERACIONES_TIPADAS = {
+    '+': (SUMA_ENTERO, SUMA_FLOTANTE),
+    '-': (RESTA_ENTERO, RESTA_FLOTANTE),
+    '*': (MULT_ENTERO, MULT_FLOTANTE),
+    '/': (DIV_ENTERO, DIV_FLOTANTE),
+    '>': (MAYOR_ENTERO, MAYOR_FLOTANTE),
+    '<': (MENOR_ENTERO, MENOR_FLOTANTE),
+    '>=': (MAYOR_IGUAL_ENTERO, MAYOR_IGUAL_FLOTANTE),
+    '<=': (MENOR_IGUAL_ENTERO, MENOR_IGUAL_FLOTANTE),
+    '==': (IGUAL_ENTERO, IGUAL_FLOTANTE),
+    '!=': (DIFERENTE_ENTERO, DIFERENTE_FLOTANTE),
+}
+SALTOS_SI_FALSO = {
+    '>': (GOTOF_MAYOR_ENTERO, GOTOF_MAYOR_FLOTANTE),
+    '<': (GOTOF_MENOR_ENTERO, GOTOF_MENOR_FLOTANTE),
+    '>=': (GOTOF_MAYOR_IGUAL_ENTERO, GOTOF_MAYOR_IGUAL_FLOTANTE),
+    '<=': (GOTOF_MENOR_IGUAL_ENTERO, GOTOF_MENOR_IGUAL_FLOTANTE),
+    '==': (GOTOF_IGUAL_ENTERO, GOTOF_IGUAL_FLOTANTE),
+    '!=': (GOTOF_DIFERENTE_ENTERO, GOTOF_DIFERENTE_FLOTANTE),
+}
+SALTOS_SI_VERDADERO = {
+    '>': (GOTOV_MAYOR_ENTERO, GOTOV_MAYOR_FLOTANTE),
+    '<': (GOTOV_MENOR_ENTERO, GOTOV_MENOR_FLOTANTE),
+    '>=': (GOTOV_MAYOR_IGUAL_ENTERO, GOTOV_MAYOR_IGUAL_FLOTANTE),
+    '<=': (GOTOV_MENOR_IGUAL_ENTERO, GOTOV_MENOR_IGUAL_FLOTANTE),
+    '==': (GOTOV_IGUAL_ENTERO, GOTOV_IGUAL_FLOTANTE),
+    '!=': (GOTOV_DIFERENTE_ENTERO, GOTOV_DIFERENTE_FLOTANTE),
+}
+
+# Código tipado -> (operador base, tipo); para los saltos fusionados, el de su comparación
+OPERADOR_Y_TIPO = {
+    codigo: (operador, tipo)
+    for tabla in (OPERACIONES_TIPADAS, SALTOS_SI_FALSO, SALTOS_SI_VERDADERO)
+    for operador, codigos in tabla.items()
+    for tipo, codigo in zip(TIPOS_OPERACION, codigos)
+}
+
+# Operador del cuádruplo -> código de operación
+CODIGOS = {
+    'GOTO': GOTO,
+    'GOTOF': GOTOF,
+    'MAIN_START': MAIN_START,
+    'ERA': ERA,
+    'PARAM': PARAM,
+    'GOSUB': GOSUB,
+    'ENDFUNC': ENDFUNC,
+    '=': ASIGNA,
+    'PRINT': PRINT,
+    'END': END,
+    'A_FLOTANTE': A_FLOTANTE,
+}
+CODIGOS.update({
+    prefijo + operador + SUFIJOS_TIPO[tipo]: codigo
+    for prefijo, tabla in (('', OPERACIONES_TIPADAS), ('GOTOF', SALTOS_SI_FALSO), ('GOTOV', SALTOS_SI_VERDADERO))
+    for operador, codigos in tabla.items()
+    for tipo, codigo in zip(TIPOS_OPERACION, codigos)
+})
+
+# Código de operación -> operador del cuádruplo (para mensajes y depuración)
+NOMBRES = {codigo: operador for operador, codigo in CODIGOS.items()}
+
+# Nombres de las superinstrucciones (para mensajes y depuración)
+NOMBRES_SUPERINSTRUCCIONES = {
+    SUMA_ENTERO_ASIGNA: '+e;=',
+    RESTA_ENTERO_ASIGNA: '-e;=',
+    MULT_ENTERO_ASIGNA: '*e;=',
+    DIV_ENTERO_ASIGNA: '/e;=',
+    SUMA_FLOTANTE_ASIGNA: '+f;=',
+    RESTA_FLOTANTE_ASIGNA: '-f;=',
+    MULT_FLOTANTE_ASIGNA: '*f;=',
+    DIV_FLOTANTE_ASIGNA: '/f;=',
+    MAYOR_ENTERO_GOTOF: '>e;GOTOF',
+    MENOR_ENTERO_GOTOF: '<e;GOTOF',
+    MAYOR_IGUAL_ENTERO_GOTOF: '>=e;GOTOF',
+    MENOR_IGUAL_ENTERO_GOTOF: '<=e;GOTOF',
+    IGUAL_ENTERO_GOTOF: '==e;GOTOF',
+    DIFERENTE_ENTERO_GOTOF: '!=e;GOTOF',
+    MAYOR_FLOTANTE_GOTOF: '>f;GOTOF',
+    MENOR_FLOTANTE_GOTOF: '<f;GOTOF',
+    MAYOR_IGUAL_FLOTANTE_GOTOF: '>=f;GOTOF',
+    MENOR_IGUAL_FLOTANTE_GOTOF: '<=f;GOTOF',
+    IGUAL_FLOTANTE_GOTOF: '==f;GOTOF',
+    DIFERENTE_FLOTANTE_GOTOF: '!=f;GOTOF',
+    LLAMADA: 'ERA;PARAM;GOSUB',
+    ASIGNA_DOBLE: '=;=',
+    IMPRIME_VARIOS: 'PRINT*',
+}
+
+# Operaciones cuyo primer operando es el nombre de una función
+OPERACIONES_CON_FUNCION = (ERA, GOSUB)
+
+# Saltos condicionales fusionados con una comparación
+SALTOS_FUSIONADOS = tuple(codigo for tabla in (SALTOS_SI_FALSO, SALTOS_SI_VERDADERO)
+                          for codigos in tabla.values() for codigo in codigos)
+
+# Operaciones cuyo resultado es el índice de un cuádruplo
+OPERACIONES_CON_SALTO = (GOTO, GOTOF, GOSUB) + SALTOS_FUSIONADOS
+
+# Posiciones (1 = operando1, 2 = operando2, 3 = resultado) que contienen direcciones de memoria
+OPERANDOS_DIRECCION = {
+    GOTOF: (1,),
+    PARAM: (1, 3),
+    ASIGNA: (1, 3),
+    PRINT: (1,),
+    A_FLOTANTE: (1, 3),
+    **{codigo: (1, 2, 3) for codigos in OPERACIONES_TIPADAS.values() for codigo in codigos},
+    **{codigo: (1, 2) for codigo in SALTOS_FUSIONADOS},
+}
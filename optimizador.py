@@ -0,0 +1,246 @@
+import operator
+
+from VirtualMemory import VirtualMemory
+from opcodes import RELACIONALES, SUFIJOS_TIPO
+
+# Optimizaciones del código intermedio de Patito.
+#
+# Plegado de constantes y simplificación algebraica: el listener las aplica al generar
+# cada cuádruplo de operación cuando se compila con optimizar=True, de modo que las
+# subexpresiones constantes no generan cuádruplo ni ocupan un temporal.
+#
+# Flujo de control: optimizar_flujo se aplica a la lista completa de cuádruplos al
+# terminar el programa (también con optimizar=True).
+
+OPERACIONES = {
+    '+': operator.add,
+    '-': operator.sub,
+    '*': operator.mul,
+    '/': operator.truediv,
+    '//': operator.floordiv,
+    '>': operator.gt,
+    '<': operator.lt,
+    '>=': operator.ge,
+    '<=': operator.le,
+    '==': operator.eq,
+    '!=': operator.ne,
+}
+
+# Rango de las constantes enteras en el formato binario (int64)
+ENTERO_MINIMO = -2 ** 63
+ENTERO_MAXIMO = 2 ** 63 - 1
+
+
+def evaluar_operacion(operador, valor1, valor2, tipo_resultado):
+    """
+    Calcula en tiempo de compilación el resultado de una operación entre constantes,
+    con la misma semántica que la máquina virtual. Regresa None si la operación no
+    se puede plegar (división entre cero, resultado que no cabe en el tipo, etc.).
+    """
+    if operador == '/':
+        # La división entre cero se deja como error de ejecución
+        if valor2 == 0:
+            return None
+        if tipo_resultado == 'entero':
+            operador = '//'
+    resultado = OPERACIONES[operador](valor1, valor2)
+    if tipo_resultado == 'entero' and not ENTERO_MINIMO <= resultado <= ENTERO_MAXIMO:
+        return None
+    if tipo_resultado == 'flotante':
+        resultado = float(resultado)
+    return resultado
+
+
+def simplificar_identidad(operador, izquierda, tipo_izquierda, derecha, tipo_derecha, tipo_resultado, valores):
+    """
+    Simplifica identidades algebraicas con un operando constante. 'valores' mapea las
+    direcciones de constantes a su valor. Regresa ('operando', dirección) si la operación
+    equivale a uno de sus operandos, ('constante', valor) si equivale a una constante,
+    o None si no hay simplificación exacta.
+    """
+    valor_izquierda = valores.get(izquierda)
+    valor_derecha = valores.get(derecha)
+
+    # x + 0, 0 + x y x * 0, 0 * x solo para enteros: con flotantes cambian el signo del cero
+    if operador == '+' and tipo_resultado == 'entero':
+        if valor_derecha == 0 and tipo_izquierda == tipo_resultado:
+            return ('operando', izquierda)
+        if valor_izquierda == 0 and tipo_derecha == tipo_resultado:
+            return ('operando', derecha)
+    elif operador == '-':
+        if valor_derecha == 0 and tipo_izquierda == tipo_resultado:
+            return ('operando', izquierda)
+    elif operador == '*':
+        if valor_derecha == 1 and tipo_izquierda == tipo_resultado:
+            return ('operando', izquierda)
+        if valor_izquierda == 1 and tipo_derecha == tipo_resultado:
+            return ('operando', derecha)
+        # x * 0 descarta la lectura de x: solo si x es una constante o un temporal, que
+        # siempre tienen valor; con una variable se conserva el error de no inicializada
+        if tipo_resultado == 'entero' and ((valor_derecha == 0 and siempre_inicializado(izquierda, valores))
+                                           or (valor_izquierda == 0 and siempre_inicializado(derecha, valores))):
+            return ('constante', 0)
+    elif operador == '/':
+        if valor_derecha == 1 and tipo_izquierda == tipo_resultado:
+            return ('operando', izquierda)
+    return None
+
+
+def siempre_inicializado(direccion, valores):
+    return direccion in valores or es_temporal(direccion)
+
+
+def texto_constante(valor, tipo):
+    # Texto con el que se registra una constante calculada en la tabla de constantes
+    if tipo == 'flotante':
+        return repr(float(valor))
+    return str(valor)
+
+
+# Operadores de los cuádruplos de comparación, uno por tipo de los operandos ('<e', '<f', ...)
+RELACIONALES_TIPADOS = tuple(op + sufijo for op in RELACIONALES for sufijo in SUFIJOS_TIPO.values())
+
+# Saltos cuyo resultado es el índice del cuádruplo destino
+SALTOS = (('GOTO', 'GOTOF') + tuple('GOTOF' + op for op in RELACIONALES_TIPADOS)
+          + tuple('GOTOV' + op for op in RELACIONALES_TIPADOS))
+
+RANGOS_TEMPORALES = [(rango['start'], rango['end']) for rango in VirtualMemory().segments['temporal'].values()]
+
+
+def es_temporal(direccion):
+    return any(inicio <= direccion <= fin for inicio, fin in RANGOS_TEMPORALES)
+
+
+def optimizar_flujo(cuadruplos, directorio_funciones, valores_constantes, lineas):
+    """
+    Optimiza el flujo de control de un programa completo y regresa la nueva lista de
+    cuádruplos y la línea de cada uno; actualiza 'cuadruplos_inicio' en el directorio
+    de funciones.
+
+      - GOTOF sobre una constante se convierte en GOTO (o desaparece si es verdadera).
+      - Una comparación seguida del GOTOF que consume su temporal se fusiona en un
+        solo salto condicional ('GOTOF<e', a, b, destino).
+      - Las cadenas de saltos se siguen hasta su destino final.
+      - El GOTO de regreso de un ciclo se reemplaza por la condición invertida
+        ('GOTOV<e', a, b, cuerpo), de modo que cada iteración ejecuta un solo salto.
+      - Se eliminan los GOTO al siguiente cuádruplo y el código inalcanzable.
+    """
+    cuadruplos = list(cuadruplos)
+    inicios = [info['cuadruplos_inicio'] for info in directorio_funciones.values()
+               if info['cuadruplos_inicio'] is not None]
+
+    # Condiciones constantes
+    for indice, (operador, operando1, operando2, resultado) in enumerate(cuadruplos):
+        if operador == 'GOTOF' and operando1 in valores_constantes:
+            destino = indice + 1 if valores_constantes[operando1] else resultado
+            cuadruplos[indice] = ('GOTO', None, None, destino)
+
+    # Fusión de comparación y GOTOF; el GOTOF fusionado no puede ser destino de un salto
+    destinos = {cuadruplo[3] for cuadruplo in cuadruplos if cuadruplo[0] in SALTOS}
+    fusionados = set()
+    for indice in range(len(cuadruplos) - 1):
+        operador, operando1, operando2, resultado = cuadruplos[indice]
+        siguiente = cuadruplos[indice + 1]
+        if (operador in RELACIONALES_TIPADOS and siguiente[0] == 'GOTOF' and siguiente[1] == resultado
+                and es_temporal(resultado) and indice + 1 not in destinos):
+            cuadruplos[indice] = ('GOTOF' + operador, operando1, operando2, siguiente[3])
+            fusionados.add(indice + 1)
+
+    # Seguir las cadenas de GOTO
+    for indice, (operador, operando1, operando2, resultado) in enumerate(cuadruplos):
+        if operador in SALTOS and indice not in fusionados:
+            cuadruplos[indice] = (operador, operando1, operando2, destino_final(cuadruplos, resultado))
+
+    # Inversión de ciclos: 'GOTO c' hacia 'c: GOTOF<op> a b fin' cuando fin es a donde llega el GOTO
+    # si no saltara
+    for indice, (operador, _, _, resultado) in enumerate(cuadruplos):
+        if operador == 'GOTO' and indice not in fusionados and resultado < len(cuadruplos):
+            condicion = cuadruplos[resultado]
+            if (condicion[0].startswith('GOTOF') and condicion[0] != 'GOTOF'
+                    and condicion[3] == destino_final(cuadruplos, indice + 1)):
+                cuadruplos[indice] = ('GOTOV' + condicion[0][5:], condicion[1], condicion[2], resultado + 1)
+
+    # Eliminar código inalcanzable y GOTO al siguiente cuádruplo hasta no haber cambios
+    eliminados = set(fusionados)
+    while True:
+        alcanzables = cuadruplos_alcanzables(cuadruplos, eliminados, [0] + inicios)
+        nuevos = {indice for indice in range(len(cuadruplos)) if indice not in alcanzables} - eliminados
+        siguiente = len(cuadruplos)
+        for indice in range(len(cuadruplos) - 1, -1, -1):
+            if indice in eliminados or indice in nuevos:
+                continue
+            if cuadruplos[indice][0] == 'GOTO' and cuadruplos[indice][3] == siguiente:
+                nuevos.add(indice)
+            else:
+                siguiente = indice
+        if not nuevos:
+            break
+        eliminados |= nuevos
+        # Un salto a un cuádruplo eliminado continúa en el siguiente que se conserva
+        for indice, (operador, operando1, operando2, resultado) in enumerate(cuadruplos):
+            if operador in SALTOS and indice not in eliminados and resultado in eliminados:
+                cuadruplos[indice] = (operador, operando1, operando2,
+                                      siguiente_conservado(resultado, eliminados, len(cuadruplos)))
+
+    return compactar(cuadruplos, eliminados, directorio_funciones), [
+        linea for indice, linea in enumerate(lineas) if indice not in eliminados]
+
+
+def destino_final(cuadruplos, destino):
+    # Sigue una cadena de GOTO; se detiene si encuentra un ciclo
+    visitados = set()
+    while destino < len(cuadruplos) and cuadruplos[destino][0] == 'GOTO' and destino not in visitados:
+        visitados.add(destino)
+        destino = cuadruplos[destino][3]
+    return destino
+
+
+def siguiente_conservado(indice, eliminados, total):
+    while indice < total and indice in eliminados:
+        indice += 1
+    return indice
+
+
+def cuadruplos_alcanzables(cuadruplos, eliminados, raices):
+    alcanzables = set()
+    pendientes = [siguiente_conservado(raiz, eliminados, len(cuadruplos)) for raiz in raices]
+    while pendientes:
+        indice = pendientes.pop()
+        if indice >= len(cuadruplos) or indice in alcanzables:
+            continue
+        alcanzables.add(indice)
+        operador, _, _, resultado = cuadruplos[indice]
+        if operador in ('END', 'ENDFUNC'):
+            continue
+        if operador in SALTOS:
+            pendientes.append(resultado)
+        if operador != 'GOTO':
+            pendientes.append(siguiente_conservado(indice + 1, eliminados, len(cuadruplos)))
+    return alcanzables
+
+
+def compactar(cuadruplos, eliminados, directorio_funciones):
+    """
+    Quita los cuádruplos eliminados y renumera los destinos de los saltos, de GOSUB y
+    el cuádruplo de inicio de cada función.
+    """
+    nuevo_indice = []
+    contador = 0
+    for indice in range(len(cuadruplos) + 1):
+        nuevo_indice.append(contador)
+        if indice < len(cuadruplos) and indice not in eliminados:
+            contador += 1
+
+    resultado = []
+    for indice, (operador, operando1, operando2, destino) in enumerate(cuadruplos):
+        if indice in eliminados:
+            continue
+        if operador in SALTOS or operador == 'GOSUB':
+            destino = nuevo_indice[siguiente_conservado(destino, eliminados, len(cuadruplos))]
+        resultado.append((operador, operando1, operando2, destino))
+
+    for info in directorio_funciones.values():
+        if info['cuadruplos_inicio'] is not None:
+            info['cuadruplos_inicio'] = nuevo_indice[
+                siguiente_conservado(info['cuadruplos_inicio'], eliminados, len(cuadruplos))]
+    return resultado
@@ -0,0 +1,135 @@
+import sys
+from collections import defaultdict
+
+# Perfil de ejecución de la máquina virtual.
+#
+# Con un Perfil, la máquina virtual mide cada instrucción ejecutada y acumula:
+#   - ejecuciones y tiempo por índice de cuádruplo (y por línea del código fuente),
+#   - llamadas, tiempo propio y tiempo total por función,
+#   - tiempo por pila de llamadas, que se escribe en formato de pilas colapsadas
+#     ('global;f;g <nanosegundos>' por línea) para herramientas de flame graphs
+#     como flamegraph.pl o speedscope.
+
+
+class Perfil:
+    def __init__(self):
+        self.conteos = []
+        self.tiempos = []
+        self.llamadas = []
+        # Pila de llamadas (tupla de índices de función) -> nanosegundos
+        self.pilas = defaultdict(int)
+        self.pila = [0]
+        self.programa = None
+
+    def iniciar(self, programa, total):
+        """Prepara los contadores para un programa con 'total' instrucciones (incluyendo el END final)."""
+        self.programa = programa
+        self.conteos = [0] * total
+        self.tiempos = [0] * total
+        self.llamadas = [0] * len(programa.funciones)
+        self.llamadas[0] = 1
+        self.funcion_de = programa.funcion_de_cuadruplos(total)
+        self.pilas = defaultdict(int)
+        self.pila = [0]
+
+    def pila_actual(self):
+        return tuple(self.pila)
+
+    def entrar(self, funcion):
+        # Regresa la nueva pila de llamadas
+        self.llamadas[funcion] += 1
+        self.pila.append(funcion)
+        return self.pila_actual()
+
+    def salir(self):
+        if len(self.pila) > 1:
+            self.pila.pop()
+        return self.pila_actual()
+
+    def linea(self, contador):
+        lineas = self.programa.lineas
+        return lineas[contador] if contador < len(lineas) else 0
+
+    def resumen_funciones(self):
+        """Regresa una lista de (nombre, llamadas, instrucciones, tiempo propio, tiempo total)."""
+        nombres = self.programa.nombres_funciones()
+        instrucciones = [0] * len(nombres)
+        propio = [0] * len(nombres)
+        for contador, funcion in enumerate(self.funcion_de):
+            instrucciones[funcion] += self.conteos[contador]
+            propio[funcion] += self.tiempos[contador]
+        total = [0] * len(nombres)
+        for pila, tiempo in self.pilas.items():
+            for funcion in set(pila):
+                total[funcion] += tiempo
+        return [(nombres[indice], self.llamadas[indice], instrucciones[indice], propio[indice], total[indice])
+                for indice in range(len(nombres))]
+
+    def informe(self, archivo=sys.stderr, limite=20, fuente=None):
+        """
+        Escribe el informe de texto: funciones por tiempo propio y los cuádruplos y líneas
+        más costosos. Con el código fuente se muestra el texto de cada línea.
+        """
+        # Importación diferida: virtual_machine depende de este módulo
+        from virtual_machine import formatear_instruccion
+
+        tiempo_total = sum(self.tiempos) or 1
+        lineas_fuente = fuente.split('\n') if fuente is not None else []
+        nombres = self.programa.nombres_funciones()
+
+        def ms(nanosegundos):
+            return nanosegundos / 1e6
+
+        def porcentaje(nanosegundos):
+            return 100 * nanosegundos / tiempo_total
+
+        def texto_linea(linea):
+            return lineas_fuente[linea - 1].strip() if 0 < linea <= len(lineas_fuente) else ''
+
+        sys.stdout.flush()
+        print("==== Perfil de ejecución ====", file=archivo)
+        print(f"Instrucciones ejecutadas: {sum(self.conteos)}    Tiempo medido: {ms(sum(self.tiempos)):.3f} ms\n",
+              file=archivo)
+
+        print("Funciones (por tiempo propio):", file=archivo)
+        print(f"  {'Función':<20} {'Llamadas':>9} {'Instrucciones':>14} {'Propio (ms)':>12} {'%':>6} {'Total (ms)':>11}",
+              file=archivo)
+        for nombre, llamadas, instrucciones, propio, total in sorted(self.resumen_funciones(), key=lambda f: -f[3]):
+            print(f"  {nombre:<20} {llamadas:>9} {instrucciones:>14} {ms(propio):>12.3f} {porcentaje(propio):>6.1f} "
+                  f"{ms(total):>11.3f}", file=archivo)
+
+        print("\nCuádruplos (por tiempo):", file=archivo)
+        print(f"  {'Cuádruplo':>9} {'Línea':>6} {'Función':<12} {'Instrucción':<32} {'Ejecuciones':>11} "
+              f"{'Tiempo (ms)':>12} {'%':>6}", file=archivo)
+        ejecutados = [contador for contador in range(len(self.conteos)) if self.conteos[contador]]
+        for contador in sorted(ejecutados, key=lambda c: -self.tiempos[c])[:limite]:
+            if contador < len(self.programa.instrucciones):
+                instruccion = formatear_instruccion(self.programa.instrucciones[contador], nombres)
+            else:
+                instruccion = '(END)'
+            print(f"  {contador:>9} {self.linea(contador):>6} {nombres[self.funcion_de[contador]]:<12} "
+                  f"{instruccion:<32} {self.conteos[contador]:>11} {ms(self.tiempos[contador]):>12.3f} "
+                  f"{porcentaje(self.tiempos[contador]):>6.1f}", file=archivo)
+
+        por_linea = defaultdict(lambda: [0, 0])
+        for contador in ejecutados:
+            # Las ejecuciones de una línea son las de su primer cuádruplo ejecutado más veces
+            datos = por_linea[self.linea(contador)]
+            datos[0] = max(datos[0], self.conteos[contador])
+            datos[1] += self.tiempos[contador]
+        print("\nLíneas (por tiempo):", file=archivo)
+        print(f"  {'Línea':>6} {'Ejecuciones':>11} {'Tiempo (ms)':>12} {'%':>6}  Código", file=archivo)
+        for linea, (ejecuciones, tiempo) in sorted(por_linea.items(), key=lambda l: -l[1][1])[:limite]:
+            print(f"  {linea:>6} {ejecuciones:>11} {ms(tiempo):>12.3f} {porcentaje(tiempo):>6.1f}  {texto_linea(linea)}",
+                  file=archivo)
+
+    def pilas_colapsadas(self):
+        """Regresa las líneas 'función;función;... nanosegundos' de cada pila de llamadas."""
+        nombres = self.programa.nombres_funciones()
+        return [f"{';'.join(nombres[funcion] for funcion in pila)} {tiempo}"
+                for pila, tiempo in sorted(self.pilas.items()) if tiempo > 0]
+
+    def escribir_pilas(self, ruta):
+        with open(ruta, 'w') as f:
+            for linea in self.pilas_colapsadas():
+                f.write(linea + '\n')
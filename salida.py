@@ -0,0 +1,70 @@
+import io
+import sys
+import math
+
+# Canal de salida de la instrucción PRINT.
+#
+# La máquina virtual y el traductor no llaman a print(): escriben el texto de cada 'escribe'
+# en un canal. SalidaBuferizada junta el texto y lo escribe al archivo (por defecto la salida
+# estándar) según su política de vaciado:
+#
+#   linea    escribe en cuanto llega cada texto (por defecto en una terminal)
+#   bloque   escribe cuando se juntan 'tamano_bloque' caracteres (por defecto en archivos y tuberías)
+#   final    escribe todo al terminar la ejecución
+#
+# SalidaMemoria guarda la salida en memoria para pruebas y para usar la máquina virtual desde
+# otro programa. Con 'limite' la ejecución falla si el programa escribe más caracteres.
+
+POLITICAS_VACIADO = ('linea', 'bloque', 'final')
+
+TAMANO_BLOQUE = 64 * 1024
+
+
+class ErrorLimiteSalida(Exception):
+    """El programa escribió más caracteres que el límite del canal."""
+
+
+class SalidaBuferizada:
+    def __init__(self, archivo=None, vaciado=None, tamano_bloque=TAMANO_BLOQUE, limite=None):
+        self.archivo = archivo if archivo is not None else sys.stdout
+        if vaciado is None:
+            vaciado = 'linea' if getattr(self.archivo, 'isatty', lambda: False)() else 'bloque'
+        if vaciado not in POLITICAS_VACIADO:
+            raise Exception(f"Error: Política de vaciado '{vaciado}' desconocida; "
+                            f"opciones: {', '.join(POLITICAS_VACIADO)}.")
+        self.vaciado = vaciado
+        # Caracteres pendientes con los que se escribe al archivo
+        self.umbral = {'linea': 1, 'bloque': tamano_bloque, 'final': math.inf}[vaciado]
+        self.limite = limite
+        self.partes = []
+        self.pendientes = 0
+        # Caracteres escritos por el programa
+        self.total = 0
+
+    def escribir(self, texto):
+        self.total += len(texto)
+        if self.limite is not None and self.total > self.limite:
+            raise ErrorLimiteSalida(f"Error: La salida del programa excede el límite de {self.limite} caracteres.")
+        self.partes.append(texto)
+        self.pendientes += len(texto)
+        if self.pendientes >= self.umbral:
+            self.vaciar()
+
+    def vaciar(self):
+        """Escribe al archivo el texto pendiente."""
+        if self.partes:
+            # Se descarta aunque la escritura falle (por ejemplo, una tubería cerrada)
+            texto = ''.join(self.partes)
+            self.partes.clear()
+            self.pendientes = 0
+            self.archivo.write(texto)
+            self.archivo.flush()
+
+
+class SalidaMemoria(SalidaBuferizada):
+    """Guarda la salida del programa en memoria; valor() regresa el texto escrito."""
+    def __init__(self, limite=None):
+        super().__init__(io.StringIO(), 'final', limite=limite)
+
+    def valor(self):
+        return self.archivo.getvalue() + ''.join(self.partes)
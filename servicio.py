@@ -0,0 +1,354 @@
+import gc
+import os
+import sys
+import stat
+import json
+import signal
+import time
+import socket
+import argparse
+import itertools
+import threading
+import socketserver
+import multiprocessing
+from collections import namedtuple
+
+import bytecode
+from salida import SalidaMemoria
+from virtual_machine import ErrorEjecucion, ProgramaPreparado
+
+# Servicio de ejecución de programas compilados.
+#
+# El proceso padre carga y decodifica cada programa una sola vez y después crea un pool de
+# trabajadores con fork: los trabajadores heredan las instrucciones decodificadas y las
+# tablas de constantes sin copiarlas (copy-on-write), así que cada trabajo solo paga la
+# preparación de la memoria y la ejecución, no el arranque del intérprete ni la carga del
+# programa. Los trabajos se envían con ServicioEjecucion.ejecutar() o, con 'python
+# servicio.py sirve', por un socket Unix local con un mensaje JSON por línea:
+#
+#   -> {"programa": "fibonacci"}
+#   <- {"programa": "fibonacci", "salida": "...", "error": null, "segundos": ..., "latencia": ...}
+#   -> {"estadisticas": true}
+#   <- {"trabajos": ..., "trabajos_por_segundo": ..., "latencia_p50": ..., ...}
+
+ResultadoEjecucion = namedtuple('ResultadoEjecucion', ['programa', 'salida', 'error', 'segundos', 'latencia'])
+
+# Programas cargados y preparados (validados y con superinstrucciones fusionadas) por el
+# proceso padre antes de crear el pool, por servicio; los trabajadores los heredan al hacer
+# fork. Un programa inválido guarda su ErrorEjecucion, que se responde en cada trabajo.
+# Cada servicio quita los suyos al cerrarse.
+_programas = {}
+_claves = itertools.count()
+# gc.freeze()/gc.unfreeze() afectan a todo el proceso: los objetos se descongelan solo
+# cuando se cierra el último servicio abierto
+_servicios_congelados = 0
+_candado_congelados = threading.Lock()
+
+
+def nombre_programa(ruta):
+    # 'dir/fibonacci.pbc' -> 'fibonacci'
+    return os.path.splitext(os.path.basename(ruta))[0]
+
+
+def inicializar_trabajador():
+    # Ctrl-C detiene al proceso padre, que termina el pool; los trabajadores lo ignoran
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+
+def ejecutar_trabajo(clave, nombre):
+    """
+    Ejecuta un programa cargado por el servicio 'clave'. Corre dentro de los trabajadores y
+    regresa (salida, error, segundos); 'error' es None si la ejecución terminó sin errores.
+    """
+    inicio = time.perf_counter()
+    programa = _programas.get(clave, {}).get(nombre)
+    if programa is None:
+        return '', f"Error: El programa '{nombre}' no está cargado en el servicio.", 0.0
+    if isinstance(programa, ErrorEjecucion):
+        return '', str(programa), 0.0
+    salida = SalidaMemoria()
+    error = None
+    try:
+        programa.ejecutar(salida=salida)
+    except ErrorEjecucion as e:
+        error = str(e)
+    return salida.valor(), error, time.perf_counter() - inicio
+
+
+def congelar():
+    global _servicios_congelados
+    with _candado_congelados:
+        gc.freeze()
+        _servicios_congelados += 1
+
+
+def descongelar():
+    global _servicios_congelados
+    with _candado_congelados:
+        _servicios_congelados -= 1
+        if _servicios_congelados == 0:
+            gc.unfreeze()
+
+
+def preparar_programa(ruta):
+    try:
+        return ProgramaPreparado(bytecode.cargar(ruta))
+    except ErrorEjecucion as e:
+        return e
+
+
+def percentil(valores, fraccion):
+    # 'valores' ordenados; percentil por el rango más cercano
+    if not valores:
+        return 0.0
+    return valores[min(len(valores) - 1, int(fraccion * len(valores)))]
+
+
+class ServicioEjecucion:
+    """
+    Pool de 'trabajadores' procesos (por defecto uno por núcleo) creados con fork después
+    de cargar los programas de 'rutas'. Cada programa se identifica por el nombre de su
+    archivo sin extensión. Se puede usar desde varios hilos a la vez. Con 'tiempo_limite'
+    (segundos) un trabajo que no termina a tiempo, por ejemplo porque su trabajador murió,
+    lanza una excepción en vez de esperar para siempre.
+    """
+    def __init__(self, rutas, trabajadores=None, tiempo_limite=None):
+        if 'fork' not in multiprocessing.get_all_start_methods():
+            raise Exception("Error: El servicio de ejecución necesita fork (no disponible en esta plataforma).")
+        self.clave = next(_claves)
+        _programas[self.clave] = {nombre_programa(ruta): preparar_programa(ruta) for ruta in rutas}
+        self.programas = list(_programas[self.clave])
+        # Congelar los objetos cargados para que el recolector de basura no escriba en sus
+        # páginas y los trabajadores sigan compartiéndolas
+        congelar()
+        self.trabajadores = trabajadores or os.cpu_count() or 1
+        self.tiempo_limite = tiempo_limite
+        self.pool = multiprocessing.get_context('fork').Pool(self.trabajadores, inicializar_trabajador)
+
+        self.candado = threading.Lock()
+        self.inicio = time.perf_counter()
+        self.latencias = []
+        self.segundos = []
+        self.errores = 0
+
+    def enviar(self, nombre):
+        """
+        Envía un trabajo al pool sin esperarlo. Regresa una función que espera el trabajo
+        y regresa su ResultadoEjecucion.
+        """
+        enviado = time.perf_counter()
+        pendiente = self.pool.apply_async(ejecutar_trabajo, (self.clave, nombre))
+
+        def esperar():
+            try:
+                salida, error, segundos = pendiente.get(self.tiempo_limite)
+            except multiprocessing.TimeoutError:
+                raise Exception(f"Error: El trabajo '{nombre}' no terminó en {self.tiempo_limite} segundos.") from None
+            latencia = time.perf_counter() - enviado
+            with self.candado:
+                self.latencias.append(latencia)
+                self.segundos.append(segundos)
+                self.errores += error is not None
+            return ResultadoEjecucion(nombre, salida, error, segundos, latencia)
+        return esperar
+
+    def ejecutar(self, nombre):
+        """Ejecuta un programa en un trabajador y regresa su ResultadoEjecucion."""
+        return self.enviar(nombre)()
+
+    def ejecutar_muchos(self, nombres):
+        """Envía todos los trabajos a la vez y regresa sus resultados en el mismo orden."""
+        return [esperar() for esperar in [self.enviar(nombre) for nombre in nombres]]
+
+    def estadisticas(self):
+        """
+        Trabajos terminados, trabajos por segundo desde que inició el servicio y latencia
+        (desde el envío hasta el resultado, incluyendo la espera en la cola) en segundos.
+        """
+        with self.candado:
+            latencias = sorted(self.latencias)
+            segundos = sum(self.segundos)
+            errores = self.errores
+        transcurrido = time.perf_counter() - self.inicio
+        return {
+            'trabajos': len(latencias),
+            'errores': errores,
+            'trabajadores': self.trabajadores,
+            'trabajos_por_segundo': len(latencias) / transcurrido if transcurrido else 0.0,
+            'latencia_promedio': sum(latencias) / len(latencias) if latencias else 0.0,
+            'latencia_p50': percentil(latencias, 0.50),
+            'latencia_p95': percentil(latencias, 0.95),
+            'latencia_p99': percentil(latencias, 0.99),
+            'latencia_maxima': latencias[-1] if latencias else 0.0,
+            'ejecucion_promedio': segundos / len(latencias) if latencias else 0.0,
+        }
+
+    def informe(self, archivo=sys.stderr):
+        datos = self.estadisticas()
+        print("==== Servicio de ejecución ====", file=archivo)
+        print(f"  Trabajos:               {datos['trabajos']} ({datos['errores']} con errores, "
+              f"{datos['trabajadores']} trabajadores)", file=archivo)
+        print(f"  Trabajos por segundo:   {datos['trabajos_por_segundo']:.1f}", file=archivo)
+        for clave, etiqueta in (('latencia_promedio', 'Latencia promedio'), ('latencia_p50', 'Latencia p50'),
+                                ('latencia_p95', 'Latencia p95'), ('latencia_p99', 'Latencia p99'),
+                                ('latencia_maxima', 'Latencia máxima'), ('ejecucion_promedio', 'Ejecución promedio')):
+            print(f"  {etiqueta + ' (ms):':<24} {datos[clave] * 1000:.3f}", file=archivo)
+
+    def cerrar(self):
+        self.pool.terminate()
+        self.pool.join()
+        if _programas.pop(self.clave, None) is not None:
+            descongelar()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *excepcion):
+        self.cerrar()
+
+
+class ManejadorConexion(socketserver.StreamRequestHandler):
+    # Un mensaje JSON por línea y una respuesta por mensaje; cada conexión tiene su hilo
+    def handle(self):
+        for linea in self.rfile:
+            try:
+                mensaje = json.loads(linea)
+                nombre = None if mensaje.get('estadisticas') else mensaje['programa']
+            except (ValueError, KeyError, AttributeError):
+                respuesta = {'error': "Error: Mensaje inválido; se esperaba {\"programa\": nombre}."}
+            else:
+                respuesta = self.responder(nombre)
+            self.wfile.write(json.dumps(respuesta).encode() + b'\n')
+
+    def responder(self, nombre):
+        # 'nombre' None pide las estadísticas
+        try:
+            if nombre is None:
+                return self.server.servicio.estadisticas()
+            return self.server.servicio.ejecutar(nombre)._asdict()
+        except Exception as e:
+            # Fallas del servicio (tiempo límite) o del pool (un trabajo que no se puede
+            # serializar); la conexión sigue atendiendo mensajes
+            if type(e) is Exception:
+                return {'programa': nombre, 'error': str(e)}
+            return {'programa': nombre, 'error': f"Error: El trabajo falló en el servicio: {type(e).__name__}: {e}"}
+
+
+def liberar_socket(ruta):
+    """
+    Quita un socket abandonado en 'ruta' (de un servicio que terminó sin borrarlo). Lanza una
+    excepción si 'ruta' no es un socket o si otro servicio lo está atendiendo.
+    """
+    try:
+        modo = os.stat(ruta).st_mode
+    except FileNotFoundError:
+        return
+    if not stat.S_ISSOCK(modo):
+        raise Exception(f"Error: '{ruta}' ya existe y no es un socket.")
+    prueba = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        prueba.connect(ruta)
+    except ConnectionRefusedError:
+        os.remove(ruta)
+        return
+    finally:
+        prueba.close()
+    raise Exception(f"Error: El socket '{ruta}' está en uso por otro servicio.")
+
+
+class ServidorEjecucion(socketserver.ThreadingUnixStreamServer):
+    daemon_threads = True
+
+    def __init__(self, ruta_socket, servicio):
+        liberar_socket(ruta_socket)
+        super().__init__(ruta_socket, ManejadorConexion)
+        self.servicio = servicio
+
+
+class ClienteServicio:
+    """Cliente del socket de 'python servicio.py sirve'."""
+    def __init__(self, ruta_socket):
+        self.conexion = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.conexion.connect(ruta_socket)
+        self.lector = self.conexion.makefile('rb')
+
+    def enviar(self, mensaje):
+        self.conexion.sendall(json.dumps(mensaje).encode() + b'\n')
+        return json.loads(self.lector.readline())
+
+    def ejecutar(self, nombre):
+        return self.enviar({'programa': nombre})
+
+    def estadisticas(self):
+        return self.enviar({'estadisticas': True})
+
+    def cerrar(self):
+        self.lector.close()
+        self.conexion.close()
+
+
+def comando_sirve(args):
+    # Se revisa antes de cargar los programas y crear el pool
+    try:
+        liberar_socket(args.socket)
+    except Exception as e:
+        print(e)
+        sys.exit(1)
+    with ServicioEjecucion(args.programas, args.trabajadores, args.tiempo_limite) as servicio:
+        print(f"Programas cargados: {', '.join(servicio.programas)}; {servicio.trabajadores} trabajadores "
+              f"en '{args.socket}'.")
+        with ServidorEjecucion(args.socket, servicio) as servidor:
+            try:
+                servidor.serve_forever()
+            except KeyboardInterrupt:
+                pass
+            finally:
+                try:
+                    os.remove(args.socket)
+                except FileNotFoundError:
+                    pass
+                servicio.informe()
+
+
+def comando_envia(args):
+    cliente = ClienteServicio(args.socket)
+    try:
+        for _ in range(args.repeticiones):
+            respuesta = cliente.ejecutar(args.programa)
+        print(respuesta.get('salida', ''), end='')
+        if respuesta.get('error'):
+            print(respuesta['error'])
+        if args.estadisticas:
+            print(json.dumps(cliente.estadisticas(), indent=2))
+    finally:
+        cliente.cerrar()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Servicio de ejecución de programas compilados de Patito.')
+    subparsers = parser.add_subparsers(dest='comando', required=True)
+
+    sirve = subparsers.add_parser('sirve', help='Carga los programas y atiende trabajos por un socket Unix.')
+    sirve.add_argument('programas', nargs='+', help='Programas compilados (.pbc) a cargar.')
+    sirve.add_argument('--socket', default='patito.sock', help="Ruta del socket (por defecto 'patito.sock').")
+    sirve.add_argument('-j', '--trabajadores', type=int, default=None,
+                       help='Cantidad de procesos trabajadores (por defecto uno por núcleo).')
+    sirve.add_argument('--tiempo-limite', type=float, default=None, metavar='SEGUNDOS',
+                       help='Responde con un error a los trabajos que no terminan en este tiempo.')
+    sirve.set_defaults(funcion=comando_sirve)
+
+    envia = subparsers.add_parser('envia', help='Envía un trabajo al servicio y muestra su salida.')
+    envia.add_argument('programa', help='Nombre del programa (archivo sin extensión).')
+    envia.add_argument('--socket', default='patito.sock', help="Ruta del socket (por defecto 'patito.sock').")
+    envia.add_argument('-n', '--repeticiones', type=int, default=1, help='Cantidad de veces que se ejecuta.')
+    envia.add_argument('--estadisticas', action='store_true', help='Muestra las estadísticas del servicio.')
+    envia.set_defaults(funcion=comando_envia)
+
+    args = parser.parse_args()
+    if args.comando == 'envia' and args.repeticiones < 1:
+        parser.error("--repeticiones debe ser al menos 1.")
+    args.funcion(args)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,161 @@
+import io
+import os
+import glob
+import argparse
+import contextlib
+from collections import Counter
+
+from opcodes import *
+from optimizador import es_temporal
+
+# Superinstrucciones de la máquina virtual.
+#
+# Al cargar un programa, la máquina virtual reemplaza las secuencias de cuádruplos más
+# frecuentes por una sola instrucción con su propio manejador. La instrucción fusionada
+# ocupa el lugar del primer cuádruplo de la secuencia y su manejador salta los demás, de
+# modo que los índices de los cuádruplos (destinos de salto y mensajes de error) no cambian.
+#
+# Secuencias seleccionadas por su frecuencia dinámica (pares de instrucciones ejecutadas
+# consecutivamente), medida con 'python superinstrucciones.py' sobre los programas de
+# ejemplo del repositorio:
+#
+#   <aritmética> t; = t var      16% de los pares   ->  SUMA_ENTERO_ASIGNA, ..., DIV_FLOTANTE_ASIGNA
+#   = ; =                        14% de los pares   ->  ASIGNA_DOBLE
+#   <relacional> t; GOTOF t      11% de los pares   ->  MAYOR_ENTERO_GOTOF, ..., DIFERENTE_FLOTANTE_GOTOF
+#   ERA; PARAM*; GOSUB           2 + n despachos por llamada  ->  LLAMADA
+#   PRINT; PRINT*                una escritura al canal de salida por 'escribe'  ->  IMPRIME_VARIOS
+#
+# Las secuencias aritméticas y relacionales solo se fusionan si el resultado intermedio es
+# un temporal: el compilador lee cada temporal una sola vez, así que no hace falta escribirlo.
+
+ARITMETICA_ASIGNA = {
+    SUMA_ENTERO: SUMA_ENTERO_ASIGNA, RESTA_ENTERO: RESTA_ENTERO_ASIGNA,
+    MULT_ENTERO: MULT_ENTERO_ASIGNA, DIV_ENTERO: DIV_ENTERO_ASIGNA,
+    SUMA_FLOTANTE: SUMA_FLOTANTE_ASIGNA, RESTA_FLOTANTE: RESTA_FLOTANTE_ASIGNA,
+    MULT_FLOTANTE: MULT_FLOTANTE_ASIGNA, DIV_FLOTANTE: DIV_FLOTANTE_ASIGNA,
+}
+RELACIONAL_GOTOF = {
+    MAYOR_ENTERO: MAYOR_ENTERO_GOTOF, MENOR_ENTERO: MENOR_ENTERO_GOTOF,
+    MAYOR_IGUAL_ENTERO: MAYOR_IGUAL_ENTERO_GOTOF, MENOR_IGUAL_ENTERO: MENOR_IGUAL_ENTERO_GOTOF,
+    IGUAL_ENTERO: IGUAL_ENTERO_GOTOF, DIFERENTE_ENTERO: DIFERENTE_ENTERO_GOTOF,
+    MAYOR_FLOTANTE: MAYOR_FLOTANTE_GOTOF, MENOR_FLOTANTE: MENOR_FLOTANTE_GOTOF,
+    MAYOR_IGUAL_FLOTANTE: MAYOR_IGUAL_FLOTANTE_GOTOF, MENOR_IGUAL_FLOTANTE: MENOR_IGUAL_FLOTANTE_GOTOF,
+    IGUAL_FLOTANTE: IGUAL_FLOTANTE_GOTOF, DIFERENTE_FLOTANTE: DIFERENTE_FLOTANTE_GOTOF,
+}
+
+
+def fusionar(codigo):
+    """
+    Regresa una copia de las instrucciones con las secuencias frecuentes reemplazadas por
+    superinstrucciones. Una secuencia no se fusiona si un salto llega a la mitad de ella.
+
+    LLAMADA tiene la forma (LLAMADA, función, (parámetros, retorno), inicio) donde
+    'parámetros' son tuplas (origen, destino, índice del PARAM), y ASIGNA_DOBLE tiene la
+    forma (ASIGNA_DOBLE, origen, (origen2, destino2), destino). IMPRIME_VARIOS tiene la
+    forma (IMPRIME_VARIOS, direcciones, -, -) y reemplaza un PRINT por dirección.
+    """
+    destinos = {instruccion[3] for instruccion in codigo if instruccion[0] in OPERACIONES_CON_SALTO}
+    fusionado = list(codigo)
+    indice = 0
+    while indice < len(codigo) - 1:
+        codigo_operacion, operando1, operando2, resultado = codigo[indice]
+        siguiente = codigo[indice + 1]
+        intermedio_libre = es_temporal(resultado) and indice + 1 not in destinos
+
+        if (codigo_operacion in ARITMETICA_ASIGNA and siguiente[0] == ASIGNA
+                and siguiente[1] == resultado and intermedio_libre):
+            fusionado[indice] = (ARITMETICA_ASIGNA[codigo_operacion], operando1, operando2, siguiente[3])
+            indice += 2
+        elif (codigo_operacion in RELACIONAL_GOTOF and siguiente[0] == GOTOF
+                and siguiente[1] == resultado and intermedio_libre):
+            fusionado[indice] = (RELACIONAL_GOTOF[codigo_operacion], operando1, operando2, siguiente[3])
+            indice += 2
+        elif codigo_operacion == ASIGNA and siguiente[0] == ASIGNA and indice + 1 not in destinos:
+            fusionado[indice] = (ASIGNA_DOBLE, operando1, (siguiente[1], siguiente[3]), resultado)
+            indice += 2
+        elif codigo_operacion == PRINT and siguiente[0] == PRINT and indice + 1 not in destinos:
+            fin = indice + 1
+            while fin < len(codigo) and codigo[fin][0] == PRINT and fin not in destinos:
+                fin += 1
+            fusionado[indice] = (IMPRIME_VARIOS, tuple(codigo[impresion][1] for impresion in range(indice, fin)),
+                                 operando2, resultado)
+            indice = fin
+        elif codigo_operacion == ERA:
+            fin = indice + 1
+            while fin < len(codigo) and codigo[fin][0] == PARAM:
+                fin += 1
+            if (fin < len(codigo) and codigo[fin][0] == GOSUB and codigo[fin][1] == operando1
+                    and not destinos.intersection(range(indice + 1, fin + 1))):
+                parametros = tuple((codigo[param][1], codigo[param][3], param) for param in range(indice + 1, fin))
+                fusionado[indice] = (LLAMADA, operando1, (parametros, fin + 1), codigo[fin][3])
+                indice = fin + 1
+            else:
+                indice += 1
+        else:
+            indice += 1
+    return fusionado
+
+
+class ContadorSecuencias:
+    """
+    Se pasa como traza a la máquina virtual y cuenta los pares de instrucciones que se
+    ejecutan uno después del otro.
+    """
+    def __init__(self):
+        self.pares = Counter()
+        self.total = 0
+        self.anterior = None
+
+    def registrar(self, contador, instruccion, tablas):
+        self.total += 1
+        if self.anterior is not None:
+            self.pares[(self.anterior, instruccion[0])] += 1
+        self.anterior = instruccion[0]
+
+    def registros(self):
+        return []
+
+
+def medir_frecuencias(fuentes):
+    """
+    Compila y ejecuta cada código fuente y regresa el ContadorSecuencias con los pares
+    ejecutados. Los programas que no compilan o fallan al ejecutarse se cuentan hasta
+    donde llegan.
+    """
+    from compilador import compilar, ErrorCompilacion
+    from virtual_machine import ErrorEjecucion
+
+    contador = ContadorSecuencias()
+    for fuente in fuentes:
+        contador.anterior = None
+        with contextlib.redirect_stdout(io.StringIO()):
+            try:
+                compilar(fuente).ejecutar(traza=contador)
+            except (ErrorCompilacion, ErrorEjecucion):
+                pass
+    return contador
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Mide la frecuencia de los pares de instrucciones ejecutadas en un corpus de programas.')
+    parser.add_argument('archivos', nargs='*',
+                        help='Programas .patito a medir (por defecto los .patito de este directorio).')
+    parser.add_argument('-n', type=int, default=15, help='Cantidad de pares a mostrar.')
+    args = parser.parse_args()
+
+    archivos = args.archivos or sorted(glob.glob(os.path.join(os.path.dirname(os.path.abspath(__file__)), '*.patito')))
+    fuentes = []
+    for archivo in archivos:
+        with open(archivo, 'r') as f:
+            fuentes.append(f.read())
+
+    contador = medir_frecuencias(fuentes)
+    print(f"Instrucciones ejecutadas: {contador.total}")
+    for (primero, segundo), cantidad in contador.pares.most_common(args.n):
+        porcentaje = 100 * cantidad / max(contador.total, 1)
+        print(f"  {NOMBRES[primero]:>10} ; {NOMBRES[segundo]:<10} {cantidad:>10}  {porcentaje:5.1f}%")
+
+
+if __name__ == '__main__':
+    main()
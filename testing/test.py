@@ -1,14 +1,35 @@
+import gc
+import io
 import os
-import subprocess
+import sys
+import time
+import random
+import asyncio
+import tempfile
+import threading
+import argparse
+import contextlib
+from concurrent.futures import ProcessPoolExecutor
 from rich.console import Console
 from rich.panel import Panel
 from rich.text import Text
 from rich import box
 
-console = Console()
+# Los casos se compilan y ejecutan dentro del proceso (o de los procesos del pool) con la API
+# de compilador.py; los módulos del compilador están en el directorio padre
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from compilador import compilar, ErrorCompilacion, opciones_compilacion
+from cache import CacheCompilacion
+from bytecode import serializar, deserializar, ENCABEZADO
+from virtual_machine import ErrorEjecucion, MaquinaVirtual, ejecutar_concurrente
+from salida import SalidaBuferizada, SalidaMemoria, ErrorLimiteSalida
+from servicio import ServicioEjecucion, ServidorEjecucion, ClienteServicio
+from superinstrucciones import fusionar
+from benchmark import correr_fases, generar_fuente_escalamiento, FASES
+from opcodes import *
 
-test_folder = "test_cases"
-os.makedirs(test_folder, exist_ok=True)
+console = Console()
 
 # Lista de casos de prueba con títulos actualizados y en orden
 test_cases = [
@@ -27,6 +48,7 @@ inicio{
     escribe("Valor de b:", b);
 }fin
 ''',
+        'expected_output': 'Valor de a:\n10\nValor de b:\n20.5\n',
         'expect_error': False
     },
     {
@@ -44,6 +66,7 @@ inicio{
     escribe("El resultado de z es:", z);
 }fin
 ''',
+        'expected_output': 'El resultado de z es:\n19.82857142857143\n',
         'expect_error': False
     },
     {
@@ -61,6 +84,7 @@ inicio{
     };
 }fin
 ''',
+        'expected_output': 'El número es positivo.\n',
         'expect_error': False
     },
     {
@@ -77,6 +101,7 @@ inicio{
     };
 }fin
 ''',
+        'expected_output': 'Contador:\n1\nContador:\n2\nContador:\n3\nContador:\n4\nContador:\n5\n',
         'expect_error': False
     },
     {
@@ -122,6 +147,7 @@ inicio{
     saludo();
 }fin
 ''',
+        'expected_output': '¡Hola, mundo!\n',
         'expect_error': False
     },
     {
@@ -139,6 +165,7 @@ inicio{
     escribe("El resultado de c es:", c);
 }fin
 ''',
+        'expected_output': 'El resultado de c es:\n2.75\n',
         'expect_error': False
     },
     {
@@ -156,72 +183,799 @@ inicio{
     escribe("El resultado es:", resultado);
 }fin
 ''',
+        'expect_error': False,
+        # La división por cero es un error en tiempo de ejecución, el compilador no lo detecta
+        'expect_runtime_error': 'División por cero',
+    },
+    {
+        'name': 'test10',
+        'description': 'División Entera y Conversión a Flotante',
+        'code': '''
+vars
+    a: entero;
+    b: entero;
+    x: flotante;
+inicio{
+    a = 7;
+    b = 2;
+    x = 1.5;
+    escribe("a / b:", a / b);
+    escribe("a / b * b + x:", a / b * b + x);
+    escribe("a / 2.0:", a / 2.0);
+}fin
+''',
+        'expected_output': 'a / b:\n3\na / b * b + x:\n7.5\na / 2.0:\n3.5\n',
+        'expect_error': False
+    },
+    {
+        'name': 'test11',
+        'description': 'Asignación Definida en Ambas Ramas',
+        'code': '''
+vars
+    a: entero;
+    b: entero;
+inicio{
+    a = 4;
+    si (a > 3) {
+        b = a * 2;
+    } sino {
+        b = 0;
+    };
+    escribe("b:", b);
+}fin
+''',
+        'expected_output': 'b:\n8\n',
+        'expect_error': False
+    },
+    {
+        'name': 'test12',
+        'description': 'Variable Sin Inicializar en una Rama',
+        'code': '''
+vars
+    a: entero;
+    b: entero;
+inicio{
+    a = 1;
+    si (a > 3) {
+        b = 5;
+    };
+    escribe("b:", b + a);
+}fin
+''',
+        'expect_error': False,
+        'expect_runtime_error': 'no inicializado'
+    },
+    {
+        'name': 'test13',
+        'description': 'Desbordamiento al Convertir a Flotante (mismo error en ambos motores)',
+        'code': '''
+vars
+    a: entero;
+    i: entero;
+    x: flotante;
+inicio{
+    a = 2;
+    i = 0;
+    mientras (i < 12) haz {
+        a = a * a;
+        i = i + 1;
+    };
+    x = a * 1.0;
+    escribe(x);
+}fin
+''',
+        'expect_error': False,
+        'expect_runtime_error': 'int too large to convert to float'
+    },
+    {
+        'name': 'test14',
+        'description': 'Variable Sin Inicializar Dentro de un escribe con Varios Valores',
+        'code': '''
+vars
+    x: entero;
+inicio{
+    escribe("a", "b", x);
+}fin
+''',
+        'expect_error': False,
+        # El error se reporta en el PRINT de 'x' aunque los tres PRINT se fusionen; con -O el
+        # programa no empieza con GOTO y el PRINT queda un cuádruplo antes
+        'expect_runtime_error': 'Error en cuádruplo 4: Error: Operando no inicializado en PRINT.',
+        'expect_runtime_error_optimized': 'Error en cuádruplo 3: Error: Operando no inicializado en PRINT.'
+    },
+    {
+        'name': 'test15',
+        'description': 'Asociatividad Izquierda de + - * / y Operadores Fuera de un Paréntesis',
+        'code': '''
+vars
+    a, b, c: entero;
+inicio{
+    a = 10;
+    b = 3;
+    c = 2;
+    escribe("a - b - c:", a - b - c);
+    escribe("1 - 3 + 7:", 1 - b + 7);
+    escribe("a * 6 / b / c:", a * 6 / b / c);
+    escribe("c * (a - b):", c * (a - b));
+    escribe("c * (a - b - 1) - (b - c):", c * (a - b - 1) - (b - c));
+}fin
+''',
+        # Reduciendo de derecha a izquierda, a - b - c daba 9 y 1 - 3 + 7 daba -9; sin el fondo
+        # falso del paréntesis, c * (a - b) daba c * a - b = 17
+        'expected_output': 'a - b - c:\n5\n1 - 3 + 7:\n5\na * 6 / b / c:\n10\nc * (a - b):\n14\n'
+                           'c * (a - b - 1) - (b - c):\n11\n',
+        'expect_error': False
+    },
+    {
+        'name': 'test16',
+        'description': 'División Entera con Operandos Negativos',
+        'code': '''
+vars
+    a, b, c: entero;
+inicio{
+    a = 0 - 7;
+    b = 2;
+    c = 0 - 2;
+    escribe("a / b:", a / b);
+    escribe("7 / c:", 7 / c);
+    escribe("a / c:", a / c);
+    escribe("(0 - 7) / 2:", (0 - 7) / 2);
+    escribe("a / 2.0:", a / 2.0);
+}fin
+''',
+        # La división entre enteros redondea hacia abajo (como // en Python), no hacia cero;
+        # con -O la constante (0 - 7) / 2 se pliega al compilar con la misma regla
+        'expected_output': 'a / b:\n-4\n7 / c:\n-4\na / c:\n3\n(0 - 7) / 2:\n-4\na / 2.0:\n-3.5\n',
+        'expect_error': False
+    },
+    {
+        'name': 'test17',
+        'description': 'Recursión Más Profunda que el Límite de Python',
+        'code': '''
+vars
+    n: entero;
+nula baja(k: entero) {
+    {
+        n = n + 1;
+        si (k > 1) {
+            baja(k - 1);
+        };
+    }
+};
+inicio{
+    n = 0;
+    baja(5000);
+    escribe(n);
+}fin
+''',
+        # El motor traductor hace una llamada de Python por cada llamada de Patito; debe
+        # llegar a la misma profundidad que el intérprete
+        'expected_output': '5000\n',
         'expect_error': False
-        # La división por cero es un error en tiempo de ejecución, el compilador puede no detectarlo
     },
 ]
 
 
-def display_test_result(test_name, description, result, stdout, stderr, expect_error):
-    if result.returncode == 0 and not expect_error:
-        console.print(f":white_check_mark: [bold green]{test_name}[/] - {description} PASSED", style="bold green")
-        console.print(Panel(stdout, title="Output", expand=False, border_style="green"))
-    elif result.returncode != 0 and expect_error:
-        console.print(f":white_check_mark: [bold green]{test_name}[/] - {description} PASSED (Expected Error)",
-                      style="bold green")
-        console.print(Panel(stderr, title="Expected Error Output", expand=False, border_style="green"))
-    else:
-        console.print(f":x: [bold red]{test_name}[/] - {description} FAILED", style="bold red")
-        if stdout:
-            console.print(Panel(stdout, title="Compiler Output", expand=False, border_style="red"))
-        if stderr:
-            console.print(Panel(stderr, title="Compiler Error Output", expand=False, border_style="red"))
+def format_instructions(instructions):
+    return "".join(f"{index} {NOMBRES.get(instruction[0], instruction[0])} {instruction[1:]}\n"
+                   for index, instruction in enumerate(instructions))
 
 
-def main():
-    compiler_command = 'python main_patito.py'
-    total_tests = len(test_cases)
-    passed_tests = 0
+def check_fusion(code):
+    return format_instructions(fusionar(code))
 
-    console.print(f"\n[bold yellow]Running {total_tests} test cases[/]", style="bold yellow")
 
-    for test in test_cases:
-        test_name = test['name']
-        description = test['description']
+def fusion_case(name, description, code, expected):
+    # Caso de superinstrucciones.fusionar: 'code' son instrucciones decodificadas y
+    # 'expected' las instrucciones que debe regresar
+    return {'name': name, 'description': description, 'code': code, 'check': check_fusion,
+            'expected_output': format_instructions(expected), 'expect_error': False}
+
+
+# Reglas de fusión de superinstrucciones: una secuencia no se fusiona si un salto llega a la
+# mitad de ella (los cuádruplos fusionados se conservan en su lugar como destino del salto)
+fusion_cases = [
+    fusion_case(
+        'fusion1', 'Salto a la Mitad de una Secuencia de PRINT',
+        [(GOTOF, 11000, -1, 2), (PRINT, 16000, -1, -1), (PRINT, 16001, -1, -1), (PRINT, 16002, -1, -1),
+         (END, -1, -1, -1)],
+        [(GOTOF, 11000, -1, 2), (PRINT, 16000, -1, -1), (IMPRIME_VARIOS, (16001, 16002), -1, -1),
+         (PRINT, 16002, -1, -1), (END, -1, -1, -1)]),
+    fusion_case(
+        'fusion2', 'Salto a la Asignación de una Operación Aritmética',
+        [(GOTO, -1, -1, 2), (SUMA_ENTERO, 1000, 13000, 9000), (ASIGNA, 9000, -1, 1000), (ASIGNA, 1000, -1, 1001),
+         (END, -1, -1, -1)],
+        [(GOTO, -1, -1, 2), (SUMA_ENTERO, 1000, 13000, 9000), (ASIGNA_DOBLE, 9000, (1000, 1001), 1000),
+         (ASIGNA, 1000, -1, 1001), (END, -1, -1, -1)]),
+    fusion_case(
+        'fusion3', 'Llamada con un PARAM como Destino de Salto',
+        [(GOTO, -1, -1, 3), (PRINT, 5000, -1, -1), (ENDFUNC, -1, -1, -1), (MAIN_START, -1, -1, -1),
+         (GOTOF, 11000, -1, 6), (ERA, 1, -1, -1), (PARAM, 1000, -1, 5000), (GOSUB, 1, -1, 1), (END, -1, -1, -1)],
+        [(GOTO, -1, -1, 3), (PRINT, 5000, -1, -1), (ENDFUNC, -1, -1, -1), (MAIN_START, -1, -1, -1),
+         (GOTOF, 11000, -1, 6), (ERA, 1, -1, -1), (PARAM, 1000, -1, 5000), (GOSUB, 1, -1, 1), (END, -1, -1, -1)]),
+    fusion_case(
+        'fusion4', 'Llamada sin Saltos Intermedios',
+        [(GOTO, -1, -1, 3), (PRINT, 5000, -1, -1), (ENDFUNC, -1, -1, -1), (MAIN_START, -1, -1, -1),
+         (GOTOF, 11000, -1, 8), (ERA, 1, -1, -1), (PARAM, 1000, -1, 5000), (GOSUB, 1, -1, 1), (END, -1, -1, -1)],
+        [(GOTO, -1, -1, 3), (PRINT, 5000, -1, -1), (ENDFUNC, -1, -1, -1), (MAIN_START, -1, -1, -1),
+         (GOTOF, 11000, -1, 8), (LLAMADA, 1, (((1000, 5000, 6),), 8), 1), (PARAM, 1000, -1, 5000),
+         (GOSUB, 1, -1, 1), (END, -1, -1, -1)]),
+]
+
+
+def random_expression(rng, names, depth=2):
+    # Expresión aritmética entera con la misma precedencia en Patito y en Python
+    if depth == 0 or rng.random() < 0.3:
+        return rng.choice(names) if rng.random() < 0.6 else str(rng.randint(0, 9))
+    left = random_expression(rng, names, depth - 1)
+    right = random_expression(rng, names, depth - 1)
+    expression = f"{left} {rng.choice('+-*')} {right}"
+    return f"({expression})" if rng.random() < 0.3 else expression
+
+
+def generate_test_cases(count, seed=0):
+    """
+    Genera casos con asignaciones, impresiones y condiciones sobre enteros; la salida
+    esperada se calcula evaluando las mismas expresiones en Python.
+    """
+    rng = random.Random(seed)
+    cases = []
+    for index in range(count):
+        values = {name: rng.randint(0, 20) for name in ('a', 'b', 'c')}
+        names = list(values)
+        lines = [f"    {name} = {value};" for name, value in values.items()]
+        expected = []
+        for _ in range(rng.randint(3, 10)):
+            kind = rng.random()
+            expression = random_expression(rng, names)
+            value = eval(expression, {}, dict(values))
+            if kind < 0.5:
+                target = rng.choice(names)
+                lines.append(f"    {target} = {expression};")
+                values[target] = value
+            elif kind < 0.8:
+                lines.append(f'    escribe("valor:", {expression});')
+                expected += ["valor:", str(value)]
+            else:
+                operator = rng.choice(['>', '<', '>=', '<=', '==', '!='])
+                other = random_expression(rng, names, 1)
+                taken = eval(f"({expression}) {operator} ({other})", {}, dict(values))
+                lines.append(f'    si ({expression} {operator} {other}) {{ escribe("si"); }} sino {{ escribe("no"); }};')
+                expected.append("si" if taken else "no")
+        lines += [f"    escribe({name});" for name in names]
+        expected += [str(values[name]) for name in names]
+        cases.append({
+            'name': f'generado{index}',
+            'description': f'Caso generado (semilla {seed})',
+            'code': "\nvars\n    a, b, c: entero;\ninicio{\n" + "\n".join(lines) + "\n}fin\n",
+            'expected_output': "".join(line + "\n" for line in expected),
+            'expect_error': False,
+        })
+    return cases
+
+
+def compile_source(source, cache=None):
+    with contextlib.redirect_stdout(io.StringIO()):
+        return compilar(source, cache)
+
+
+def check_step_into_function(code):
+    """
+    Ejecuta el programa de una instrucción en una instrucción; marca en la salida cada vez
+    que la ejecución se detiene dentro de una función (con la pila de retornos no vacía).
+    """
+    output = SalidaMemoria()
+    machine = MaquinaVirtual(compile_source(code), salida=output)
+    inside = False
+    while not machine.paso(1):
+        if bool(machine.pila_retornos) != inside:
+            inside = not inside
+            output.escribir("[dentro de la función]\n" if inside else "[fuera de la función]\n")
+    return output.valor()
+
+
+def check_concurrent(sources):
+    """
+    Ejecuta los programas intercalados de dos en dos instrucciones, cada uno con su canal, y
+    regresa la salida y el error de cada uno; agrega una línea si difieren de su ejecución sola.
+    """
+    programs = [compile_source(source) for source in sources]
+    alone = [run_program(program, 'interprete') for program in programs]
+    outputs = [SalidaMemoria() for _ in programs]
+    errors = asyncio.run(ejecutar_concurrente(programs, 2, outputs))
+    text = ""
+    for index, (output, error) in enumerate(zip(outputs, errors)):
+        text += f"programa {index}:\n{output.valor()}"
+        if error is not None:
+            text += f"error: {error}\n"
+        if (output.valor(), str(error or '')) != alone[index][1:]:
+            text += "difiere de la ejecución sola\n"
+    return text
+
 
-        # Crear archivo .patito en la carpeta de test_cases
-        patito_filename = os.path.join(test_folder, f"{test_name}.patito")
-        with open(patito_filename, 'w', encoding='utf-8') as f:
-            f.write(f"programa {test_name};\n")
-            f.write(test['code'])
+def format_result(name, output, error):
+    return f"{name}:\n{output}" + (f"error: {error}\n" if error else "")
 
-        # Ejecutar compilador
+
+def check_service(sources):
+    """
+    Compila los programas a archivos, los ejecuta con ServicioEjecucion y por el socket de
+    ServidorEjecucion, y revisa que un segundo servicio no vea los programas del primero ni
+    pierda sus objetos congelados cuando el primero se cierra.
+    """
+    text = ""
+    with tempfile.TemporaryDirectory() as directory:
+        paths = []
+        for name, source in sources.items():
+            paths.append(os.path.join(directory, name + '.pbc'))
+            compile_source(source).guardar(paths[-1])
+
+        with ServicioEjecucion(paths, 1) as service:
+            for result in service.ejecutar_muchos(list(sources) + ['otro']):
+                text += format_result(result.programa, result.salida, result.error)
+
+            with ServidorEjecucion(os.path.join(directory, 'patito.sock'), service) as server:
+                thread = threading.Thread(target=server.serve_forever)
+                thread.start()
+                client = ClienteServicio(server.server_address)
+                try:
+                    for message in ({'programa': list(sources)[0]}, {'nombre': 'otro'}):
+                        response = client.enviar(message)
+                        text += format_result('socket', response.get('salida', ''), response['error'])
+                    # Un segundo servidor no toma el socket de uno que está atendiendo
+                    try:
+                        ServidorEjecucion(server.server_address, service)
+                    except Exception as e:
+                        text += f"socket en uso: {str(e).replace(directory, '<dir>')}\n"
+                finally:
+                    client.cerrar()
+                    server.shutdown()
+                    thread.join()
+
+            # Ni borra un archivo que no es un socket
+            path = os.path.join(directory, 'datos.txt')
+            with open(path, 'w') as f:
+                f.write("datos\n")
+            try:
+                ServidorEjecucion(path, service)
+            except Exception as e:
+                text += f"no es socket: {str(e).replace(directory, '<dir>')} {os.path.isfile(path)}\n"
+            second = ServicioEjecucion([], 1)
+
+        # Cerrar el primer servicio no descongela los objetos del segundo
+        with second:
+            text += f"congelados con el segundo abierto: {gc.get_freeze_count() > 0}\n"
+            result = second.ejecutar(list(sources)[0])
+            text += format_result('segundo servicio', result.salida, result.error)
+        text += f"congelados al cerrar ambos: {gc.get_freeze_count() > 0}\n"
+    return text
+
+
+class RecordingFile(io.StringIO):
+    # Archivo que guarda cada escritura que le llega
+    def __init__(self):
+        super().__init__()
+        self.writes = []
+
+    def write(self, text):
+        self.writes.append(text)
+        return super().write(text)
+
+
+def check_flush_policies(texts):
+    """
+    Escribe los textos en un canal con cada política de vaciado (bloques de 5 caracteres) y
+    regresa cuántas escrituras llegaron al archivo después de cada texto y al vaciar.
+    """
+    text = ""
+    for policy in ('linea', 'bloque', 'final'):
+        file = RecordingFile()
+        channel = SalidaBuferizada(file, policy, tamano_bloque=5)
+        counts = []
+        for part in texts:
+            channel.escribir(part)
+            counts.append(len(file.writes))
+        channel.vaciar()
+        text += f"{policy}: {counts} -> {file.writes}\n"
+    try:
+        SalidaBuferizada(RecordingFile(), 'nunca')
+    except Exception as e:
+        text += f"{e}\n"
+    return text
+
+
+def check_output_limit(code):
+    """
+    Revisa el límite de SalidaMemoria directamente y al ejecutar un programa con cada motor;
+    el error del límite no menciona un cuádruplo.
+    """
+    channel = SalidaMemoria(limite=5)
+    channel.escribir("ab\n")
+    try:
+        channel.escribir("cd\n")
+    except ErrorLimiteSalida as e:
+        text = f"{channel.valor()!r}: {e}\n"
+    program = compile_source(code)
+    for engine in ('interprete', 'traductor'):
+        channel = SalidaMemoria(limite=10)
         try:
-            result = subprocess.run(
-                f"{compiler_command} {patito_filename}",
-                shell=True,
-                stdout=subprocess.PIPE,
-                stderr=subprocess.PIPE,
-                text=True
-            )
+            program.ejecutar(motor=engine, salida=channel)
+        except ErrorEjecucion as e:
+            text += f"{engine}: {channel.valor()!r}: {e}\n"
+    return text
+
+
+def check_cache_warnings(code):
+    # Compila dos veces con una caché nueva; el acierto debe conservar las advertencias
+    text = ""
+    with tempfile.TemporaryDirectory() as directory:
+        cache = CacheCompilacion(directory)
+        for _ in range(2):
+            compile_source(code, cache)
+            key = cache.clave(code, opciones_compilacion(False))
+            text += f"aciertos {cache.aciertos}: {cache.obtener_advertencias(key)}\n"
+    return text
+
+
+def check_benchmark_phases(code):
+    # correr_fases mide cada fase del caso y de un programa pequeño de escalamiento
+    text = ""
+    for name, source in (('caso', code), ('escalamiento', generar_fuente_escalamiento(20))):
+        times = correr_fases(source)
+        text += f"{name}: {list(times) == list(FASES) and all(t >= 0 for t in times.values())}\n"
+    return text
+
+
+def check_optimized_errors(sources):
+    # Cada programa compilado sin y con -O debe dar la misma salida y el mismo error; el
+    # número de cuádruplo cambia con -O y no se compara
+    text = ""
+    for index, source in enumerate(sources):
+        for optimize in (False, True):
+            with contextlib.redirect_stdout(io.StringIO()):
+                program = compilar(source, optimizar=optimize)
+            output = SalidaMemoria()
+            try:
+                program.ejecutar(salida=output)
+                error = None
+            except ErrorEjecucion as e:
+                error = str(e).split(': ', 1)[1]
+            text += f"programa {index}{' -O' if optimize else ''}: {output.valor()!r} {error}\n"
+    return text
+
+
+def check_truncated_program(code):
+    # Un programa binario cortado después del encabezado o a la mitad de una sección
+    data = serializar(compile_source(code))
+    text = ""
+    for size in (ENCABEZADO.size, ENCABEZADO.size + 5, len(data) - 1):
+        try:
+            deserializar(memoryview(data[:size]))
         except Exception as e:
-            console.print(f"[bold red]Error running compiler:[/]", e)
-            continue
+            text += f"{e}\n"
+    return text
+
+
+# Casos de la ejecución reanudable (MaquinaVirtual) y de ejecutar_concurrente
+api_cases = [
+    {
+        'name': 'api1',
+        'description': 'Ejecución Paso a Paso a Través de una Llamada',
+        'code': '''programa pasos;
+vars
+    a: entero;
+nula muestra(x: entero) {
+    {
+        escribe("x:", x * 2);
+    }
+};
+inicio{
+    a = 4;
+    escribe("antes");
+    muestra(a + 1);
+    escribe("despues", a);
+}fin
+''',
+        'check': check_step_into_function,
+        'expected_output': 'antes\n[dentro de la función]\nx:\n10\n[fuera de la función]\ndespues\n4\n',
+        'expect_error': False
+    },
+    {
+        'name': 'api2',
+        'description': 'Programas Concurrentes con su Propio Canal de Salida',
+        'code': [
+            '''programa uno;
+vars
+    i: entero;
+inicio{
+    i = 0;
+    mientras (i < 3) haz {
+        escribe("uno", i);
+        i = i + 1;
+    };
+}fin
+''',
+            '''programa dos;
+vars
+    i, j: entero;
+inicio{
+    i = 5;
+    escribe("dos", i);
+    escribe("dos", j);
+}fin
+''',
+            '''programa tres;
+vars
+    i: entero;
+inicio{
+    i = 10;
+    mientras (i > 8) haz {
+        escribe("tres", i);
+        i = i - 1;
+    };
+}fin
+''',
+        ],
+        'check': check_concurrent,
+        'expected_output': ('programa 0:\nuno\n0\nuno\n1\nuno\n2\n'
+                            'programa 1:\ndos\n5\ndos\nerror: Error en cuádruplo 6: Error: Operando no inicializado en PRINT.\n'
+                            'programa 2:\ntres\n10\ntres\n9\n'),
+        'expect_error': False
+    },
+    {
+        'name': 'api3',
+        'description': 'Servicio de Ejecución con Programas Precargados',
+        'code': {
+            'saludo': 'programa saludo;\ninicio{\n    escribe("hola");\n}fin\n',
+            'falla': 'programa falla;\nvars\n    a: entero;\ninicio{\n    escribe("a:", a);\n}fin\n',
+        },
+        'check': check_service,
+        'expected_output': ('saludo:\nhola\n'
+                            'falla:\na:\nerror: Error en cuádruplo 3: Error: Operando no inicializado en PRINT.\n'
+                            "otro:\nerror: Error: El programa 'otro' no está cargado en el servicio.\n"
+                            'socket:\nhola\n'
+                            'socket:\nerror: Error: Mensaje inválido; se esperaba {"programa": nombre}.\n'
+                            "socket en uso: Error: El socket '<dir>/patito.sock' está en uso por otro servicio.\n"
+                            "no es socket: Error: '<dir>/datos.txt' ya existe y no es un socket. True\n"
+                            'congelados con el segundo abierto: True\n'
+                            "segundo servicio:\nerror: Error: El programa 'saludo' no está cargado en el servicio.\n"
+                            'congelados al cerrar ambos: False\n'),
+        'expect_error': False
+    },
+    {
+        'name': 'api4',
+        'description': 'Políticas de Vaciado del Canal de Salida',
+        'code': ['ab\n', 'cd\n', 'ef\n'],
+        'check': check_flush_policies,
+        'expected_output': ("linea: [1, 2, 3] -> ['ab\\n', 'cd\\n', 'ef\\n']\n"
+                            "bloque: [0, 1, 1] -> ['ab\\ncd\\n', 'ef\\n']\n"
+                            "final: [0, 0, 0] -> ['ab\\ncd\\nef\\n']\n"
+                            "Error: Política de vaciado 'nunca' desconocida; opciones: linea, bloque, final.\n"),
+        'expect_error': False
+    },
+    {
+        'name': 'api5',
+        'description': 'Límite de Salida en el Canal y en Ambos Motores',
+        'code': '''programa limite;
+vars
+    i: entero;
+inicio{
+    i = 0;
+    mientras (i < 10) haz {
+        escribe("linea", i);
+        i = i + 1;
+    };
+}fin
+''',
+        'check': check_output_limit,
+        'expected_output': ("'ab\\n': Error: La salida del programa excede el límite de 5 caracteres.\n"
+                            "interprete: 'linea\\n0\\n': Error: La salida del programa excede el límite de 10 caracteres.\n"
+                            "traductor: 'linea\\n0\\n': Error: La salida del programa excede el límite de 10 caracteres.\n"),
+        'expect_error': False
+    },
+    {
+        'name': 'api6',
+        'description': 'Advertencias Guardadas con la Caché de Compilación',
+        'code': 'programa avisa;\nvars\n    a, b: entero;\ninicio{\n    a = 1;\n    si (a > 3) {\n        b = 5;\n    };\n    escribe(b);\n}fin\n',
+        'check': check_cache_warnings,
+        'expected_output': ("aciertos 0: [\"Advertencia: La variable 'b' puede leerse sin inicializar (línea 9).\"]\n"
+                            "aciertos 1: [\"Advertencia: La variable 'b' puede leerse sin inicializar (línea 9).\"]\n"),
+        'expect_error': False
+    },
+    {
+        'name': 'api7',
+        'description': 'Fases del Benchmark sobre un Programa Pequeño',
+        'code': 'programa mide;\nvars\n    a: entero;\ninicio{\n    a = 2 + 3;\n    escribe(a);\n}fin\n',
+        'check': check_benchmark_phases,
+        'expected_output': 'caso: True\nescalamiento: True\n',
+        'expect_error': False
+    },
+    {
+        'name': 'api8',
+        'description': 'x * 0 con -O Conserva el Error de Variable No Inicializada',
+        'code': [
+            'programa cero;\nvars\n    a, b: entero;\ninicio{\n    b = a * 0;\n    escribe(b);\n}fin\n',
+            # Con un temporal (siempre inicializado) sí se pliega a 0
+            'programa cero;\nvars\n    a, b: entero;\ninicio{\n    a = 3;\n    b = 0 * (a + 1);\n    escribe(b);\n}fin\n',
+        ],
+        'check': check_optimized_errors,
+        'expected_output': ("programa 0: '' Error: Operando(s) no inicializado(s) en operación '*'.\n"
+                            "programa 0 -O: '' Error: Operando(s) no inicializado(s) en operación '*'.\n"
+                            "programa 1: '0\\n' None\n"
+                            "programa 1 -O: '0\\n' None\n"),
+        'expect_error': False
+    },
+    {
+        'name': 'api9',
+        'description': 'Programa Binario Truncado',
+        'code': 'programa corto;\ninicio{\n    escribe("hola", 1);\n}fin\n',
+        'check': check_truncated_program,
+        'expected_output': 'Error: Programa binario incompleto.\n' * 3,
+        'expect_error': False
+    },
+]
+
+
+# Formas de ejecutar cada caso (argumentos de Programa.ejecutar); la primera da el resultado
+# del caso y las demás deben producir exactamente la misma salida y el mismo mensaje de error
+ENGINES = {
+    'interprete': {'motor': 'interprete'},
+    'sin-superinstrucciones': {'motor': 'interprete', 'superinstrucciones': False},
+    'traductor': {'motor': 'traductor'},
+    # MaquinaVirtual.paso() con porciones pequeñas, para detenerse y reanudar en cada instrucción
+    'por-partes-1': {'presupuesto': 1},
+    'por-partes-3': {'presupuesto': 3},
+}
+
+
+def run_program(program, engine):
+    """Ejecuta un programa compilado y regresa (etapa, salida, errores)."""
+    options = dict(ENGINES[engine])
+    budget = options.pop('presupuesto', None)
+    output = SalidaMemoria()
+    try:
+        if budget is None:
+            program.ejecutar(salida=output, **options)
+        else:
+            machine = MaquinaVirtual(program, salida=output)
+            while not machine.paso(budget):
+                pass
+    except ErrorEjecucion as e:
+        return 'ejecucion', output.valor(), str(e)
+    except Exception as e:
+        # Una excepción que no es ErrorEjecucion es un error del motor
+        return 'excepcion', output.valor(), f"{type(e).__name__}: {e}"
+    return 'ok', output.valor(), ''
+
+
+def run_test(test, optimize=False, engines=tuple(ENGINES)):
+    """
+    Compila y ejecuta un caso dentro del proceso. Regresa un diccionario con la etapa en la
+    que terminó ('ok', 'compilacion' o 'ejecucion'), la salida del programa, los errores,
+    los tiempos de compilación y ejecución, y si el caso pasó. El caso se ejecuta con cada
+    motor de 'engines' y falla si sus resultados no coinciden con los del primero.
+    """
+    result = {'name': test['name'], 'description': test['description'], 'stage': 'ok',
+              'output': '', 'errors': '', 'compile_time': 0.0, 'run_time': 0.0}
+    if 'check' in test:
+        # Casos que revisan una API directamente; 'check' regresa el texto a comparar
+        start = time.perf_counter()
+        result['output'] = test['check'](test['code'])
+        result['run_time'] = time.perf_counter() - start
+        result['passed'] = test_passed(test, result)
+        return result
+
+    # Los mensajes del compilador y los errores de sintaxis de ANTLR se capturan
+    messages = io.StringIO()
+    start = time.perf_counter()
+    try:
+        with contextlib.redirect_stdout(io.StringIO()), contextlib.redirect_stderr(messages):
+            program = compilar(f"programa {test['name']};\n" + test['code'], optimizar=optimize)
+    except ErrorCompilacion as e:
+        result['stage'] = 'compilacion'
+        result['errors'] = messages.getvalue() + "\n".join(e.errores)
+    except Exception as e:
+        result['stage'] = 'compilacion'
+        result['errors'] = messages.getvalue() + f"Error durante el análisis: {e}"
+    result['compile_time'] = time.perf_counter() - start
+
+    mismatches = []
+    if result['stage'] == 'ok':
+        start = time.perf_counter()
+        result['stage'], result['output'], result['errors'] = reference = run_program(program, engines[0])
+        result['run_time'] = time.perf_counter() - start
+        for engine in engines[1:]:
+            other = run_program(program, engine)
+            if other != reference:
+                mismatches.append(f"Motor '{engine}' difiere de '{engines[0]}':\n"
+                                  f"  etapa: {other[0]}\n  salida: {other[1]!r}\n  errores: {other[2]!r}")
+
+    result['passed'] = test_passed(test, result, optimize) and not mismatches
+    if mismatches:
+        result['errors'] = "\n".join([result['errors']] + mismatches).strip()
+    return result
+
 
-        # Capturar salida y determinar si pasó el test
-        stdout = result.stdout
-        stderr = result.stderr
+def test_passed(test, result, optimize=False):
+    if test['expect_error']:
+        return result['stage'] == 'compilacion'
+    expected_error = test.get('expect_runtime_error')
+    if optimize:
+        expected_error = test.get('expect_runtime_error_optimized', expected_error)
+    if expected_error:
+        return result['stage'] == 'ejecucion' and expected_error in result['errors']
+    return result['stage'] == 'ok' and result['output'] == test.get('expected_output', result['output'])
+
+
+def run_tests(tests, workers=1, optimize=False, engines=tuple(ENGINES)):
+    """Corre los casos en este proceso o en un pool de 'workers' procesos, en orden."""
+    if workers == 1 or len(tests) <= 1:
+        return [run_test(test, optimize, engines) for test in tests]
+    chunksize = max(1, len(tests) // (workers * 4))
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        return list(pool.map(run_test, tests, [optimize] * len(tests), [engines] * len(tests),
+                             chunksize=chunksize))
+
+
+def display_test_result(test, result, verbose=False):
+    timing = f"[dim]({result['compile_time'] * 1000:.1f} ms + {result['run_time'] * 1000:.1f} ms)[/]"
+    if result['passed']:
+        expected = " (Expected Error)" if test['expect_error'] or test.get('expect_runtime_error') else ""
+        console.print(f":white_check_mark: [bold green]{test['name']}[/] - {test['description']} PASSED{expected} {timing}",
+                      style="bold green")
+        if verbose and (result['output'] or result['errors']):
+            console.print(Panel(result['output'] or result['errors'], title="Output", expand=False,
+                                border_style="green"))
+        return
+
+    console.print(f":x: [bold red]{test['name']}[/] - {test['description']} FAILED {timing}", style="bold red")
+    if 'expected_output' in test and result['output'] != test['expected_output']:
+        console.print(Panel(test['expected_output'], title="Expected Output", expand=False, border_style="yellow"))
+    if result['output']:
+        console.print(Panel(result['output'], title="Program Output", expand=False, border_style="red"))
+    if result['errors']:
+        console.print(Panel(result['errors'], title="Error Output", expand=False, border_style="red"))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compila y ejecuta los casos de prueba de Patito.')
+    parser.add_argument('-j', '--workers', type=int, default=os.cpu_count() or 1,
+                        help='Procesos para correr los casos (por defecto uno por núcleo).')
+    parser.add_argument('-g', '--generated', type=int, default=0, metavar='N',
+                        help='Agrega N casos generados con su salida esperada.')
+    parser.add_argument('--seed', type=int, default=0, help='Semilla de los casos generados.')
+    parser.add_argument('-k', dest='filter', help='Corre solo los casos cuyo nombre contiene el texto.')
+    parser.add_argument('-O', '--optimize', action='store_true', help='Compila los casos con las optimizaciones.')
+    parser.add_argument('--engine', choices=list(ENGINES),
+                        help='Ejecuta los casos solo con este motor (por defecto con todos, comparando sus resultados).')
+    parser.add_argument('-v', '--verbose', action='store_true', help='Muestra la salida de los casos que pasan.')
+    parser.add_argument('-q', '--quiet', action='store_true', help='Muestra solo los casos que fallan.')
+    args = parser.parse_args()
+
+    tests = test_cases + fusion_cases + api_cases + generate_test_cases(args.generated, args.seed)
+    if args.filter:
+        tests = [test for test in tests if args.filter in test['name']]
+    total_tests = len(tests)
+
+    console.print(f"\n[bold yellow]Running {total_tests} test cases[/]", style="bold yellow")
 
-        if (test['expect_error'] and result.returncode != 0) or (not test['expect_error'] and result.returncode == 0):
-            passed_tests += 1
+    start = time.perf_counter()
+    results = run_tests(tests, args.workers, args.optimize, (args.engine,) if args.engine else tuple(ENGINES))
+    elapsed = time.perf_counter() - start
 
-        # Mostrar resultado del test
-        display_test_result(test_name, description, result, stdout, stderr, test['expect_error'])
+    for test, result in zip(tests, results):
+        if not (args.quiet and result['passed']):
+            display_test_result(test, result, args.verbose)
 
     # Resumen de resultados
-    summary_text = Text(f"\n{passed_tests} out of {total_tests} tests passed.",
+    passed_tests = sum(result['passed'] for result in results)
+    per_test = 1000 * sum(result['compile_time'] + result['run_time'] for result in results) / max(total_tests, 1)
+    summary_text = Text(f"\n{passed_tests} out of {total_tests} tests passed in {elapsed:.2f} s "
+                        f"({per_test:.1f} ms per test, {args.workers} workers).",
                         style="bold green" if passed_tests == total_tests else "bold red")
     console.print(Panel(summary_text, title="Test Summary", box=box.DOUBLE))
+    if passed_tests != total_tests:
+        sys.exit(1)
 
 
 if __name__ == '__main__':
@@ -0,0 +1,459 @@
+import os
+import sys
+import math
+import hashlib
+import tempfile
+import threading
+
+import bytecode
+import salida as salidas
+from opcodes import *
+from VirtualMemory import VirtualMemory, SEGMENT_SIZE
+from virtual_machine import ErrorCuadruplo, ErrorEjecucion, Memory, validar_direcciones
+
+# Motor de ejecución alternativo: traduce el programa compilado a código fuente de Python
+# y lo ejecuta con compile()/exec en lugar de interpretar un cuádruplo a la vez.
+#
+#   - Cada función de Patito (y el programa principal) se traduce a una función de Python.
+#   - Las direcciones locales y temporales son variables locales de esa función, las
+#     globales son variables globales del módulo generado y las constantes son literales.
+#   - El código de cada función se divide en bloques básicos en los destinos de los saltos;
+#     un ciclo 'while' elige el siguiente bloque con una búsqueda binaria sobre su índice.
+#   - ERA/PARAM/GOSUB se traducen a una llamada con los parámetros como argumentos.
+#   - Los PRINT consecutivos de un bloque se escriben con una sola llamada a 'escribir', el
+#     canal de salida de la ejecución (ver salida.py).
+#   - CUADRUPLOS relaciona cada línea generada con su cuádruplo, para reportar en qué
+#     cuádruplo ocurre cualquier excepción de Python (por ejemplo, OverflowError).
+#
+# La salida y los mensajes de error son los mismos que los del intérprete.
+
+# Cambiar si cambia el código generado, para invalidar las traducciones guardadas
+VERSION_TRADUCTOR = 4
+
+# Operador de Python de cada operación tipada; la división entre enteros es entera
+OPERADORES = {
+    codigo: '//' if (operador, tipo) == ('/', 'entero') else operador
+    for operador, codigos in OPERACIONES_TIPADAS.items()
+    for tipo, codigo in zip(TIPOS_OPERACION, codigos)
+}
+CODIGOS_RELACIONALES = {codigo for operador in RELACIONALES for codigo in OPERACIONES_TIPADAS[operador]}
+DIVISIONES = OPERACIONES_TIPADAS['/']
+SALTOS_SI_VERDADERO_CODIGOS = {codigo for codigos in SALTOS_SI_VERDADERO.values() for codigo in codigos}
+SALTOS = (GOTO, GOTOF) + SALTOS_FUSIONADOS
+TERMINALES = (GOTO, END, ENDFUNC)
+
+# Cada llamada de Patito es una llamada de Python; el programa corre en un hilo con una pila
+# grande y un límite de recursión alto para llegar a la misma profundidad que el intérprete
+PILA_HILO = 512 * 1024 * 1024
+LIMITE_RECURSION = 200_000
+
+
+def alcance_de(direccion):
+    return SEGMENTOS[direccion // SEGMENT_SIZE]
+
+
+def _segmentos():
+    segmentos = {}
+    for alcance, tipos in VirtualMemory().segments.items():
+        for rango in tipos.values():
+            segmentos[rango['start'] // SEGMENT_SIZE] = alcance
+    return segmentos
+
+
+SEGMENTOS = _segmentos()
+
+
+def literal(valor):
+    # Los flotantes no finitos (resultado del plegado de constantes) no tienen literal
+    if isinstance(valor, float) and not math.isfinite(valor):
+        return f"float('{valor}')"
+    return repr(valor)
+
+
+class Traductor:
+    def __init__(self, programa):
+        self.programa = programa
+        self.codigo = programa.instrucciones
+        self.funciones = programa.funciones
+        self.constantes = {direccion: valor for direccion, valor, _ in programa.constantes}
+        self.lineas = []
+        # Cuádruplo que genera cada línea (None si no corresponde a ninguno)
+        self.origenes = []
+        self.contador = None
+        # Globales usadas en todo el programa y en la función que se está traduciendo
+        self.globales = set()
+        self.globales_funcion = set()
+        self.indice = 0
+        # Variables que ya se sabe que no son None en el bloque actual
+        self.inicializadas = set()
+        # Operandos de los PRINT consecutivos que aún no se escriben y el cuádruplo del primero
+        self.impresiones = []
+        self.inicio_impresiones = None
+        # El compilador ya demostró que ningún operando se lee sin inicializar
+        self.verificado = bool(programa.banderas & bytecode.INICIALIZACION_VERIFICADA)
+
+    def emitir(self, nivel, texto):
+        self.lineas.append('    ' * nivel + texto)
+        self.origenes.append(self.contador)
+
+    def operando(self, direccion):
+        # Expresión de Python que lee la dirección
+        alcance = alcance_de(direccion)
+        if alcance == 'constante':
+            return literal(self.constantes.get(direccion))
+        if alcance == 'global':
+            self.globales_funcion.add(direccion)
+            return f"g{direccion}"
+        return f"{alcance[0]}{direccion}"
+
+    def puede_ser_nulo(self, direccion):
+        return alcance_de(direccion) != 'constante' or self.constantes.get(direccion) is None
+
+    def verificar(self, nivel, direcciones, contador, mensaje):
+        # Verificación de operandos no inicializados, igual que en el intérprete. Ninguna
+        # instrucción escribe None, así que una variable ya verificada o escrita en el bloque
+        # no se vuelve a verificar.
+        if self.verificado:
+            return
+        nulos = []
+        for direccion in direcciones:
+            nombre = self.operando(direccion)
+            if self.puede_ser_nulo(direccion) and nombre not in self.inicializadas and nombre not in nulos:
+                nulos.append(nombre)
+        self.inicializadas.update(nulos)
+        if nulos:
+            condicion = ' or '.join(f"{nombre} is None" for nombre in nulos)
+            self.emitir(nivel, f"if {condicion}: raise ErrorCuadruplo({contador}, {mensaje!r})")
+
+    def regiones(self):
+        # Cuádruplos de cada función (ver Programa.funcion_de_cuadruplos)
+        regiones = {indice: [] for indice in range(len(self.funciones))}
+        for contador, indice in enumerate(self.programa.funcion_de_cuadruplos()):
+            regiones[indice].append(contador)
+        return regiones
+
+    def parametros(self):
+        # Direcciones que escribe PARAM en cada función, en el orden de sus argumentos
+        parametros = {indice: set() for indice in range(len(self.funciones))}
+        funcion = None
+        for codigo_operacion, operando1, _, resultado in self.codigo:
+            if codigo_operacion == ERA:
+                funcion = operando1
+            elif codigo_operacion == PARAM:
+                if funcion is None:
+                    raise Exception("Error: PARAM sin ERA previo; el programa no se puede traducir.")
+                parametros[funcion].add(resultado)
+        return {indice: sorted(direcciones) for indice, direcciones in parametros.items()}
+
+    def traducir(self):
+        parametros = self.parametros()
+        cuerpos = []
+        for indice, contadores in self.regiones().items():
+            self.lineas = []
+            self.origenes = []
+            self.traducir_funcion(indice, contadores, parametros)
+            cuerpos.append((self.lineas, self.origenes))
+
+        lineas = ['# Código generado por traductor.py a partir de un programa de Patito']
+        for direccion in sorted(self.globales):
+            lineas.append(f"g{direccion} = None")
+        cuadruplos = {}
+        for cuerpo, origenes in cuerpos:
+            lineas.append('')
+            for linea, origen in zip(cuerpo, origenes):
+                lineas.append(linea)
+                if origen is not None:
+                    # Número de línea en el archivo, después de la cabecera con la clave
+                    cuadruplos[len(lineas) + 1] = origen
+        lineas.append('')
+        lineas.append(f"CUADRUPLOS = {cuadruplos!r}")
+        return '\n'.join(lineas) + '\n'
+
+    def traducir_funcion(self, indice, contadores, parametros):
+        self.indice = indice
+        self.globales_funcion = set()
+        en_region = set(contadores)
+        # Líderes de bloque: la entrada, los destinos de salto y lo que sigue a un salto
+        entrada = 0 if indice == 0 else self.funciones[indice]['inicio']
+        lideres = {entrada}
+        for contador in contadores:
+            codigo_operacion, _, _, destino = self.codigo[contador]
+            if codigo_operacion in SALTOS:
+                if destino < len(self.codigo) and destino not in en_region:
+                    raise Exception(f"Error: El salto del cuádruplo {contador} sale de su función.")
+                lideres.add(destino)
+                lideres.add(contador + 1)
+        lideres = sorted(lider for lider in lideres if lider in en_region)
+
+        # Variables locales y temporales de la función
+        variables = set()
+        for contador in contadores:
+            codigo_operacion = self.codigo[contador][0]
+            for posicion in OPERANDOS_DIRECCION.get(codigo_operacion, ()):
+                direccion = self.codigo[contador][posicion]
+                if codigo_operacion == PARAM and posicion == 3:
+                    continue
+                if alcance_de(direccion) in ('local', 'temporal'):
+                    variables.add(direccion)
+        argumentos = [f"l{direccion}=None" for direccion in parametros[indice]]
+        nombres = sorted(self.operando(direccion) for direccion in variables - set(parametros[indice]))
+
+        self.contador = None
+        self.emitir(0, f"def funcion_{indice}({', '.join(argumentos)}):")
+        cabecera = len(self.lineas)
+        if nombres:
+            self.emitir(1, ' = '.join(nombres) + ' = None')
+
+        # Cada bloque va de su líder hasta el siguiente líder o un salto incondicional
+        bloques = {}
+        for lider in lideres:
+            bloque = [lider]
+            contador = lider
+            while self.codigo[contador][0] not in TERMINALES and contador + 1 in en_region and contador + 1 not in lideres:
+                contador += 1
+                bloque.append(contador)
+            bloques[lider] = bloque
+
+        if not lideres:
+            self.emitir(1, "return")
+        elif len(lideres) == 1:
+            self.traducir_bloque(1, bloques[lideres[0]], en_region, parametros)
+        else:
+            self.emitir(1, f"bloque = {entrada}")
+            self.emitir(1, "while True:")
+            self.traducir_despacho(2, lideres, bloques, en_region, parametros)
+
+        # Las globales se declaran al final porque se descubren al traducir los operandos
+        self.globales |= self.globales_funcion
+        globales = sorted(f"g{direccion}" for direccion in self.globales_funcion)
+        if globales:
+            self.lineas.insert(cabecera, f"    global {', '.join(globales)}")
+            self.origenes.insert(cabecera, None)
+
+    def traducir_despacho(self, nivel, lideres, bloques, en_region, parametros):
+        # Búsqueda binaria sobre el índice del bloque
+        self.contador = None
+        if len(lideres) == 1:
+            self.traducir_bloque(nivel, bloques[lideres[0]], en_region, parametros)
+            return
+        mitad = len(lideres) // 2
+        self.emitir(nivel, f"if bloque < {lideres[mitad]}:")
+        self.traducir_despacho(nivel + 1, lideres[:mitad], bloques, en_region, parametros)
+        self.emitir(nivel, "else:")
+        self.traducir_despacho(nivel + 1, lideres[mitad:], bloques, en_region, parametros)
+
+    def salto(self, destino, en_region):
+        return f"bloque = {destino}" if destino in en_region else "return"
+
+    def escribir(self, nivel, direccion, expresion):
+        nombre = self.operando(direccion)
+        self.emitir(nivel, f"{nombre} = {expresion}")
+        self.inicializadas.add(nombre)
+
+    def imprimir_pendientes(self, nivel):
+        if self.impresiones:
+            formato = '%s\\n' * len(self.impresiones)
+            contador, self.contador = self.contador, self.inicio_impresiones
+            self.emitir(nivel, f"escribir('{formato}' % ({', '.join(self.impresiones)},))")
+            self.contador = contador
+            self.impresiones = []
+
+    def traducir_bloque(self, nivel, bloque, en_region, parametros):
+        argumentos = {}
+        self.inicializadas = set()
+        for contador in bloque:
+            codigo_operacion, operando1, operando2, resultado = self.codigo[contador]
+            if codigo_operacion != PRINT:
+                self.imprimir_pendientes(nivel)
+            self.contador = contador
+            if codigo_operacion in OPERADORES:
+                operador = OPERADOR_Y_TIPO[codigo_operacion][0]
+                tipo_operacion = 'operación relacional' if codigo_operacion in CODIGOS_RELACIONALES else 'operación'
+                self.verificar(nivel, (operando1, operando2), contador,
+                               f"Error: Operando(s) no inicializado(s) en {tipo_operacion} '{operador}'.")
+                izquierda, derecha = self.operando(operando1), self.operando(operando2)
+                if codigo_operacion in DIVISIONES:
+                    if alcance_de(operando2) != 'constante' or self.constantes.get(operando2) == 0:
+                        self.emitir(nivel, f"if {derecha} == 0: raise ErrorCuadruplo({contador}, 'Error: División por cero.')")
+                self.escribir(nivel, resultado, f"{izquierda} {OPERADORES[codigo_operacion]} {derecha}")
+            elif codigo_operacion == A_FLOTANTE:
+                self.verificar(nivel, (operando1,), contador,
+                               "Error: Operando no inicializado en conversión a flotante.")
+                self.escribir(nivel, resultado, f"float({self.operando(operando1)})")
+            elif codigo_operacion == ASIGNA:
+                self.verificar(nivel, (operando1,), contador, "Error: Operando no inicializado en asignación '='.")
+                self.escribir(nivel, resultado, self.operando(operando1))
+            elif codigo_operacion == PRINT:
+                nombre = self.operando(operando1)
+                if not self.verificado and self.puede_ser_nulo(operando1) and nombre not in self.inicializadas:
+                    # Lo impreso antes de un operando no inicializado se escribe antes del error
+                    self.imprimir_pendientes(nivel)
+                self.verificar(nivel, (operando1,), contador, "Error: Operando no inicializado en PRINT.")
+                if not self.impresiones:
+                    self.inicio_impresiones = contador
+                self.impresiones.append(nombre)
+            elif codigo_operacion == ERA:
+                argumentos = {}
+            elif codigo_operacion == PARAM:
+                self.verificar(nivel, (operando1,), contador, "Error: Operando no inicializado en PARAM.")
+                argumentos[resultado] = self.operando(operando1)
+            elif codigo_operacion == GOSUB:
+                valores = [argumentos.get(direccion, 'None') for direccion in parametros[operando1]]
+                self.emitir(nivel, f"funcion_{operando1}({', '.join(valores)})")
+                argumentos = {}
+            elif codigo_operacion == GOTO:
+                self.emitir(nivel, self.salto(resultado, en_region))
+                return
+            elif codigo_operacion == GOTOF:
+                self.emitir(nivel, f"if not {self.operando(operando1)}:")
+                self.emitir(nivel + 1, self.salto(resultado, en_region))
+                self.emitir(nivel, "else:")
+                self.emitir(nivel + 1, self.salto(contador + 1, en_region))
+                return
+            elif codigo_operacion in SALTOS_FUSIONADOS:
+                operador = OPERADOR_Y_TIPO[codigo_operacion][0]
+                self.verificar(nivel, (operando1, operando2), contador,
+                               f"Error: Operando(s) no inicializado(s) en operación relacional '{operador}'.")
+                si_verdadero, si_falso = contador + 1, resultado
+                if codigo_operacion in SALTOS_SI_VERDADERO_CODIGOS:
+                    si_verdadero, si_falso = resultado, contador + 1
+                self.emitir(nivel, f"if {self.operando(operando1)} {operador} {self.operando(operando2)}:")
+                self.emitir(nivel + 1, self.salto(si_verdadero, en_region))
+                self.emitir(nivel, "else:")
+                self.emitir(nivel + 1, self.salto(si_falso, en_region))
+                return
+            elif codigo_operacion == ENDFUNC:
+                if self.indice != 0:
+                    self.emitir(nivel, "return")
+                else:
+                    self.emitir(nivel, f"raise ErrorCuadruplo({contador}, "
+                                       "'Error: Pila de retornos vacía al finalizar función.')")
+                return
+            elif codigo_operacion == END:
+                self.emitir(nivel, "return")
+                return
+        # El bloque continúa en el siguiente cuádruplo
+        self.imprimir_pendientes(nivel)
+        self.emitir(nivel, self.salto(bloque[-1] + 1, en_region))
+
+
+def traducir(programa):
+    """Regresa el código fuente de Python equivalente al programa compilado."""
+    return Traductor(programa).traducir()
+
+
+def clave_traduccion(programa):
+    h = hashlib.sha256(f"traductor:{VERSION_TRADUCTOR}".encode())
+    h.update(bytecode.serializar(programa))
+    return h.hexdigest()
+
+
+def ruta_en_directorio(directorio, programa):
+    # Ruta de la traducción dentro de un directorio de caché, direccionada por contenido
+    return os.path.join(directorio, f"{clave_traduccion(programa)}.py")
+
+
+def obtener_codigo(programa, ruta=None):
+    """
+    Regresa el código objeto de la traducción del programa. Si se da 'ruta', la traducción
+    se guarda ahí y se reutiliza mientras la clave de su primera línea coincida.
+    """
+    clave = clave_traduccion(programa)
+    cabecera = f"# clave: {clave}\n"
+    fuente = None
+    if ruta is not None and os.path.exists(ruta):
+        with open(ruta, 'r', encoding='utf-8') as f:
+            if f.readline() == cabecera:
+                fuente = cabecera + f.read()
+    if fuente is None:
+        fuente = cabecera + traducir(programa)
+        if ruta is not None:
+            guardar_traduccion(ruta, fuente)
+    return compile(fuente, ruta or '<patito>', 'exec')
+
+
+def guardar_traduccion(ruta, fuente):
+    directorio = os.path.dirname(os.path.abspath(ruta))
+    os.makedirs(directorio, exist_ok=True)
+    descriptor, temporal = tempfile.mkstemp(dir=directorio, suffix='.tmp')
+    try:
+        with os.fdopen(descriptor, 'w', encoding='utf-8') as f:
+            f.write(fuente)
+        os.replace(temporal, ruta)
+    except BaseException:
+        if os.path.exists(temporal):
+            os.remove(temporal)
+        raise
+
+
+def cuadruplo_de_excepcion(error, archivo, cuadruplos):
+    # Cuádruplo de la línea generada más interna del traceback
+    contador = None
+    rastro = error.__traceback__
+    while rastro is not None:
+        if rastro.tb_frame.f_code.co_filename == archivo:
+            contador = cuadruplos.get(rastro.tb_lineno, contador)
+        rastro = rastro.tb_next
+    return contador
+
+
+def ejecutar_en_hilo(funcion):
+    """
+    Llama a 'funcion' en un hilo con PILA_HILO bytes de pila y regresa su resultado o lanza
+    su excepción en el hilo que llama. El límite de recursión es del proceso: solo se sube.
+    """
+    if sys.getrecursionlimit() < LIMITE_RECURSION:
+        sys.setrecursionlimit(LIMITE_RECURSION)
+    resultado = {}
+
+    def correr():
+        try:
+            resultado['valor'] = funcion()
+        except BaseException as e:
+            resultado['error'] = e
+
+    # El tamaño de pila solo aplica a los hilos que se crean mientras está configurado
+    anterior = threading.stack_size(PILA_HILO)
+    try:
+        hilo = threading.Thread(target=correr, name='patito-traductor', daemon=True)
+        hilo.start()
+    finally:
+        threading.stack_size(anterior)
+    hilo.join()
+    if 'error' in resultado:
+        raise resultado['error']
+    return resultado.get('valor')
+
+
+def ejecutar_traducido(programa, ruta=None, salida=None):
+    """
+    Ejecuta el programa con el motor traductor. Lanza virtual_machine.ErrorEjecucion con
+    los mismos mensajes que el intérprete. 'salida' es el canal de PRINT (ver salida.py;
+    por defecto la salida estándar).
+    """
+    codigo = programa.instrucciones + [(END, SIN_OPERANDO, SIN_OPERANDO, SIN_OPERANDO)]
+    try:
+        validar_direcciones(codigo, len(programa.funciones), Memory())
+        codigo_objeto = obtener_codigo(programa, ruta)
+    except Exception as e:
+        raise ErrorEjecucion(str(e)) from e
+
+    if salida is None:
+        salida = salidas.SalidaBuferizada()
+    espacio = {'ErrorCuadruplo': ErrorCuadruplo, 'escribir': salida.escribir}
+    exec(codigo_objeto, espacio)
+    try:
+        ejecutar_en_hilo(espacio['funcion_0'])
+    except ErrorCuadruplo as e:
+        raise ErrorEjecucion(f"Error en cuádruplo {e.contador}: {e.mensaje}") from e
+    except RecursionError as e:
+        raise ErrorEjecucion("Error: Demasiadas llamadas anidadas para el motor traductor.") from e
+    except salidas.ErrorLimiteSalida as e:
+        raise ErrorEjecucion(str(e)) from e
+    except Exception as e:
+        # Cualquier otra excepción (OverflowError, ...) se reporta en su cuádruplo, igual que
+        # en el intérprete
+        contador = cuadruplo_de_excepcion(e, codigo_objeto.co_filename, espacio['CUADRUPLOS'])
+        raise ErrorEjecucion(f"Error en cuádruplo {contador}: {e}") from e
+    finally:
+        salida.vaciar()
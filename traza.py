@@ -0,0 +1,194 @@
+import sys
+import struct
+import argparse
+from collections import deque
+
+from opcodes import OPERANDOS_DIRECCION
+from VirtualMemory import SEGMENT_SIZE
+
+# Traza de ejecución de la máquina virtual.
+#
+# Cada registro es (contador, instrucción, valores) donde 'valores' son los valores de
+# los operandos de entrada de la instrucción antes de ejecutarla. Los últimos registros
+# se guardan en un buffer circular que se adjunta al ErrorEjecucion si el programa falla,
+# y opcionalmente se escriben todos en un archivo binario compacto:
+#
+#   Encabezado   magia 'PTTR' y versión
+#   Registros    contador (uint32), código (uint8), operando1, operando2, resultado (int32)
+#                y un valor etiquetado por cada operando de entrada del código
+#
+# El archivo se decodifica con: python traza.py <archivo> [-p programa.pbc]
+
+MAGIA_TRAZA = b'PTTR'
+VERSION_TRAZA = 1
+
+ENCABEZADO_TRAZA = struct.Struct('<4sH')
+REGISTRO = struct.Struct('<IBiii')
+ETIQUETA = struct.Struct('<B')
+VALOR_ENTERO = struct.Struct('<q')
+VALOR_FLOTANTE = struct.Struct('<d')
+LONGITUD = struct.Struct('<I')
+
+# Etiquetas de los valores en el archivo binario
+NINGUNO, ENTERO, FLOTANTE, BOOLEANO, CADENA, ENTERO_GRANDE = range(6)
+
+# Posiciones de los operandos de entrada por código de operación (el resultado no se lee)
+ENTRADAS = {codigo: tuple(posicion for posicion in posiciones if posicion != 3)
+            for codigo, posiciones in OPERANDOS_DIRECCION.items()}
+
+CAPACIDAD_TRAZA = 64
+TAMANO_BUFFER_ARCHIVO = 1 << 16
+
+
+class Traza:
+    """
+    Registro de las instrucciones ejecutadas. Guarda las últimas 'capacidad' en un buffer
+    circular y, si se da 'ruta', escribe cada registro en un archivo binario.
+    Se usa como administrador de contexto para cerrar el archivo.
+    """
+    def __init__(self, capacidad=CAPACIDAD_TRAZA, ruta=None):
+        self.recientes = deque(maxlen=capacidad)
+        self.archivo = None
+        self.pendiente = bytearray()
+        if ruta is not None:
+            self.archivo = open(ruta, 'wb')
+            self.archivo.write(ENCABEZADO_TRAZA.pack(MAGIA_TRAZA, VERSION_TRAZA))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *excepcion):
+        self.cerrar()
+
+    def registrar(self, contador, instruccion, tablas):
+        codigo = instruccion[0]
+        valores = tuple(tablas[instruccion[posicion] // SEGMENT_SIZE][instruccion[posicion] % SEGMENT_SIZE]
+                        for posicion in ENTRADAS.get(codigo, ()))
+        self.recientes.append((contador, instruccion, valores))
+        if self.archivo is not None:
+            self.pendiente += REGISTRO.pack(contador, codigo, *instruccion[1:])
+            for valor in valores:
+                self.pendiente += codificar_valor(valor)
+            if len(self.pendiente) >= TAMANO_BUFFER_ARCHIVO:
+                self.vaciar()
+
+    def registros(self):
+        return list(self.recientes)
+
+    def vaciar(self):
+        if self.archivo is not None and self.pendiente:
+            self.archivo.write(self.pendiente)
+            self.pendiente.clear()
+
+    def cerrar(self):
+        if self.archivo is not None:
+            self.vaciar()
+            self.archivo.close()
+            self.archivo = None
+
+
+def codificar_valor(valor):
+    if valor is None:
+        return ETIQUETA.pack(NINGUNO)
+    if isinstance(valor, bool):
+        return ETIQUETA.pack(BOOLEANO) + ETIQUETA.pack(valor)
+    if isinstance(valor, int):
+        try:
+            return ETIQUETA.pack(ENTERO) + VALOR_ENTERO.pack(valor)
+        except struct.error:
+            # Enteros que no caben en 64 bits se guardan como texto decimal
+            datos = str(valor).encode()
+            return ETIQUETA.pack(ENTERO_GRANDE) + LONGITUD.pack(len(datos)) + datos
+    if isinstance(valor, float):
+        return ETIQUETA.pack(FLOTANTE) + VALOR_FLOTANTE.pack(valor)
+    datos = str(valor).encode('utf-8')
+    return ETIQUETA.pack(CADENA) + LONGITUD.pack(len(datos)) + datos
+
+
+def decodificar_valor(datos, desplazamiento):
+    # Regresa (valor, desplazamiento siguiente)
+    etiqueta = datos[desplazamiento]
+    desplazamiento += 1
+    if etiqueta == NINGUNO:
+        return None, desplazamiento
+    if etiqueta == BOOLEANO:
+        return bool(datos[desplazamiento]), desplazamiento + 1
+    if etiqueta == ENTERO:
+        return VALOR_ENTERO.unpack_from(datos, desplazamiento)[0], desplazamiento + VALOR_ENTERO.size
+    if etiqueta == FLOTANTE:
+        return VALOR_FLOTANTE.unpack_from(datos, desplazamiento)[0], desplazamiento + VALOR_FLOTANTE.size
+    if etiqueta in (CADENA, ENTERO_GRANDE):
+        longitud = LONGITUD.unpack_from(datos, desplazamiento)[0]
+        inicio = desplazamiento + LONGITUD.size
+        texto = str(datos[inicio:inicio + longitud], 'utf-8')
+        return (int(texto) if etiqueta == ENTERO_GRANDE else texto), inicio + longitud
+    raise Exception(f"Error: Etiqueta de valor desconocida en la traza: {etiqueta}.")
+
+
+def leer_traza(ruta):
+    """
+    Lee un archivo de traza binario y genera los registros (contador, instrucción, valores).
+    """
+    with open(ruta, 'rb') as f:
+        datos = f.read()
+    if len(datos) < ENCABEZADO_TRAZA.size:
+        raise Exception(f"Error: '{ruta}' no es una traza de Patito válida.")
+    magia, version = ENCABEZADO_TRAZA.unpack_from(datos)
+    if magia != MAGIA_TRAZA:
+        raise Exception(f"Error: '{ruta}' no es una traza de Patito.")
+    if version != VERSION_TRAZA:
+        raise Exception(f"Error: Versión de traza {version} no soportada (se esperaba {VERSION_TRAZA}).")
+
+    desplazamiento = ENCABEZADO_TRAZA.size
+    while desplazamiento < len(datos):
+        contador, codigo, *operandos = REGISTRO.unpack_from(datos, desplazamiento)
+        desplazamiento += REGISTRO.size
+        valores = []
+        for _ in ENTRADAS.get(codigo, ()):
+            valor, desplazamiento = decodificar_valor(datos, desplazamiento)
+            valores.append(valor)
+        yield contador, (codigo, *operandos), tuple(valores)
+
+
+def formatear_registro(registro, funciones=None):
+    # Importación diferida: virtual_machine depende de este módulo
+    from virtual_machine import formatear_instruccion
+    contador, instruccion, valores = registro
+    texto = f"{contador}: {formatear_instruccion(instruccion, funciones)}"
+    if valores:
+        texto += "  valores: " + ", ".join(repr(valor) for valor in valores)
+    return texto
+
+
+def imprimir_registros(registros, funciones=None, archivo=sys.stderr):
+    # La salida del programa va a stdout; se vacía primero para conservar el orden
+    sys.stdout.flush()
+    print("Últimas instrucciones ejecutadas:", file=archivo)
+    for registro in registros:
+        print(f"  {formatear_registro(registro, funciones)}", file=archivo)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Decodifica una traza binaria de la máquina virtual de Patito.')
+    parser.add_argument('traza', help='Archivo de traza escrito con --traza-archivo.')
+    parser.add_argument('-p', '--programa', help='Programa compilado, para mostrar los nombres de las funciones.')
+    args = parser.parse_args()
+
+    funciones = None
+    if args.programa:
+        import bytecode
+        funciones = bytecode.cargar(args.programa).nombres_funciones()
+
+    try:
+        for registro in leer_traza(args.traza):
+            print(formatear_registro(registro, funciones))
+    except FileNotFoundError:
+        print(f"Error: '{args.traza}' no encontrado.")
+    except BrokenPipeError:
+        pass
+    except Exception as e:
+        print(e)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,12 +1,23 @@
 import sys
+import asyncio
+import contextlib
 import argparse  # Importamos argparse para manejar argumentos de línea de comandos
+import operator
+import time
+import bytecode
+import traza as trazas
+import salida as salidas
+import perfil as perfiles
+import superinstrucciones
+from opcodes import *
+from VirtualMemory import VirtualMemory, SEGMENT_SIZE
 
 class MemoryStack:
     def __init__(self):
         self.stack = []
 
-    def push(self, local_memory, temp_memory):
-        self.stack.append((local_memory, temp_memory))
+    def push(self, frame):
+        self.stack.append(frame)
 
     def pop(self):
         if self.stack:
@@ -14,273 +25,781 @@ class MemoryStack:
         else:
             raise Exception("Error: Pila de memoria vacía al intentar hacer pop.")
 
-    def current_local(self):
+    def current(self):
         if self.stack:
-            return self.stack[-1][0]
+            return self.stack[-1]
         else:
-            return {}
+            return None
 
-    def current_temp(self):
-        if self.stack:
-            return self.stack[-1][1]
-        else:
-            return {}
+class FramePool:
+    """
+    Marcos de activación de tamaño fijo para una función. Un marco es una lista con un
+    segmento por cada segmento local y temporal (en el orden de Memory.frame_segments),
+    dimensionado con los tamaños que registró el compilador. Los marcos liberados se
+    limpian y se reutilizan en la siguiente llamada.
+    """
+    def __init__(self, sizes):
+        self.sizes = sizes
+        self.vacios = [[None] * size for size in sizes]
+        self.libres = []
+
+    def acquire(self):
+        if self.libres:
+            return self.libres.pop()
+        return [[None] * size for size in self.sizes]
+
+    def release(self, frame):
+        for segmento, vacio in zip(frame, self.vacios):
+            segmento[:] = vacio
+        self.libres.append(frame)
 
 class Memory:
-    def __init__(self):
-        # Rango de direcciones virtuales
-        self.global_range = (1000, 4999)
-        self.local_range = (5000, 8999)
-        self.temp_range = (9000, 12999)
-        self.const_range = (13000, 16999)
-
-        # Diccionarios para almacenar los valores
-        self.global_memory = {}
-        self.constant_memory = {}
+    """
+    Memoria de ejecución organizada con los mismos segmentos que VirtualMemory.
+    Cada segmento (alcance, tipo) es una lista densa indexada por desplazamiento, y
+    'tablas[direccion // SEGMENT_SIZE]' da el segmento de cualquier dirección en O(1).
+    Los segmentos locales y temporales pertenecen al marco activo (ver FramePool) y se
+    reemplazan en 'tablas' al entrar o salir de una función. Con 'plantilla' (otra Memory)
+    los segmentos globales y constantes empiezan como una copia de los suyos.
+    """
+    def __init__(self, plantilla=None):
+        segmentos = VirtualMemory().segments
+        total = max(rango['end'] for tipos in segmentos.values() for rango in tipos.values()) // SEGMENT_SIZE + 1
+
+        # Tabla de segmentos indexada por dirección // SEGMENT_SIZE
+        self.tablas = [None] * total
+        # Nombre (alcance, tipo) de cada segmento, para mensajes y depuración
+        self.nombres = [None] * total
+        # Índices de los segmentos que pertenecen a cada marco (local y temporal)
+        self.frame_segments = []
+
+        for alcance, tipos in segmentos.items():
+            for tipo, rango in tipos.items():
+                indice = rango['start'] // SEGMENT_SIZE
+                self.nombres[indice] = (alcance, tipo)
+                if alcance in ('local', 'temporal'):
+                    self.frame_segments.append(indice)
+                elif plantilla is not None:
+                    self.tablas[indice] = plantilla.tablas[indice][:]
+                else:
+                    self.tablas[indice] = [None] * SEGMENT_SIZE
+
+        # Los segmentos del marco son contiguos para activarlos con una sola asignación
+        self.frame_base = self.frame_segments[0]
+        if self.frame_segments != list(range(self.frame_base, self.frame_base + len(self.frame_segments))):
+            raise Exception("Error: Los segmentos local y temporal deben ser contiguos.")
+
         self.memory_stack = MemoryStack()
 
+    def is_valid_address(self, address):
+        return 0 <= address < len(self.nombres) * SEGMENT_SIZE and self.nombres[address // SEGMENT_SIZE] is not None
+
+    def push_frame(self, frame):
+        self.memory_stack.push(frame)
+        self._activate(frame)
+
+    def pop_frame(self):
+        frame = self.memory_stack.pop()
+        self._activate(self.memory_stack.current())
+        return frame
+
+    def _activate(self, frame):
+        if frame is None:
+            frame = [None] * len(self.frame_segments)
+        self.tablas[self.frame_base:self.frame_base + len(self.frame_segments)] = frame
+
     def get_value(self, address):
-        address = int(address)
-        if self.global_range[0] <= address <= self.global_range[1]:
-            return self.global_memory.get(address, None)
-        elif self.local_range[0] <= address <= self.local_range[1]:
-            return self.memory_stack.current_local().get(address, None)
-        elif self.temp_range[0] <= address <= self.temp_range[1]:
-            return self.memory_stack.current_temp().get(address, None)
-        elif self.const_range[0] <= address <= self.const_range[1]:
-            return self.constant_memory.get(address, None)
-        else:
+        if not self.is_valid_address(address):
             raise Exception(f"Dirección inválida: {address}")
+        return self.tablas[address // SEGMENT_SIZE][address % SEGMENT_SIZE]
 
     def set_value(self, address, value):
-        address = int(address)
-        if self.global_range[0] <= address <= self.global_range[1]:
-            self.global_memory[address] = value
-        elif self.local_range[0] <= address <= self.local_range[1]:
-            self.memory_stack.current_local()[address] = value
-        elif self.temp_range[0] <= address <= self.temp_range[1]:
-            self.memory_stack.current_temp()[address] = value
-        elif self.const_range[0] <= address <= self.const_range[1]:
-            self.constant_memory[address] = value
-        else:
+        if not self.is_valid_address(address):
             raise Exception(f"Dirección inválida: {address}")
+        self.tablas[address // SEGMENT_SIZE][address % SEGMENT_SIZE] = value
 
 def print_memory(memoria):
-    print("Memoria Global:")
-    for addr, val in memoria.global_memory.items():
-        print(f"  Dirección {addr}: {val}")
-    print("Memoria Constante:")
-    for addr, val in memoria.constant_memory.items():
-        print(f"  Dirección {addr}: {val}")
-    print("Memoria Local Actual:")
-    for addr, val in memoria.memory_stack.current_local().items():
-        print(f"  Dirección {addr}: {val}")
-    print("Memoria Temporal Actual:")
-    for addr, val in memoria.memory_stack.current_temp().items():
-        print(f"  Dirección {addr}: {val}")
+    titulos = [('global', "Memoria Global:"), ('constante', "Memoria Constante:"),
+               ('local', "Memoria Local Actual:"), ('temporal', "Memoria Temporal Actual:")]
+    for alcance, titulo in titulos:
+        print(titulo)
+        for indice, nombre in enumerate(memoria.nombres):
+            segmento = memoria.tablas[indice]
+            if nombre is None or nombre[0] != alcance or segmento is None:
+                continue
+            for desplazamiento, val in enumerate(segmento):
+                if val is not None:
+                    print(f"  Dirección {indice * SEGMENT_SIZE + desplazamiento}: {val}")
+
+def formatear_instruccion(instruccion, funciones):
+    codigo_operacion, operando1, operando2, resultado = instruccion
+    if codigo_operacion in OPERACIONES_CON_FUNCION and funciones is not None:
+        operando1 = funciones[operando1]
+    operandos = [None if operando == SIN_OPERANDO else operando for operando in (operando1, operando2, resultado)]
+    return f"({NOMBRES[codigo_operacion]}, {operandos[0]}, {operandos[1]}, {operandos[2]})"
+
+def validar_direcciones(codigo, num_funciones, memoria):
+    # Las direcciones se validan una sola vez al cargar para no revisar rangos en cada acceso
+    for indice, instruccion in enumerate(codigo):
+        if instruccion[0] not in NOMBRES:
+            raise Exception(f"Error en cuádruplo {indice}: Código de operación desconocido: {instruccion[0]}.")
+        if instruccion[0] in OPERACIONES_CON_SALTO and not 0 <= instruccion[3] < len(codigo):
+            raise Exception(f"Error en cuádruplo {indice}: Cuádruplo {NOMBRES[instruccion[0]]} sin dirección de salto válida.")
+        if instruccion[0] in OPERACIONES_CON_FUNCION and not 0 <= instruccion[1] < num_funciones:
+            raise Exception(f"Error en cuádruplo {indice}: Función inexistente: {instruccion[1]}.")
+        for posicion in OPERANDOS_DIRECCION.get(instruccion[0], ()):
+            if not memoria.is_valid_address(instruccion[posicion]):
+                raise Exception(f"Error en cuádruplo {indice}: Dirección inválida: {instruccion[posicion]}")
+        if instruccion[0] == PARAM and instruccion[3] // SEGMENT_SIZE not in memoria.frame_segments:
+            raise Exception(f"Error en cuádruplo {indice}: PARAM debe escribir en memoria local.")
+
+# Función de cada operación tipada; la división entre enteros es entera y redondea hacia abajo
+FUNCIONES_OPERACION = {
+    ('+', 'entero'): operator.add, ('+', 'flotante'): operator.add,
+    ('-', 'entero'): operator.sub, ('-', 'flotante'): operator.sub,
+    ('*', 'entero'): operator.mul, ('*', 'flotante'): operator.mul,
+    ('/', 'entero'): operator.floordiv, ('/', 'flotante'): operator.truediv,
+    ('>', 'entero'): operator.gt, ('>', 'flotante'): operator.gt,
+    ('<', 'entero'): operator.lt, ('<', 'flotante'): operator.lt,
+    ('>=', 'entero'): operator.ge, ('>=', 'flotante'): operator.ge,
+    ('<=', 'entero'): operator.le, ('<=', 'flotante'): operator.le,
+    ('==', 'entero'): operator.eq, ('==', 'flotante'): operator.eq,
+    ('!=', 'entero'): operator.ne, ('!=', 'flotante'): operator.ne,
+}
+
+def requiere_verificacion(programa):
+    """
+    False si el compilador demostró que toda lectura de variable está inicializada (ver
+    inicializacion.py); la máquina virtual puede omitir la verificación de operandos.
+    """
+    return not programa.banderas & bytecode.INICIALIZACION_VERIFICADA
+
+def construir_despacho(memoria, marcos, salida, verificar=True, pila_retornos=None, preparado=None):
+    """
+    Construye la tabla de despacho indexada por código de operación. Cada manejador
+    recibe (operando1, operando2, resultado, contador) y regresa el siguiente contador;
+    END regresa -1 para detener el ciclo de ejecución. Los manejadores leen y escriben
+    directamente en 'memoria.tablas'; las direcciones ya fueron validadas al cargar.
+    'marcos' tiene el FramePool de cada función, en el orden de la lista de funciones.
+    PRINT escribe en el canal 'salida' (ver salida.py). Con verificar=False se usan
+    manejadores que no revisan si los operandos están inicializados, para programas que
+    el compilador ya verificó. 'pila_retornos' y
+    'preparado' son las listas donde los manejadores guardan el estado de las llamadas.
+    """
+    tablas = memoria.tablas
+    S = SEGMENT_SIZE
+    base = memoria.frame_base
+    escribir = salida.escribir
+
+    # Pila para manejar los retornos de funciones: (contador de retorno, pool del marco)
+    if pila_retornos is None:
+        pila_retornos = []
+
+    # Marcos de memoria local y temporal preparados por ERA: (marco, pool)
+    if preparado is None:
+        preparado = []
+
+    def goto(operando1, operando2, resultado, contador):
+        return resultado
+
+    def gotof(operando1, operando2, resultado, contador):
+        if not tablas[operando1 // S][operando1 % S]:
+            return resultado
+        return contador + 1
+
+    def main_start(operando1, operando2, resultado, contador):
+        return contador + 1
+
+    def era(operando1, operando2, resultado, contador):
+        # Tomar un marco del pool de la función
+        pool = marcos[operando1]
+        preparado.append((pool.acquire(), pool))
+        return contador + 1
+
+    def param(operando1, operando2, resultado, contador):
+        valor = tablas[operando1 // S][operando1 % S]
+        if valor is None:
+            raise Exception("Error: Operando no inicializado en PARAM.")
+        if not preparado:
+            raise Exception("Error: No hay contexto de función preparado para PARAM.")
+        preparado[-1][0][resultado // S - base][resultado % S] = valor
+        return contador + 1
+
+    def param_sin_verificar(operando1, operando2, resultado, contador):
+        if not preparado:
+            raise Exception("Error: No hay contexto de función preparado para PARAM.")
+        preparado[-1][0][resultado // S - base][resultado % S] = tablas[operando1 // S][operando1 % S]
+        return contador + 1
+
+    def gosub(operando1, operando2, resultado, contador):
+        if not preparado:
+            raise Exception("Error: No hay contexto de función preparado para GOSUB.")
+        # Guardar la posición de retorno y activar el marco preparado
+        marco, pool = preparado.pop()
+        pila_retornos.append((contador + 1, pool))
+        memoria.push_frame(marco)
+        # Saltar al inicio de la función
+        return resultado
+
+    def endfunc(operando1, operando2, resultado, contador):
+        if not pila_retornos:
+            raise Exception("Error: Pila de retornos vacía al finalizar función.")
+        # Restaurar el marco anterior y devolver el actual a su pool
+        retorno, pool = pila_retornos.pop()
+        pool.release(memoria.pop_frame())
+        return retorno
+
+    # 'avance' es la cantidad de cuádruplos que ocupa la instrucción: las superinstrucciones
+    # aritméticas con asignación saltan el '=' que reemplazan
+    def operacion_binaria(operador, funcion, tipo_operacion, avance=1):
+        mensaje = f"Error: Operando(s) no inicializado(s) en {tipo_operacion} '{operador}'."
+
+        def manejador(operando1, operando2, resultado, contador):
+            valor1 = tablas[operando1 // S][operando1 % S]
+            valor2 = tablas[operando2 // S][operando2 % S]
+            if valor1 is None or valor2 is None:
+                raise Exception(mensaje)
+            tablas[resultado // S][resultado % S] = funcion(valor1, valor2)
+            return contador + avance
+
+        def sin_verificar(operando1, operando2, resultado, contador):
+            tablas[resultado // S][resultado % S] = funcion(tablas[operando1 // S][operando1 % S],
+                                                            tablas[operando2 // S][operando2 % S])
+            return contador + avance
+        return manejador if verificar else sin_verificar
+
+    def division_con_avance(funcion, avance):
+        def division(operando1, operando2, resultado, contador):
+            valor1 = tablas[operando1 // S][operando1 % S]
+            valor2 = tablas[operando2 // S][operando2 % S]
+            if valor1 is None or valor2 is None:
+                raise Exception("Error: Operando(s) no inicializado(s) en operación '/'.")
+            if valor2 == 0:
+                raise Exception("Error: División por cero.")
+            tablas[resultado // S][resultado % S] = funcion(valor1, valor2)
+            return contador + avance
+
+        def division_sin_verificar(operando1, operando2, resultado, contador):
+            valor2 = tablas[operando2 // S][operando2 % S]
+            if valor2 == 0:
+                raise Exception("Error: División por cero.")
+            tablas[resultado // S][resultado % S] = funcion(tablas[operando1 // S][operando1 % S], valor2)
+            return contador + avance
+        return division if verificar else division_sin_verificar
+
+    def a_flotante(operando1, operando2, resultado, contador):
+        valor = tablas[operando1 // S][operando1 % S]
+        if valor is None:
+            raise Exception("Error: Operando no inicializado en conversión a flotante.")
+        tablas[resultado // S][resultado % S] = float(valor)
+        return contador + 1
+
+    def a_flotante_sin_verificar(operando1, operando2, resultado, contador):
+        tablas[resultado // S][resultado % S] = float(tablas[operando1 // S][operando1 % S])
+        return contador + 1
+
+    def salto_condicional(operador, funcion, si_verdadero, avance=1):
+        # Comparación y salto en una sola instrucción; no escribe el temporal booleano
+        mensaje = f"Error: Operando(s) no inicializado(s) en operación relacional '{operador}'."
+
+        if si_verdadero and not verificar:
+            def manejador(operando1, operando2, resultado, contador):
+                if funcion(tablas[operando1 // S][operando1 % S], tablas[operando2 // S][operando2 % S]):
+                    return resultado
+                return contador + 1
+        elif si_verdadero:
+            def manejador(operando1, operando2, resultado, contador):
+                valor1 = tablas[operando1 // S][operando1 % S]
+                valor2 = tablas[operando2 // S][operando2 % S]
+                if valor1 is None or valor2 is None:
+                    raise Exception(mensaje)
+                if funcion(valor1, valor2):
+                    return resultado
+                return contador + 1
+        elif not verificar:
+            def manejador(operando1, operando2, resultado, contador):
+                if funcion(tablas[operando1 // S][operando1 % S], tablas[operando2 // S][operando2 % S]):
+                    return contador + avance
+                return resultado
+        else:
+            def manejador(operando1, operando2, resultado, contador):
+                valor1 = tablas[operando1 // S][operando1 % S]
+                valor2 = tablas[operando2 // S][operando2 % S]
+                if valor1 is None or valor2 is None:
+                    raise Exception(mensaje)
+                if funcion(valor1, valor2):
+                    return contador + avance
+                return resultado
+        return manejador
+
+    def llamada(operando1, operando2, resultado, contador):
+        # Superinstrucción ERA; PARAM*; GOSUB
+        pool = marcos[operando1]
+        marco = pool.acquire()
+        parametros, retorno = operando2
+        for origen, destino, indice in parametros:
+            valor = tablas[origen // S][origen % S]
+            if valor is None:
+                raise ErrorCuadruplo(indice, "Error: Operando no inicializado en PARAM.")
+            marco[destino // S - base][destino % S] = valor
+        pila_retornos.append((retorno, pool))
+        memoria.push_frame(marco)
+        return resultado
+
+    def llamada_sin_verificar(operando1, operando2, resultado, contador):
+        pool = marcos[operando1]
+        marco = pool.acquire()
+        parametros, retorno = operando2
+        for origen, destino, _ in parametros:
+            marco[destino // S - base][destino % S] = tablas[origen // S][origen % S]
+        pila_retornos.append((retorno, pool))
+        memoria.push_frame(marco)
+        return resultado
+
+    def asigna(operando1, operando2, resultado, contador):
+        valor = tablas[operando1 // S][operando1 % S]
+        if valor is None:
+            raise Exception("Error: Operando no inicializado en asignación '='.")
+        tablas[resultado // S][resultado % S] = valor
+        return contador + 1
+
+    def asigna_sin_verificar(operando1, operando2, resultado, contador):
+        tablas[resultado // S][resultado % S] = tablas[operando1 // S][operando1 % S]
+        return contador + 1
+
+    def asigna_doble(operando1, operando2, resultado, contador):
+        # Superinstrucción = ; =
+        valor = tablas[operando1 // S][operando1 % S]
+        if valor is None:
+            raise Exception("Error: Operando no inicializado en asignación '='.")
+        tablas[resultado // S][resultado % S] = valor
+        origen, destino = operando2
+        valor = tablas[origen // S][origen % S]
+        if valor is None:
+            raise ErrorCuadruplo(contador + 1, "Error: Operando no inicializado en asignación '='.")
+        tablas[destino // S][destino % S] = valor
+        return contador + 2
+
+    def asigna_doble_sin_verificar(operando1, operando2, resultado, contador):
+        tablas[resultado // S][resultado % S] = tablas[operando1 // S][operando1 % S]
+        origen, destino = operando2
+        tablas[destino // S][destino % S] = tablas[origen // S][origen % S]
+        return contador + 2
+
+    def imprime(operando1, operando2, resultado, contador):
+        valor = tablas[operando1 // S][operando1 % S]
+        if valor is None:
+            raise Exception("Error: Operando no inicializado en PRINT.")
+        escribir(f"{valor}\n")
+        return contador + 1
+
+    def imprime_sin_verificar(operando1, operando2, resultado, contador):
+        escribir(f"{tablas[operando1 // S][operando1 % S]}\n")
+        return contador + 1
+
+    def imprime_varios(operando1, operando2, resultado, contador):
+        # Superinstrucción PRINT; PRINT*: una sola escritura con todos los valores
+        partes = []
+        for desplazamiento, direccion in enumerate(operando1):
+            valor = tablas[direccion // S][direccion % S]
+            if valor is None:
+                # Lo impreso antes del operando no inicializado sí se escribe
+                escribir(''.join(partes))
+                raise ErrorCuadruplo(contador + desplazamiento, "Error: Operando no inicializado en PRINT.")
+            partes.append(f"{valor}\n")
+        escribir(''.join(partes))
+        return contador + len(operando1)
+
+    def imprime_varios_sin_verificar(operando1, operando2, resultado, contador):
+        escribir(''.join([f"{tablas[direccion // S][direccion % S]}\n" for direccion in operando1]))
+        return contador + len(operando1)
+
+    def end(operando1, operando2, resultado, contador):
+        return -1
+
+    despacho = [None] * (max(NOMBRES_SUPERINSTRUCCIONES) + 1)
+    despacho[GOTO] = goto
+    despacho[GOTOF] = gotof
+    despacho[MAIN_START] = main_start
+    despacho[ERA] = era
+    despacho[PARAM] = param if verificar else param_sin_verificar
+    despacho[GOSUB] = gosub
+    despacho[ENDFUNC] = endfunc
+    despacho[ASIGNA] = asigna if verificar else asigna_sin_verificar
+    despacho[PRINT] = imprime if verificar else imprime_sin_verificar
+    despacho[END] = end
+    despacho[A_FLOTANTE] = a_flotante if verificar else a_flotante_sin_verificar
+    # Cada operación tipada tiene su manejador, con la superinstrucción que la fusiona con el
+    # '=' o el GOTOF siguiente (ver superinstrucciones.py)
+    for operador, codigos in OPERACIONES_TIPADAS.items():
+        for tipo, codigo in zip(TIPOS_OPERACION, codigos):
+            funcion = FUNCIONES_OPERACION[operador, tipo]
+            if operador == '/':
+                despacho[codigo] = division_con_avance(funcion, 1)
+                despacho[superinstrucciones.ARITMETICA_ASIGNA[codigo]] = division_con_avance(funcion, 2)
+            elif operador in ARITMETICOS:
+                despacho[codigo] = operacion_binaria(operador, funcion, 'operación')
+                despacho[superinstrucciones.ARITMETICA_ASIGNA[codigo]] = operacion_binaria(
+                    operador, funcion, 'operación', 2)
+            else:
+                despacho[codigo] = operacion_binaria(operador, funcion, 'operación relacional')
+                despacho[superinstrucciones.RELACIONAL_GOTOF[codigo]] = salto_condicional(operador, funcion, False, 2)
+    for operador in RELACIONALES:
+        for tipo, si_falso, si_verdadero in zip(TIPOS_OPERACION, SALTOS_SI_FALSO[operador],
+                                                SALTOS_SI_VERDADERO[operador]):
+            funcion = FUNCIONES_OPERACION[operador, tipo]
+            despacho[si_falso] = salto_condicional(operador, funcion, False)
+            despacho[si_verdadero] = salto_condicional(operador, funcion, True)
+
+    # Superinstrucciones (ver superinstrucciones.py)
+    despacho[LLAMADA] = llamada if verificar else llamada_sin_verificar
+    despacho[ASIGNA_DOBLE] = asigna_doble if verificar else asigna_doble_sin_verificar
+    despacho[IMPRIME_VARIOS] = imprime_varios if verificar else imprime_varios_sin_verificar
+    return despacho
+
+# Motores de ejecución disponibles (ver Programa.ejecutar)
+MOTORES = ('interprete', 'traductor')
+
+# Instrucciones que ejecuta una MaquinaVirtual antes de ceder el control (unos milisegundos)
+PRESUPUESTO_INSTRUCCIONES = 10000
+
+class ErrorCuadruplo(Exception):
+    """Error que ocurre en un cuádruplo distinto del que se está ejecutando (superinstrucciones y traductor)."""
+    def __init__(self, contador, mensaje):
+        super().__init__(mensaje)
+        self.contador = contador
+        self.mensaje = mensaje
+
+class ErrorEjecucion(Exception):
+    """
+    Error en tiempo de ejecución; el mensaje indica el cuádruplo donde ocurrió.
+    Si la ejecución tenía traza, 'traza' tiene los últimos registros antes del error.
+    """
+    def __init__(self, mensaje, traza=None):
+        super().__init__(mensaje)
+        self.traza = traza
+
+def mensaje_error(error, contador):
+    # El límite de salida es del programa completo, no de un cuádruplo (igual que en el traductor)
+    if isinstance(error, salidas.ErrorLimiteSalida):
+        return str(error)
+    return f"Error en cuádruplo {contador}: {error}"
+
+def ejecutar(codigo, funciones, marcos, memoria, verbose=False, traza=None, perfil=None, verificar=True,
+             salida=None):
+    if salida is None:
+        # En modo detallado la salida del programa se intercala con los cuádruplos ejecutados
+        salida = salidas.SalidaBuferizada(vaciado='linea' if verbose else None)
+    despacho = construir_despacho(memoria, marcos, salida, verificar)
+    contador = 0
+    try:
+        if perfil is not None:
+            # Ciclo con perfil: mide el tiempo de cada instrucción y lo acumula por cuádruplo
+            # y por pila de llamadas
+            reloj = time.perf_counter_ns
+            conteos, tiempos, pilas = perfil.conteos, perfil.tiempos, perfil.pilas
+            pila = perfil.pila_actual()
+            while contador >= 0:
+                codigo_operacion, operando1, operando2, resultado = codigo[contador]
+                inicio = reloj()
+                siguiente = despacho[codigo_operacion](operando1, operando2, resultado, contador)
+                transcurrido = reloj() - inicio
+                conteos[contador] += 1
+                tiempos[contador] += transcurrido
+                pilas[pila] += transcurrido
+                if codigo_operacion == GOSUB:
+                    pila = perfil.entrar(operando1)
+                elif codigo_operacion == ENDFUNC:
+                    pila = perfil.salir()
+                contador = siguiente
+        elif traza is not None:
+            # Ciclo con traza; sin traza el ciclo rápido no hace ningún trabajo adicional
+            registrar = traza.registrar
+            tablas = memoria.tablas
+            while contador >= 0:
+                instruccion = codigo[contador]
+                registrar(contador, instruccion, tablas)
+                contador = despacho[instruccion[0]](instruccion[1], instruccion[2], instruccion[3], contador)
+        elif verbose:
+            while contador >= 0:
+                codigo_operacion, operando1, operando2, resultado = codigo[contador]
+                print(f"\nEjecutando cuádruplo {contador}: "
+                      f"{formatear_instruccion(codigo[contador], funciones)}")
+                contador = despacho[codigo_operacion](operando1, operando2, resultado, contador)
+                print_memory(memoria)
+            print("Fin de la ejecución.")
+        else:
+            while contador >= 0:
+                codigo_operacion, operando1, operando2, resultado = codigo[contador]
+                contador = despacho[codigo_operacion](operando1, operando2, resultado, contador)
+    except Exception as e:
+        if isinstance(e, ErrorCuadruplo):
+            contador = e.contador
+        registros = traza.registros() if traza is not None else None
+        raise ErrorEjecucion(mensaje_error(e, contador), registros) from e
+    finally:
+        salida.vaciar()
+
+def memoria_con_constantes(programa):
+    # Memoria nueva con las constantes del programa cargadas
+    memoria = Memory()
+    for direccion, valor, tipo in programa.constantes:
+        memoria.set_value(direccion, valor)
+    return memoria
+
+def preparar_codigo(programa, memoria, superinstrucciones_activas=True):
+    """
+    Valida las direcciones de las instrucciones contra los segmentos de 'memoria' y fusiona
+    las superinstrucciones. Regresa el código listo para ejecutar(). Lanza ErrorEjecucion
+    si el programa es inválido.
+    """
+    # Centinela para terminar aunque el programa no tenga END
+    codigo = programa.instrucciones + [(END, SIN_OPERANDO, SIN_OPERANDO, SIN_OPERANDO)]
+
+    # Validar las direcciones de las instrucciones contra los segmentos de memoria
+    try:
+        validar_direcciones(codigo, len(programa.funciones), memoria)
+    except Exception as e:
+        raise ErrorEjecucion(str(e)) from e
+
+    if superinstrucciones_activas:
+        codigo = superinstrucciones.fusionar(codigo)
+    return codigo
+
+def preparar_ejecucion(programa, verbose=False, traza=None, superinstrucciones_activas=True, perfil=None):
+    """
+    Carga un Programa en la máquina virtual: valida sus direcciones, prepara la memoria con
+    las constantes y los marcos de cada función, y fusiona las superinstrucciones.
+    Regresa (codigo, marcos, memoria) listos para ejecutar(). Lanza ErrorEjecucion si el
+    programa es inválido.
+    """
+    # Crear un pool de marcos por función; la entrada 0 es el programa principal
+    marcos = [FramePool(funcion['tamano_marco']) for funcion in programa.funciones]
+    memoria = memoria_con_constantes(programa)
+    codigo = preparar_codigo(programa, memoria,
+                             superinstrucciones_activas and not verbose and traza is None and perfil is None)
+
+    if perfil is not None:
+        perfil.iniciar(programa, len(codigo))
+
+    # Inicializar el marco del programa principal
+    memoria.push_frame(marcos[0].acquire())
+    return codigo, marcos, memoria
+
+class ProgramaPreparado:
+    """
+    Programa validado, con las superinstrucciones fusionadas y la memoria de sus constantes
+    ya cargada. Cada ejecución solo crea sus marcos y una copia de esa memoria, así que el
+    trabajo de preparar_ejecucion se hace una vez para muchas ejecuciones (servicio.py lo
+    hace en el proceso padre y los trabajadores lo comparten).
+    """
+    def __init__(self, programa, superinstrucciones_activas=True):
+        self.plantilla = memoria_con_constantes(programa)
+        self.codigo = preparar_codigo(programa, self.plantilla, superinstrucciones_activas)
+        self.tamanos_marco = [funcion['tamano_marco'] for funcion in programa.funciones]
+        self.funciones = programa.nombres_funciones()
+        self.verificar = requiere_verificacion(programa)
+
+    def ejecutar(self, salida=None):
+        """Ejecuta el programa con memoria nueva. Lanza ErrorEjecucion si falla."""
+        marcos = [FramePool(tamano) for tamano in self.tamanos_marco]
+        memoria = Memory(self.plantilla)
+        memoria.push_frame(marcos[0].acquire())
+        ejecutar(self.codigo, self.funciones, marcos, memoria, verificar=self.verificar, salida=salida)
+
+def ejecutar_programa(programa, verbose=False, traza=None, superinstrucciones_activas=True, perfil=None,
+                      salida=None):
+    """
+    Prepara la memoria y los marcos de un Programa ya cargado y lo ejecuta.
+    Lanza ErrorEjecucion si el programa es inválido o falla durante la ejecución.
+    Con una traza.Traza se registra cada instrucción ejecutada y con un perfil.Perfil se
+    mide cada una. Las superinstrucciones solo se usan sin traza, perfil ni modo detallado,
+    que muestran los cuádruplos originales. 'salida' es el canal de PRINT (ver salida.py;
+    por defecto la salida estándar).
+    """
+    codigo, marcos, memoria = preparar_ejecucion(programa, verbose, traza, superinstrucciones_activas, perfil)
+
+    # Ejecutar las instrucciones decodificadas
+    ejecutar(codigo, programa.nombres_funciones(), marcos, memoria, verbose, traza, perfil,
+             requiere_verificacion(programa), salida)
+
+class MaquinaVirtual:
+    """
+    Ejecución reanudable de un Programa. Todo el estado de la ejecución (contador, memoria,
+    pila de retornos y marcos preparados por ERA) vive en el objeto, así que el programa se
+    puede ejecutar por partes con paso(n) y muchos programas se pueden intercalar en un
+    mismo proceso, por ejemplo en un ciclo de asyncio con ejecutar_async().
+    Ejecuta con superinstrucciones y sin traza, perfil ni modo detallado. 'salida' es el
+    canal de PRINT (ver salida.py); se vacía al terminar el programa.
+    """
+    def __init__(self, programa, superinstrucciones_activas=True, salida=None):
+        self.codigo, self.marcos, self.memoria = preparar_ejecucion(
+            programa, superinstrucciones_activas=superinstrucciones_activas)
+        self.funciones = programa.nombres_funciones()
+        self.pila_retornos = []
+        self.preparado = []
+        self.salida = salida if salida is not None else salidas.SalidaBuferizada()
+        self.despacho = construir_despacho(self.memoria, self.marcos, self.salida, requiere_verificacion(programa),
+                                           self.pila_retornos, self.preparado)
+        self.contador = 0
+        # Instrucciones despachadas hasta ahora (una superinstrucción cuenta como una)
+        self.ejecutadas = 0
+
+    @property
+    def terminado(self):
+        return self.contador < 0
+
+    def paso(self, n=1):
+        """
+        Ejecuta hasta 'n' instrucciones y regresa True si el programa terminó. Lanza
+        ErrorEjecucion si ocurre un error; después de un error el programa queda terminado.
+        """
+        codigo, despacho = self.codigo, self.despacho
+        contador = self.contador
+        restantes = n
+        try:
+            while contador >= 0 and restantes:
+                codigo_operacion, operando1, operando2, resultado = codigo[contador]
+                contador = despacho[codigo_operacion](operando1, operando2, resultado, contador)
+                restantes -= 1
+        except Exception as e:
+            if isinstance(e, ErrorCuadruplo):
+                contador = e.contador
+            self.contador = -1
+            self.salida.vaciar()
+            raise ErrorEjecucion(mensaje_error(e, contador)) from e
+        finally:
+            self.ejecutadas += n - restantes
+        self.contador = contador
+        if contador < 0:
+            self.salida.vaciar()
+        return contador < 0
+
+    def por_partes(self, presupuesto=PRESUPUESTO_INSTRUCCIONES):
+        """
+        Generador que ejecuta el programa en porciones de 'presupuesto' instrucciones y cede
+        el control después de cada porción que no lo termina.
+        """
+        while not self.paso(presupuesto):
+            yield self.ejecutadas
+
+    async def ejecutar_async(self, presupuesto=PRESUPUESTO_INSTRUCCIONES):
+        """Ejecuta el programa completo y cede el ciclo de asyncio entre porciones."""
+        for _ in self.por_partes(presupuesto):
+            await asyncio.sleep(0)
+
+async def ejecutar_concurrente(programas, presupuesto=PRESUPUESTO_INSTRUCCIONES, canales=None):
+    """
+    Ejecuta varios Programas intercalados en el ciclo de asyncio actual, cada uno por
+    porciones de 'presupuesto' instrucciones. 'canales' tiene el canal de salida de cada
+    programa (por defecto la salida estándar). Regresa por programa None si terminó o el
+    ErrorEjecucion que lo detuvo; un error no detiene a los demás.
+    """
+    canales = canales if canales is not None else [None] * len(programas)
+    maquinas = [MaquinaVirtual(programa, salida=canal) for programa, canal in zip(programas, canales)]
+    resultados = await asyncio.gather(*(maquina.ejecutar_async(presupuesto) for maquina in maquinas),
+                                      return_exceptions=True)
+    for resultado in resultados:
+        if resultado is not None and not isinstance(resultado, ErrorEjecucion):
+            raise resultado
+    return resultados
 
 def main():
     # Parser para argumentos de línea de comandos
     parser = argparse.ArgumentParser(description='Ejecuta la máquina virtual de Patito.')
+    parser.add_argument('programa', nargs='?', default='output.pbc',
+                        help="Programa compilado a ejecutar (por defecto 'output.pbc').")
     parser.add_argument('-v', '--verbose', action='store_true', help='Activa el modo detallado.')
+    agregar_opciones_traza(parser)
+    agregar_opciones_perfil(parser)
+    agregar_opcion_motor(parser)
+    agregar_opciones_salida(parser)
     args = parser.parse_args()
+    validar_opciones_motor(parser, args)
 
-    # Variable para el modo detallado
-    verbose = args.verbose
-
-    # Leer los cuádruplos desde 'output.txt'
-    cuadruplos = []
+    # Cargar el programa binario (instrucciones ya decodificadas, funciones y constantes)
     try:
-        with open('output.txt', 'r') as f:
-            for line in f:
-                operador, operando1, operando2, resultado = line.strip().split(',')
-                cuadruplos.append((operador, operando1, operando2, resultado))
+        programa = bytecode.cargar(args.programa)
     except FileNotFoundError:
-        print("Error: 'output.txt' no encontrado.")
+        print(f"Error: '{args.programa}' no encontrado.")
+        return
+    except Exception as e:
+        print(e)
         return
 
-    # Leer las constantes desde 'constants.txt'
-    constantes = {}
+    perfil = crear_perfil(args)
     try:
-        with open('constants.txt', 'r') as f:
-            for line in f:
-                direccion, valor, tipo = line.strip().split(',', 2)
-                direccion = int(direccion)
-                if tipo == 'entero':
-                    valor = int(valor)
-                elif tipo == 'flotante':
-                    valor = float(valor)
-                elif tipo == 'cadena':
-                    valor = valor.strip('"')
-                else:
-                    print(f"Advertencia: Tipo desconocido '{tipo}' para la constante.")
-                constantes[direccion] = {'valor': valor, 'tipo': tipo}
-    except FileNotFoundError:
-        print("Error: 'constants.txt' no encontrado.")
-        return
+        with abrir_traza(args) as traza:
+            # La traducción se guarda junto al programa ('output.pbc.py')
+            programa.ejecutar(args.verbose, traza, args.motor, args.programa + '.py', args.superinstrucciones,
+                              perfil, crear_salida(args))
+    except ErrorEjecucion as e:
+        print(e)
+        if e.traza:
+            trazas.imprimir_registros(e.traza, programa.nombres_funciones())
+    finally:
+        escribir_perfil(args, perfil)
 
-    # Inicializar la memoria
-    memoria = Memory()
+def agregar_opciones_traza(parser):
+    parser.add_argument('--traza', nargs='?', type=int, const=trazas.CAPACIDAD_TRAZA, default=None, metavar='N',
+                        help=f'Guarda las últimas N instrucciones (por defecto {trazas.CAPACIDAD_TRAZA}) '
+                             'y las muestra si ocurre un error.')
+    parser.add_argument('--traza-archivo', metavar='ARCHIVO',
+                        help='Escribe la traza completa en formato binario (se decodifica con traza.py).')
 
-    # Cargar las constantes en la memoria
-    for direccion, info in constantes.items():
-        memoria.set_value(direccion, info['valor'])
+def agregar_opciones_perfil(parser):
+    parser.add_argument('--perfil', '--profile', action='store_true',
+                        help='Mide cada instrucción y al terminar muestra el tiempo por función, '
+                             'cuádruplo y línea del código fuente.')
+    parser.add_argument('--perfil-pilas', metavar='ARCHIVO',
+                        help='Escribe el tiempo por pila de llamadas en formato de pilas colapsadas '
+                             '(para flamegraph.pl o speedscope).')
 
-    # Inicializar el contexto global
-    memoria.memory_stack.push({}, {})
+def agregar_opcion_motor(parser):
+    parser.add_argument('--motor', choices=MOTORES, default='interprete',
+                        help="Motor de ejecución: 'interprete' (por defecto) o 'traductor', que traduce "
+                             "el programa a Python antes de ejecutarlo.")
+    parser.add_argument('--sin-superinstrucciones', dest='superinstrucciones', action='store_false',
+                        help='Ejecuta los cuádruplos sin fusionar las secuencias frecuentes (para depurar).')
 
-    # Pila para manejar los retornos de funciones
-    pila_retornos = []
+def agregar_opciones_salida(parser):
+    parser.add_argument('--vaciado', choices=salidas.POLITICAS_VACIADO, default=None,
+                        help="Cuándo se escribe la salida del programa: 'linea' (por defecto en una terminal), "
+                             "'bloque' (por defecto en archivos y tuberías) o 'final'.")
+    parser.add_argument('--limite-salida', type=int, default=None, metavar='CARACTERES',
+                        help='Detiene el programa con un error si escribe más caracteres.')
 
-    # Variables para manejar preparación de funciones
-    prepared_local_memory = None
-    prepared_temp_memory = None
+def crear_salida(args):
+    return salidas.SalidaBuferizada(vaciado=args.vaciado or ('linea' if args.verbose else None),
+                                    limite=args.limite_salida)
 
-    # Ejecutar los cuádruplos
-    contador = 0
-    while contador < len(cuadruplos):
-        cuadruplo = cuadruplos[contador]
-        operador, operando1, operando2, resultado = cuadruplo
+def validar_opciones_motor(parser, args):
+    if args.motor != 'interprete' and (args.verbose or args.traza is not None or args.traza_archivo
+                                       or args.perfil or args.perfil_pilas):
+        parser.error("-v y las opciones de traza y perfil solo están disponibles con el motor 'interprete'.")
 
-        if verbose:
-            print(f"\nEjecutando cuádruplo {contador}: ({operador}, {operando1}, {operando2}, {resultado})")
+def abrir_traza(args):
+    # Sin opciones de traza regresa un contexto vacío y se usa el ciclo de ejecución rápido
+    if args.traza is None and args.traza_archivo is None:
+        return contextlib.nullcontext()
+    return trazas.Traza(args.traza or trazas.CAPACIDAD_TRAZA, args.traza_archivo)
 
-        try:
-            if operador == 'GOTO':
-                if resultado is None:
-                    raise Exception("Error: Cuádruplo GOTO sin dirección de salto.")
-                if verbose:
-                    print(f"Saltando a cuádruplo {resultado}")
-                contador = int(resultado)
-                continue
-            elif operador == 'MAIN_START':
-                contador += 1
-                continue
-            elif operador == 'GOTOF':
-                condicion = memoria.get_value(operando1)
-                if verbose:
-                    print(f"Evaluando GOTOF, condición en dirección {operando1}: {condicion}")
-                if not condicion:
-                    if resultado is None:
-                        raise Exception("Error: Cuádruplo GOTOF sin dirección de salto.")
-                    if verbose:
-                        print(f"Condición falsa, saltando a cuádruplo {resultado}")
-                    contador = int(resultado)
-                    continue
-            elif operador == 'ERA':
-                if verbose:
-                    print(f"Preparando espacio para la función '{operando1}'")
-                # Preparar nuevos contextos de memoria local y temporal
-                prepared_local_memory = {}
-                prepared_temp_memory = {}
-            elif operador == 'PARAM':
-                valor = memoria.get_value(operando1)
-                if verbose:
-                    print(f"Asignando parámetro: valor {valor} a dirección {resultado}")
-                if valor is None:
-                    raise Exception("Error: Operando no inicializado en PARAM.")
-                direccion_parametro = int(resultado)
-                if prepared_local_memory is not None:
-                    prepared_local_memory[direccion_parametro] = valor
-                else:
-                    raise Exception("Error: No hay contexto de función preparado para PARAM.")
-            elif operador == 'GOSUB':
-                if verbose:
-                    print(f"Llamando a la función '{operando1}' en el cuádruplo {resultado}")
-                # Guardar la posición de retorno
-                pila_retornos.append(contador + 1)
-                # Empujar el contexto de memoria preparado
-                if prepared_local_memory is not None and prepared_temp_memory is not None:
-                    memoria.memory_stack.push(prepared_local_memory, prepared_temp_memory)
-                    # Resetear los contextos preparados
-                    prepared_local_memory = None
-                    prepared_temp_memory = None
-                else:
-                    raise Exception("Error: No hay contexto de función preparado para GOSUB.")
-                # Saltar al inicio de la función
-                direccion_funcion = int(resultado)
-                contador = direccion_funcion
-                continue
-            elif operador == 'ENDFUNC':
-                if verbose:
-                    print("Finalizando función y regresando al punto de llamada.")
-                # Restaurar el contexto anterior
-                memoria.memory_stack.pop()
-                # Recuperar la posición de retorno
-                if not pila_retornos:
-                    raise Exception("Error: Pila de retornos vacía al finalizar función.")
-                contador = pila_retornos.pop()
-                continue
-            elif operador in ['+', '-', '*', '/']:
-                valor1 = memoria.get_value(operando1)
-                valor2 = memoria.get_value(operando2)
-                if verbose:
-                    print(f"Operando 1: Dirección {operando1} Valor {valor1}")
-                    print(f"Operando 2: Dirección {operando2} Valor {valor2}")
-                if valor1 is None or valor2 is None:
-                    raise Exception(f"Error: Operando(s) no inicializado(s) en operación '{operador}'.")
-                if operador == '+':
-                    resultado_valor = valor1 + valor2
-                elif operador == '-':
-                    resultado_valor = valor1 - valor2
-                elif operador == '*':
-                    resultado_valor = valor1 * valor2
-                elif operador == '/':
-                    if valor2 == 0:
-                        raise Exception("Error: División por cero.")
-                    resultado_valor = valor1 / valor2
-                if verbose:
-                    print(f"Resultado de la operación: {resultado_valor}")
-                memoria.set_value(int(resultado), resultado_valor)
-            elif operador in ['>', '<', '>=', '<=', '==', '!=']:
-                valor1 = memoria.get_value(operando1)
-                valor2 = memoria.get_value(operando2)
-                if verbose:
-                    print(f"Operando 1: Dirección {operando1} Valor {valor1}")
-                    print(f"Operando 2: Dirección {operando2} Valor {valor2}")
-                if valor1 is None or valor2 is None:
-                    raise Exception(f"Error: Operando(s) no inicializado(s) en operación relacional '{operador}'.")
-                if operador == '>':
-                    resultado_valor = valor1 > valor2
-                elif operador == '<':
-                    resultado_valor = valor1 < valor2
-                elif operador == '>=':
-                    resultado_valor = valor1 >= valor2
-                elif operador == '<=':
-                    resultado_valor = valor1 <= valor2
-                elif operador == '==':
-                    resultado_valor = valor1 == valor2
-                elif operador == '!=':
-                    resultado_valor = valor1 != valor2
-                if verbose:
-                    print(f"Resultado de la operación: {resultado_valor}")
-                memoria.set_value(int(resultado), resultado_valor)
-            elif operador == '=':
-                valor = memoria.get_value(operando1)
-                if verbose:
-                    print(f"Asignando: Dirección {resultado} Valor {valor}")
-                if valor is None:
-                    raise Exception(f"Error: Operando no inicializado en asignación '='.")
-                memoria.set_value(int(resultado), valor)
-            elif operador == 'PRINT':
-                valor = memoria.get_value(operando1)
-                if valor is None:
-                    raise Exception("Error: Operando no inicializado en PRINT.")
-                print(valor)
-            elif operador == 'END':
-                if verbose:
-                    print("Fin de la ejecución.")
-                break
-            else:
-                raise Exception(f"Operador desconocido: '{operador}'.")
-        except Exception as e:
-            print(f"Error en cuádruplo {contador}: {e}")
-            break
-
-        if verbose:
-            print_memory(memoria)
+def crear_perfil(args):
+    if not args.perfil and args.perfil_pilas is None:
+        return None
+    return perfiles.Perfil()
 
-        contador += 1
+def escribir_perfil(args, perfil, fuente=None):
+    # Se escribe aunque el programa falle: el perfil cubre hasta el error
+    if perfil is None or perfil.programa is None:
+        return
+    if args.perfil:
+        perfil.informe(fuente=fuente)
+    if args.perfil_pilas:
+        perfil.escribir_pilas(args.perfil_pilas)
 
 if __name__ == '__main__':
-    main()
+    # Ejecutar a través del módulo importado: bytecode y traductor importan 'virtual_machine'
+    # y sus ErrorEjecucion deben ser la misma clase que se atrapa en main()
+    import virtual_machine
+    virtual_machine.main()